@@ -23,7 +23,11 @@ from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 import mimetypes
+import threading
+from contextlib import nullcontext
 from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 try:
     from PIL import Image
@@ -33,11 +37,52 @@ except ImportError:
     print("警告: PIL/Pillow 未安裝，將無法獲取圖片詳細信息")
 
 
+def create_pooled_session(pool_connections: int = 4, pool_maxsize: int = 16, retries: int = 2) -> requests.Session:
+    """
+    建立帶連線池的 session，供多個執行緒共用
+    
+    Args:
+        pool_connections: 保留連線池的主機數 (API 與圖片下載的 CDN 各佔一個)
+        pool_maxsize: 每個主機最多同時使用的連線數；用完時等待歸還，不另開連線
+        retries: 連線失敗的重試次數；HTTP 502/503/504 只對 GET 重試 (建立任務等 POST 不重送)
+        
+    Returns:
+        requests.Session (keep-alive，重用 TLS 連線)
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({'GET'}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                          max_retries=retry, pool_block=True)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'User-Agent': 'RunningHub-Python-Client/1.0',
+        'Connection': 'keep-alive'
+    })
+    return session
+
+
 class RunningHubImageProcessor:
-    """RunningHub 圖像處理器"""
+    """
+    RunningHub 圖像處理器
+    
+    同一個實例可以由多個執行緒共用：HTTP 連線池由 session 管理，
+    每個任務的狀態 (task id、上傳檔名) 由方法參數與回傳值傳遞；
+    current_task_id / uploaded_filename 只記錄目前執行緒最近一次的值 (供命令列中斷時取消任務)。
+    """
     
     def __init__(self, api_key: str = None, workflow_id: str = None, 
-                 load_image_node_id: str = "65", base_url: str = "https://www.runninghub.cn"):
+                 load_image_node_id: str = "65", base_url: str = "https://www.runninghub.cn",
+                 session: requests.Session = None, pool_maxsize: int = 16, lazy_workflow: bool = False):
         """
         初始化處理器
         
@@ -46,34 +91,41 @@ class RunningHubImageProcessor:
             workflow_id: 工作流 ID
             load_image_node_id: Load Image 節點 ID
             base_url: API 基礎 URL
+            session: 共用的 session (預設以 create_pooled_session 建立)
+            pool_maxsize: 每個主機的連線數上限 (未指定 session 時使用)
+            lazy_workflow: 未指定 workflow_id 時延後到第一次建立任務才查詢 (建立物件不發出請求)
         """
         self.api_key = api_key or "dcbfc7a79ccb45b89cea62cdba512755"
-        # 如果沒有指定 workflow_id，就自動抓第一個可用的
-        if workflow_id:
-            self.workflow_id = workflow_id
-        else:
-            self.workflow_id = self.get_default_workflow_id()
-
-# 保留 node_id，可手動指定
-        self.load_image_node_id = load_image_node_id or "65"
-
         self.base_url = base_url
         
-        self.current_task_id = None
-        self.uploaded_filename = None
-        self.start_time = None
+        # 創建 session 以重用連接 (須在取得預設工作流之前建立)
+        self.session = session or create_pooled_session(pool_maxsize=pool_maxsize)
+        self._local = threading.local()
+        self._workflow_lock = threading.Lock()
         
-        # 創建 session 以重用連接
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'RunningHub-Python-Client/1.0'
-        })
+        # 如果沒有指定 workflow_id，就自動抓第一個可用的 (查詢失敗時於建立任務時重試)
+        self.workflow_id = workflow_id or None
+        if not self.workflow_id and not lazy_workflow:
+            self.workflow_id = self.get_default_workflow_id()
+
+        # 保留 node_id，可手動指定
+        self.load_image_node_id = load_image_node_id or "65"
         
         # 支援的圖片格式
         self.supported_formats = {
             '.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp'
         }
     
+    @property
+    def current_task_id(self) -> Optional[str]:
+        """目前執行緒最近一次建立的任務 ID"""
+        return getattr(self._local, 'task_id', None)
+        
+    @property
+    def uploaded_filename(self) -> Optional[str]:
+        """目前執行緒最近一次上傳的檔名"""
+        return getattr(self._local, 'uploaded_filename', None)
+    
     def get_default_workflow_id(self) -> str:
         """自動取得第一個可用的 Workflow ID"""
         try:
@@ -93,6 +145,15 @@ class RunningHubImageProcessor:
             print(f"ERROR: 獲取 Workflow ID 失敗: {e}")
         return None
         
+    def ensure_workflow_id(self) -> Optional[str]:
+        """尚未取得 Workflow ID 時查詢一次 (多個執行緒同時呼叫只查詢一次)"""
+        if self.workflow_id:
+            return self.workflow_id
+        with self._workflow_lock:
+            if not self.workflow_id:
+                self.workflow_id = self.get_default_workflow_id()
+        return self.workflow_id
+        
     def validate_file(self, file_path: str) -> Tuple[bool, str]:
         """
         驗證檔案
@@ -222,12 +283,13 @@ class RunningHubImageProcessor:
             print(f"   長寬比: {info['aspect_ratio']}")
             print(f"   顏色模式: {info['mode']}")
             
-    def upload_image(self, file_path: str) -> Optional[str]:
+    def upload_image(self, image, filename: str = None) -> Optional[str]:
         """
         上傳圖片到 RunningHub
         
         Args:
-            file_path: 圖片檔案路徑
+            image: 圖片檔案路徑，或記憶體中的圖片 (bytes / bytearray / memoryview / 檔案物件)
+            filename: 記憶體圖片的檔名 (用於判斷 MIME 類型)，預設為 image.png
             
         Returns:
             上傳成功返回檔案名，失敗返回 None
@@ -235,21 +297,31 @@ class RunningHubImageProcessor:
         print("📤 正在上傳圖片...")
         
         try:
-            # 確保檔案存在
-            if not os.path.exists(file_path):
-                print(f"❌ 檔案不存在: {file_path}")
-                return None
+            if isinstance(image, (str, os.PathLike)):
+                # 確保檔案存在
+                if not os.path.exists(image):
+                    print(f"❌ 檔案不存在: {image}")
+                    return None
+                file_size = os.path.getsize(image)
+                filename = Path(image).name
+            else:
+                # 記憶體中的圖片直接作為 multipart 內容，不寫入暫存檔
+                if hasattr(image, 'read'):
+                    position = image.tell()
+                    file_size = image.seek(0, os.SEEK_END) - position
+                    image.seek(position)
+                else:
+                    file_size = memoryview(image).nbytes
+                filename = Path(filename or "image.png").name
                 
             # 獲取檔案資訊
-            file_size = os.path.getsize(file_path)
-            mime_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
-            filename = Path(file_path).name
+            mime_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
             
             print(f"   檔案名稱: {filename}")
             print(f"   檔案大小: {self.format_file_size(file_size)}")
             print(f"   MIME 類型: {mime_type}")
             
-            with open(file_path, 'rb') as f:
+            with (open(image, 'rb') if isinstance(image, (str, os.PathLike)) else nullcontext(image)) as f:
                 files = {
                     'file': (filename, f, mime_type)
                 }
@@ -279,7 +351,7 @@ class RunningHubImageProcessor:
                 
             if result.get('code') == 0 and result.get('data', {}).get('fileName'):
                 filename = result['data']['fileName']
-                self.uploaded_filename = filename
+                self._local.uploaded_filename = filename
                 print(f"✅ 圖片上傳成功: {filename}")
                 return filename
             else:
@@ -306,19 +378,24 @@ class RunningHubImageProcessor:
             print(f"❌ 上傳錯誤: {e}")
             return None
             
-    def create_task(self, filename: str, prompt_text: str = "") -> Optional[str]:
+    def create_task(self, filename: str, prompt_text: str = "", webhook_url: str = None) -> Optional[str]:
         """
         創建處理任務
         
         Args:
             filename: 上傳的圖片檔名
             prompt_text: 提示詞
+            webhook_url: 任務結束時 RunningHub 回呼的網址 (選填；未指定則只能輪詢狀態)
             
         Returns:
             任務 ID 或 None
         """
         print("🚀 正在創建 AI 處理任務...")
         
+        if not self.ensure_workflow_id():
+            print("❌ 任務創建失敗: 沒有可用的 Workflow ID")
+            return None
+        
         # 構建節點資訊
         node_info_list = [
             {
@@ -343,6 +420,8 @@ class RunningHubImageProcessor:
             'workflowId': self.workflow_id,
             'nodeInfoList': node_info_list
         }
+        if webhook_url:
+            payload['webhookUrl'] = webhook_url
         
         try:
             response = self.session.post(
@@ -355,7 +434,7 @@ class RunningHubImageProcessor:
             
             if result.get('code') == 0 and result.get('data', {}).get('taskId'):
                 task_id = str(result['data']['taskId'])
-                self.current_task_id = task_id
+                self._local.task_id = task_id
                 print(f"✅ 任務創建成功")
                 print(f"   任務 ID: {task_id}")
                 if prompt_text.strip():
@@ -418,7 +497,7 @@ class RunningHubImageProcessor:
             是否成功完成
         """
         print("⏳ 等待 AI 處理完成...")
-        self.start_time = time.time()
+        start_time = time.time()
         
         status_map = {
             'QUEUED': {'text': '排隊中', 'icon': '⏳'},
@@ -429,18 +508,18 @@ class RunningHubImageProcessor:
         
         last_status = None
         
-        while time.time() - self.start_time < max_wait_time:
+        while time.time() - start_time < max_wait_time:
             status = self.check_task_status(task_id)
             
             if status != last_status:
                 if status in status_map:
                     status_info = status_map[status]
-                    elapsed = int(time.time() - self.start_time)
+                    elapsed = int(time.time() - start_time)
                     print(f"{status_info['icon']} 狀態: {status_info['text']} (已等待 {elapsed}s)")
                 last_status = status
                 
             if status == 'SUCCESS':
-                elapsed = int(time.time() - self.start_time)
+                elapsed = int(time.time() - start_time)
                 print(f"🎉 任務完成！總處理時間: {elapsed}s")
                 return True
             elif status == 'FAILED':
@@ -499,7 +578,7 @@ class RunningHubImageProcessor:
             
     def download_image(self, url: str, save_path: str, max_retries: int = 3) -> bool:
         """
-        下載圖片（帶重試機制）
+        下載圖片並保存到檔案（帶重試機制）
         
         Args:
             url: 圖片 URL
@@ -509,6 +588,27 @@ class RunningHubImageProcessor:
         Returns:
             是否下載成功
         """
+        data = self.download_image_bytes(url, max_retries=max_retries)
+        if data is None:
+            return False
+            
+        # 創建目錄
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        with open(save_path, 'wb') as f:
+            f.write(data)
+        return True
+        
+    def download_image_bytes(self, url: str, max_retries: int = 3) -> Optional[bytes]:
+        """
+        下載圖片到記憶體（帶重試機制）
+        
+        Args:
+            url: 圖片 URL
+            max_retries: 最大重試次數
+            
+        Returns:
+            圖片內容，失敗返回 None
+        """
         # 下載前延遲1秒
         time.sleep(1)
         
@@ -544,24 +644,17 @@ class RunningHubImageProcessor:
                 if not content_type.startswith('image/'):
                     print(f"   ⚠️  警告: 響應不是圖片格式 ({content_type})")
                 
-                # 創建目錄
-                os.makedirs(os.path.dirname(save_path), exist_ok=True)
-                
-                # 下載文件
-                with open(save_path, 'wb') as f:
-                    downloaded = 0
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:  # 過濾空chunk
-                            f.write(chunk)
-                            downloaded += len(chunk)
+                # 下載到記憶體
+                buffer = bytearray()
+                for chunk in response.iter_content(chunk_size=65536):
+                    if chunk:  # 過濾空chunk
+                        buffer.extend(chunk)
                 
-                # 驗證下載的文件
-                if os.path.exists(save_path) and os.path.getsize(save_path) > 0:
-                    return True
+                # 驗證下載的內容
+                if buffer:
+                    return bytes(buffer)
                 else:
-                    print(f"   ⚠️  下載的文件為空或不存在")
-                    if os.path.exists(save_path):
-                        os.remove(save_path)
+                    print(f"   ⚠️  下載的文件為空")
                     continue
                     
             except requests.exceptions.Timeout as e:
@@ -575,24 +668,18 @@ class RunningHubImageProcessor:
                     print(f"   📡 HTTP錯誤 (嘗試 {attempt + 1}/{max_retries}): {e}")
             except Exception as e:
                 print(f"   💥 未知錯誤 (嘗試 {attempt + 1}/{max_retries}): {e}")
-            
-            # 如果不是最後一次嘗試，清理可能的部分下載文件
-            if attempt < max_retries - 1 and os.path.exists(save_path):
-                try:
-                    os.remove(save_path)
-                except:
-                    pass
         
         print(f"❌ 下載失敗: 已重試 {max_retries} 次")
-        return False
+        return None
             
-    def save_results(self, results: List[Dict], output_dir: str = "outputs") -> List[str]:
+    def save_results(self, results: List[Dict], output_dir: str = "outputs", task_id: str = None) -> List[str]:
         """
         保存處理結果
         
         Args:
             results: 結果列表
             output_dir: 輸出目錄
+            task_id: 任務 ID (記錄在 task_info.json，默認為目前執行緒最近一次的任務)
             
         Returns:
             保存的檔案路徑列表
@@ -654,7 +741,7 @@ class RunningHubImageProcessor:
                 
         # 保存任務資訊
         task_info = {
-            'task_id': self.current_task_id,
+            'task_id': task_id or self.current_task_id,
             'workflow_id': self.workflow_id,
             'uploaded_filename': self.uploaded_filename,
             'timestamp': timestamp,
@@ -672,6 +759,66 @@ class RunningHubImageProcessor:
         
         return saved_files
         
+    def fetch_results(self, results: List[Dict]) -> List[Tuple[str, bytes]]:
+        """
+        下載處理結果到記憶體（不寫入磁碟）
+        
+        Args:
+            results: 結果列表
+            
+        Returns:
+            (檔名, 圖片內容) 列表，檔名規則與 save_results 相同
+        """
+        images = []
+        for i, result in enumerate(results or []):
+            url = result.get('fileUrl')
+            if not url:
+                continue
+                
+            original_filename = Path(urlparse(url).path).name or f"result_{i+1}.png"
+            name = {0: "KontextP.png", 1: "KontextM.png"}.get(i, original_filename)
+            
+            print(f"📥 下載第 {i+1} 張圖片: {original_filename}")
+            data = self.download_image_bytes(url, max_retries=3)
+            if data is None:
+                print(f"❌ 下載失敗: {original_filename}")
+                continue
+            print(f"✅ 下載成功: {name} ({self.format_file_size(len(data))})")
+            images.append((name, data))
+            
+        return images
+        
+    def process_image_bytes(self, image, filename: str = "image.png", prompt_text: str = "",
+                            max_wait_time: int = 300) -> List[Tuple[str, bytes]]:
+        """
+        記憶體內的完整處理流程：上傳 → 創建任務 → 等待完成 → 下載結果
+        
+        Args:
+            image: 圖片內容 (bytes / bytearray / memoryview / 檔案物件)
+            filename: 上傳時使用的檔名
+            prompt_text: 提示詞
+            max_wait_time: 最大等待時間
+            
+        Returns:
+            (檔名, 圖片內容) 列表，失敗返回空列表
+        """
+        uploaded = self.upload_image(image, filename=filename)
+        if not uploaded:
+            return []
+            
+        task_id = self.create_task(uploaded, prompt_text)
+        if not task_id:
+            return []
+            
+        if not self.wait_for_completion(task_id, max_wait_time):
+            return []
+            
+        results = self.get_task_results(task_id)
+        if not results:
+            return []
+            
+        return self.fetch_results(results)
+        
     def process_image(self, image_path: str, prompt_text: str = "", 
                      output_dir: str = "outputs", max_wait_time: int = 300) -> bool:
         """
@@ -718,7 +865,7 @@ class RunningHubImageProcessor:
             return False
             
         # 保存結果
-        saved_files = self.save_results(results, output_dir)
+        saved_files = self.save_results(results, output_dir, task_id=task_id)
         
         print("\n" + "=" * 50)
         print(f"🎉 處理完成！成功生成 {len(saved_files)} 張圖片")
@@ -1,109 +1,427 @@
+import time
+_import_started = time.perf_counter()
+from backend.utils.startup import StartupTimeline, LazyModule, Warmup
+startup_timeline = StartupTimeline(_import_started)
 from RH05 import RunningHubImageProcessor
-from flask import Flask, request, jsonify, g
+from flask import Flask, Request, request, jsonify, g, send_file
 from flask_cors import CORS
 import os, uuid, datetime, sys
+import threading
 from werkzeug.utils import secure_filename
-from google.cloud import storage, firestore
 import json
-from rembg import remove, new_session
+import base64
+import hashlib
+import hmac
 from io import BytesIO
+from urllib.parse import urlencode
 import traceback # 導入 traceback 模組
-from pathlib import Path
-import shutil # 導入 shutil 用於刪除目錄
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from backend.utils.buffers import make_upload_stream
+from backend.utils.derivatives import DEFAULT_SIZES, FULL_SIZE, derivative_blob_name, make_derivatives, source_blob_name
+from backend.utils.dedupe import RembgDedupeCache, make_dedupe_key
+from backend.utils import segmentation
+from backend.utils.jobs import Deferred, JobManager, JobQueueFull, StageTimer
+from backend.utils.rh_poller import FAILED, SUCCESS, TIMEOUT, PollPolicy, TaskPoller
+from backend.utils.rembg_pool import get_rembg_pool
+from backend.utils.sessions import SessionRegistry
+from backend.utils.storage import GCSObjectStore, LocalObjectStore, ObjectNotFound, SignedUrlCache
+from backend.utils.versions import CollectionVersions
+from backend.model.store import DEFAULT_SQLITE_PATH, StoreDedupeIndex, StoreVersions, create_item_store
+from backend.utils.item_cache import UserItemCache
+
+# 重量級模組延遲到第一次使用時才匯入 (rembg / onnxruntime 則由 segmentation 與 sessions 延遲匯入)，
+# 冷啟動時由背景預熱執行緒並行載入，見檔案末端的 startup_warmup
+storage = LazyModule("google.cloud.storage", startup_timeline)
+firestore = LazyModule("google.cloud.firestore", startup_timeline)
+
+# 冷啟動時間拆解：模組匯入 → 模型載入 → 第一次推論
+IMPORT_MS = round((time.perf_counter() - _import_started) * 1000, 1)
+startup_timeline.record("import:app", _import_started, time.perf_counter())
 
 # 導入 RunningHubImageProcessor (現在從新的檔案名稱 runninghub_processor.py 導入)
 
 
-app = Flask(__name__, static_folder="static", static_url_path="/static")
-CORS(app, supports_credentials=True)
+# 上傳的圖片預設整個留在記憶體中處理，不寫入 /tmp (Cloud Run 的 /tmp 同樣佔用記憶體)；
+# 設定此門檻 (bytes) 後，超過門檻的上傳檔案才溢寫到磁碟
+IMAGE_SPOOL_THRESHOLD_BYTES = int(os.environ.get("IMAGE_SPOOL_THRESHOLD_BYTES", 0))
 
-UPLOAD_FOLDER = os.path.join("/tmp", "uploads")
+class BufferedRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return make_upload_stream(IMAGE_SPOOL_THRESHOLD_BYTES)
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+app = Flask(__name__, static_folder="static", static_url_path="/static")
+app.request_class = BufferedRequest
+CORS(app, supports_credentials=True)
 
 GCS_BUCKET = "cloths"
+# 圖片物件的存放層：gcs (預設) 或 local (本機磁碟，單機部署 / 離線 benchmark)，見 backend/utils/storage.py
+# local 模式下簽名 URL 指向本服務的 /objects/<blob> 路由；LOCAL_STORAGE_BASE_URL 為對外網址 (例如 https://api.example.com)
+OBJECT_STORE_BACKEND = os.environ.get("OBJECT_STORE_BACKEND", "gcs").lower()
+LOCAL_STORAGE_DIR = os.environ.get("LOCAL_STORAGE_DIR", "/tmp/objects")
+LOCAL_STORAGE_SECRET = os.environ.get("LOCAL_STORAGE_SECRET")
+LOCAL_STORAGE_BASE_URL = os.environ.get("LOCAL_STORAGE_BASE_URL", f"http://localhost:{os.environ.get('PORT', 8080)}")
+
+# 批次上傳設定：單次請求最多幾張圖片、GCS 並行上傳的執行緒數
+UPLOAD_BATCH_MAX_FILES = int(os.environ.get("UPLOAD_BATCH_MAX_FILES", 50))
+UPLOAD_BATCH_GCS_WORKERS = int(os.environ.get("UPLOAD_BATCH_GCS_WORKERS", 8))
+
+# 去背前處理：推論用的工作解析度 (長邊，0 表示整張原圖交給 rembg) 與輸出 PNG 的長邊上限
+REMBG_WORKING_RESOLUTION = int(os.environ.get("REMBG_WORKING_RESOLUTION", segmentation.DEFAULT_WORKING_SIZE))
+REMBG_MAX_OUTPUT_RESOLUTION = int(os.environ.get("REMBG_MAX_OUTPUT_RESOLUTION", segmentation.DEFAULT_MAX_OUTPUT_SIZE))
+# 去背行程池：worker 行程數 (0 表示停用，直接在請求執行緒中去背) 與每個 worker 的 ONNX Runtime 執行緒數 (0 表示自動分配)
+REMBG_PROCESS_POOL_SIZE = int(os.environ.get("REMBG_PROCESS_POOL_SIZE", 0))
+REMBG_POOL_THREADS_PER_WORKER = int(os.environ.get("REMBG_POOL_THREADS_PER_WORKER", 0))
+
+# 非同步上傳 (/upload?async=1)：背景執行緒數與等待中工作的上限
+UPLOAD_JOB_WORKERS = int(os.environ.get("UPLOAD_JOB_WORKERS", 2))
+UPLOAD_JOB_QUEUE_SIZE = int(os.environ.get("UPLOAD_JOB_QUEUE_SIZE", 32))
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", 3600))
+# 姿勢矯正 (/pose_correction)：背景執行緒數 (上傳 / 建立任務 / 下載結果；等待任務完成時不佔用執行緒)、
+# 等待中工作的上限與單一任務的等待上限 (秒)
+POSE_JOB_WORKERS = int(os.environ.get("POSE_JOB_WORKERS", 4))
+POSE_JOB_QUEUE_SIZE = int(os.environ.get("POSE_JOB_QUEUE_SIZE", 32))
+POSE_MAX_WAIT_SECONDS = int(os.environ.get("POSE_MAX_WAIT_SECONDS", 300))
+# RunningHub 任務狀態由單一輪詢器查詢：查詢間隔 (秒) 依狀態與歷史耗時在 MIN 與 MAX 之間調整 (見 backend/utils/rh_poller.py)，
+# 全域每秒查詢上限 (0 表示不限) 與送出查詢的執行緒數
+RUNNINGHUB_POLL_INTERVAL_SECONDS = float(os.environ.get("RUNNINGHUB_POLL_INTERVAL_SECONDS", 2))
+RUNNINGHUB_POLL_MIN_INTERVAL_SECONDS = float(os.environ.get("RUNNINGHUB_POLL_MIN_INTERVAL_SECONDS", 1))
+RUNNINGHUB_POLL_MAX_INTERVAL_SECONDS = float(os.environ.get("RUNNINGHUB_POLL_MAX_INTERVAL_SECONDS", 15))
+RUNNINGHUB_MAX_POLLS_PER_SECOND = float(os.environ.get("RUNNINGHUB_MAX_POLLS_PER_SECOND", 5))
+RUNNINGHUB_POLL_WORKERS = int(os.environ.get("RUNNINGHUB_POLL_WORKERS", 2))
+# RunningHub API 位址 (離線測試時指向 scripts/fake_runninghub.py)
+RUNNINGHUB_BASE_URL = os.environ.get("RUNNINGHUB_BASE_URL", "https://www.runninghub.cn")
+# 共用 RunningHub 用戶端每個主機的連線數上限 (上傳 / 建立任務的工作執行緒 + 輪詢執行緒 + 下載結果)
+RUNNINGHUB_POOL_MAXSIZE = int(os.environ.get("RUNNINGHUB_POOL_MAXSIZE", 16))
+# 回呼模式：設定本服務對外網址後，建立任務時登記 {RUNNINGHUB_WEBHOOK_BASE_URL}/runninghub/webhook，
+# 完成通知到達時立即喚醒等待中的工作，輪詢只以 RUNNINGHUB_WEBHOOK_FALLBACK_POLL_SECONDS 的間隔作為備援。
+# RUNNINGHUB_WEBHOOK_SECRET 附在回呼網址上驗證來源；回呼可能送到任何一個 worker / 實例，
+# 因此啟用回呼模式時必須設定 (所有實例相同的值)，不在各行程自行產生
+RUNNINGHUB_WEBHOOK_BASE_URL = os.environ.get("RUNNINGHUB_WEBHOOK_BASE_URL", "").rstrip("/")
+RUNNINGHUB_WEBHOOK_SECRET = os.environ.get("RUNNINGHUB_WEBHOOK_SECRET", "")
+if RUNNINGHUB_WEBHOOK_BASE_URL and not RUNNINGHUB_WEBHOOK_SECRET:
+    raise RuntimeError("RUNNINGHUB_WEBHOOK_BASE_URL is set but RUNNINGHUB_WEBHOOK_SECRET is missing")
+RUNNINGHUB_WEBHOOK_FALLBACK_POLL_SECONDS = float(os.environ.get("RUNNINGHUB_WEBHOOK_FALLBACK_POLL_SECONDS", 30))
+# 模組載入時即在背景並行預熱 GCS / Firestore / 去背模型 (設為 0 則停用，例如執行一次性腳本時)
+STARTUP_WARMUP = int(os.environ.get("STARTUP_WARMUP", 1))
+# 衍生圖 (WebP，保留 alpha) 的長邊尺寸，設為 0 則不產生該尺寸；列表 API 以 ?size=thumb|medium|full 選擇
+DERIVATIVE_SIZES = {
+    name: size for name, size in (
+        ("thumb", int(os.environ.get("DERIVATIVE_THUMB_SIZE", 320))),
+        ("medium", int(os.environ.get("DERIVATIVE_MEDIUM_SIZE", 1024))),
+    ) if size > 0
+}
+DERIVATIVE_WEBP_QUALITY = int(os.environ.get("DERIVATIVE_WEBP_QUALITY", 80))
+# 衣物 metadata 的存放層：firestore (預設) 或 sqlite (單機部署 / 離線 benchmark)，見 backend/model/store.py
+# SQLITE_DB_PATH 預設為系統暫存資料夾中的 wardrobe-metadata.sqlite (不在原始碼目錄中)
+METADATA_BACKEND = os.environ.get("METADATA_BACKEND", "firestore").lower()
+SQLITE_DB_PATH = os.environ.get("SQLITE_DB_PATH", DEFAULT_SQLITE_PATH)
+# 列表分頁：單頁上限 (未帶 limit 參數時維持一次回傳全部的舊行為)
+LIST_PAGE_MAX_LIMIT = int(os.environ.get("LIST_PAGE_MAX_LIMIT", 100))
+# 增量同步：刪除紀錄 (tombstone) 保留天數，sync token 早於此期限時要求用戶端完整重新同步；
+# 另以重疊視窗 (秒) 涵蓋同步當下尚未 commit 的寫入，用戶端以 id 套用變更，重複收到無妨
+# (Firestore 可對 tombstones 的 expire_at 欄位設定 TTL 政策自動清除)
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get("TOMBSTONE_RETENTION_DAYS", 30))
+SYNC_OVERLAP_SECONDS = int(os.environ.get("SYNC_OVERLAP_SECONDS", 60))
+# 增量同步回傳的簽名 URL 會存在用戶端快取中，要求至少還有這麼多秒的效期；
+# 用戶端以 refresh=<id,...> 換新快到期的 URL，單次最多幾筆
+SYNC_URL_MIN_VALID_SECONDS = int(os.environ.get("SYNC_URL_MIN_VALID_SECONDS", 1800))
+SYNC_REFRESH_MAX_IDS = int(os.environ.get("SYNC_REFRESH_MAX_IDS", 100))
+# 列表 ETag：版本號在行程內快取的秒數 (其他實例的寫入最多延遲這麼久才反映)，
+# 以及 ETag 的時間窗長度；列表中的簽名 URL 保證在整個時間窗內有效，304 時用戶端沿用的 URL 不會過期
+LIST_VERSION_CACHE_TTL_SECONDS = float(os.environ.get("LIST_VERSION_CACHE_TTL_SECONDS", 5))
+LIST_ETAG_WINDOW_SECONDS = int(os.environ.get("LIST_ETAG_WINDOW_SECONDS", 900))
+# 使用者衣物 metadata 的行程內快取：TTL、所有使用者合計的項目上限 (記憶體上限)、
+# 單一使用者的項目上限 (超過時不快取，改為直接向存放層分頁查詢)
+ITEM_CACHE_TTL_SECONDS = float(os.environ.get("ITEM_CACHE_TTL_SECONDS", 300))
+ITEM_CACHE_MAX_ITEMS = int(os.environ.get("ITEM_CACHE_MAX_ITEMS", 50000))
+ITEM_CACHE_MAX_ITEMS_PER_USER = int(os.environ.get("ITEM_CACHE_MAX_ITEMS_PER_USER", 1000))
+# 多選刪除時平行執行 GCS batch 刪除、Firestore 查詢與批次寫入的執行緒數
+DELETE_MAX_WORKERS = int(os.environ.get("DELETE_MAX_WORKERS", 8))
+# 去背結果去重快取：行程內 LRU 的項目上限 (設為 0 則只用 Firestore 持久層)
+REMBG_DEDUPE_LRU_SIZE = int(os.environ.get("REMBG_DEDUPE_LRU_SIZE", 1024))
+# 簽名 URL 快取：項目上限，以及到期前多少秒就改為重新簽名 (確保回傳給瀏覽器的 URL 還有足夠效期)
+SIGNED_URL_CACHE_SIZE = int(os.environ.get("SIGNED_URL_CACHE_SIZE", 4096))
+SIGNED_URL_SAFETY_MARGIN_SECONDS = int(os.environ.get("SIGNED_URL_SAFETY_MARGIN_SECONDS", 300))
+# 圖片 blob 名稱皆唯一且內容不會變動，讓瀏覽器在簽名 URL 不變時直接使用快取
+IMAGE_CACHE_CONTROL = os.environ.get("IMAGE_CACHE_CONTROL", "private, max-age=3600")
 
 # 從環境變數獲取 RunningHub API Key，避免寫死在程式碼中
 # 注意：如果 runninghub_processor.py 內部也硬編碼了 Key，則以 runninghub_processor.py 內部為準
 
 
+# 啟動預熱與請求執行緒可能同時第一次呼叫，避免重複建立用戶端
+_gcs_client_lock = threading.Lock()
+_firestore_db_lock = threading.Lock()
+
 _gcs_client_instance = None
 
 def get_gcs_client():
     global _gcs_client_instance
-    if _gcs_client_instance is None:
-        gcs_credentials_json = os.environ.get("GCP_SECRET_KEY")
-
-        if gcs_credentials_json:
-            try:
-                credentials_info = json.loads(gcs_credentials_json)
-                _gcs_client_instance = storage.Client.from_service_account_info(credentials_info)
-                print("DEBUG: GCS Client initialized from GCP_SECRET_KEY (with private key).")
-            except json.JSONDecodeError as e:
-                print(f"ERROR: Failed to parse GCP_SECRET_KEY JSON: {e}", file=sys.stderr)
-                traceback.print_exc(file=sys.stderr)
-                _gcs_client_instance = storage.Client()
-                print("DEBUG: GCS Client initialized with default credentials due to JSON parse error.")
-            except Exception as e:
-                print(f"ERROR: Failed to initialize GCS Client from GCP_SECRET_KEY: {e}", file=sys.stderr)
-                traceback.print_exc(file=sys.stderr)
+    if _gcs_client_instance is not None:
+        return _gcs_client_instance
+    with _gcs_client_lock:
+        if _gcs_client_instance is None:
+            gcs_credentials_json = os.environ.get("GCP_SECRET_KEY")
+
+            if gcs_credentials_json:
+                try:
+                    credentials_info = json.loads(gcs_credentials_json)
+                    _gcs_client_instance = storage.Client.from_service_account_info(credentials_info)
+                    print("DEBUG: GCS Client initialized from GCP_SECRET_KEY (with private key).")
+                except json.JSONDecodeError as e:
+                    print(f"ERROR: Failed to parse GCP_SECRET_KEY JSON: {e}", file=sys.stderr)
+                    traceback.print_exc(file=sys.stderr)
+                    _gcs_client_instance = storage.Client()
+                    print("DEBUG: GCS Client initialized with default credentials due to JSON parse error.")
+                except Exception as e:
+                    print(f"ERROR: Failed to initialize GCS Client from GCP_SECRET_KEY: {e}", file=sys.stderr)
+                    traceback.print_exc(file=sys.stderr)
+                    _gcs_client_instance = storage.Client()
+                    print("DEBUG: GCS Client initialized with default credentials due to other initialization error.")
+            else:
                 _gcs_client_instance = storage.Client()
-                print("DEBUG: GCS Client initialized with default credentials due to other initialization error.")
-        else:
-            _gcs_client_instance = storage.Client()
-            print("DEBUG: GCS Client initialized with default credentials (no GCP_SECRET_KEY).")
+                print("DEBUG: GCS Client initialized with default credentials (no GCP_SECRET_KEY).")
     return _gcs_client_instance
 
+_object_store_lock = threading.Lock()
+_object_store_instance = None
+
+def get_object_store():
+    """圖片物件存放層 (OBJECT_STORE_BACKEND)，上傳、複製、刪除與簽名 URL 都經由這裡"""
+    global _object_store_instance
+    if _object_store_instance is not None:
+        return _object_store_instance
+    with _object_store_lock:
+        if _object_store_instance is None:
+            if OBJECT_STORE_BACKEND == "local":
+                _object_store_instance = LocalObjectStore(
+                    LOCAL_STORAGE_DIR, secret=LOCAL_STORAGE_SECRET, base_url=LOCAL_STORAGE_BASE_URL
+                )
+            elif OBJECT_STORE_BACKEND == "gcs":
+                _object_store_instance = GCSObjectStore(get_gcs_client, GCS_BUCKET)
+            else:
+                raise ValueError(f"未知的 OBJECT_STORE_BACKEND: {OBJECT_STORE_BACKEND}")
+            print(f"DEBUG: Object store initialized ({OBJECT_STORE_BACKEND}).")
+    return _object_store_instance
+
 _firestore_db_instance = None
 
 def get_firestore_db():
     global _firestore_db_instance
-    if _firestore_db_instance is None:
-        _firestore_db_instance = firestore.Client()
-        print("DEBUG: Firestore Client initialized.")
+    if _firestore_db_instance is not None:
+        return _firestore_db_instance
+    with _firestore_db_lock:
+        if _firestore_db_instance is None:
+            _firestore_db_instance = firestore.Client()
+            print("DEBUG: Firestore Client initialized.")
     return _firestore_db_instance
 
-_rembg_session = None
-def get_rembg_session():
-    global _rembg_session
-    if _rembg_session is None:
-        try:
-            print("DEBUG: Setting XDG_CACHE_HOME to /tmp for rembg model cache.")
-            os.environ['XDG_CACHE_HOME'] = '/tmp'
-            print("DEBUG: Attempting to initialize rembg session with 'u2net' model...")
-            _rembg_session = new_session("u2net")
-            print("DEBUG: Rembg session initialized and model loaded successfully.")
-        except Exception as e:
-            print(f"CRITICAL ERROR: Rembg model initialization failed: {e}", file=sys.stderr)
-            traceback.print_exc(file=sys.stderr)
-            raise
-    return _rembg_session
-
-def upload_image_to_gcs(local_path, bucket_name, data_bytes=None):
-    client = get_gcs_client()
-    bucket = client.bucket(bucket_name)
-    blob_name = f"{uuid.uuid4().hex}_{os.path.splitext(os.path.basename(local_path))[0]}.png"
-    blob = bucket.blob(blob_name)
-
-    if data_bytes:
-        blob.upload_from_string(data_bytes, content_type='image/png')
-        print(f"DEBUG: Data bytes uploaded to GCS as {blob_name}.")
-    else:
-        blob.upload_from_filename(local_path)
-        print(f"DEBUG: File {local_path} uploaded to GCS as {blob_name}.")
+_item_store_lock = threading.Lock()
+_item_store_instance = None
+
+def get_item_store():
+    """衣物 metadata 存放層 (METADATA_BACKEND)，所有項目、tombstone 與版本號的讀寫都經由這裡"""
+    global _item_store_instance
+    if _item_store_instance is not None:
+        return _item_store_instance
+    with _item_store_lock:
+        if _item_store_instance is None:
+            _item_store_instance = create_item_store(
+                METADATA_BACKEND,
+                get_firestore_db=get_firestore_db,
+                sqlite_path=SQLITE_DB_PATH,
+                max_workers=DELETE_MAX_WORKERS,
+            )
+            print(f"DEBUG: Item store initialized ({METADATA_BACKEND}).")
+    return _item_store_instance
+
+# 模型與 ONNX Runtime 選項由 REMBG_MODEL / REMBG_SESSION_CONFIG 等環境變數設定，見 backend/utils/sessions.py
+rembg_sessions = SessionRegistry.from_env()
+
+def get_rembg_session(config=None):
+    """取得指定設定 (預設為 REMBG_MODEL) 的 rembg session，同一設定只會載入一次"""
+    if os.environ.get('XDG_CACHE_HOME') != '/tmp':
+        print("DEBUG: Setting XDG_CACHE_HOME to /tmp for rembg model cache.")
+        os.environ['XDG_CACHE_HOME'] = '/tmp'
+    return rembg_sessions.get(config)
+
+def get_rembg_process_pool():
+    return get_rembg_pool(
+        REMBG_PROCESS_POOL_SIZE,
+        rembg_sessions.default,
+        threads_per_worker=REMBG_POOL_THREADS_PER_WORKER,
+        working_size=REMBG_WORKING_RESOLUTION,
+        max_output_size=REMBG_MAX_OUTPUT_RESOLUTION,
+    )
+
+def submit_background_removal(input_image_bytes, config=None):
+    """
+    送出去背工作，回傳結果為 PNG bytes 的 Future
+    啟用行程池時交給 worker 行程並行處理，否則在目前執行緒中同步完成
+    """
+    config = config or rembg_sessions.default
+    if REMBG_PROCESS_POOL_SIZE > 0:
+        return get_rembg_process_pool().submit(input_image_bytes, config)
+    future = Future()
+    try:
+        future.set_result(segmentation.remove_background(
+            input_image_bytes,
+            get_rembg_session(config),
+            working_size=REMBG_WORKING_RESOLUTION,
+            max_output_size=REMBG_MAX_OUTPUT_RESOLUTION,
+        ))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def remove_background(input_image_bytes, config=None):
+    """依設定的模型與工作解析度去背，回傳 PNG bytes"""
+    return submit_background_removal(input_image_bytes, config).result()
+
+def rembg_pipeline_id(config=None):
+    """去重快取鍵中的模型識別；輸出會隨前處理設定而不同，因此一併納入"""
+    config = config or rembg_sessions.default
+    return f"{config.pipeline_id}@{REMBG_WORKING_RESOLUTION}-{REMBG_MAX_OUTPUT_RESOLUTION}"
+
+def upload_image(source_name, data):
+    """
+    上傳圖片到物件存放層，回傳 blob 名稱
+    source_name 只用來命名 blob；data 為 bytes / bytearray / memoryview / 檔案物件，直接從記憶體上傳
+    """
+    blob_name = f"{uuid.uuid4().hex}_{os.path.splitext(os.path.basename(source_name))[0]}.png"
+    upload_object(blob_name, data)
+    print(f"DEBUG: Data bytes uploaded to object store as {blob_name}.")
     return blob_name
 
-def get_signed_url(bucket_name, blob_name, expire_minutes=60):
-    client = get_gcs_client()
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(blob_name)
-    url = blob.generate_signed_url(
-        version='v4',
-        expiration=datetime.timedelta(minutes=expire_minutes),
-        method='GET'
+def upload_object(blob_name, data, content_type='image/png'):
+    """以指定名稱上傳記憶體中的內容 (bytes / bytearray / memoryview / 檔案物件)"""
+    get_object_store().put(blob_name, data, content_type=content_type, cache_control=IMAGE_CACHE_CONTROL)
+    return blob_name
+
+_signed_url_cache = SignedUrlCache(
+    max_entries=SIGNED_URL_CACHE_SIZE,
+    safety_margin_seconds=SIGNED_URL_SAFETY_MARGIN_SECONDS,
+)
+
+def get_signed_url(blob_name, expire_minutes=60):
+    """回傳 blob 的簽名 URL；同一 blob 在到期前的安全邊際內重用先前簽好的 URL"""
+    return get_signed_url_with_expiry(blob_name, expire_minutes)[0]
+
+def get_signed_url_with_expiry(blob_name, expire_minutes=60, min_valid_seconds=None):
+    """同 get_signed_url，另外回傳 URL 的到期時間 (epoch 秒)"""
+    store = get_object_store()
+
+    def sign():
+        url = store.sign_url(blob_name, expire_minutes * 60)
+        print(f"DEBUG: Generated signed URL for {blob_name}.")
+        return url
+
+    return _signed_url_cache.get_or_sign(
+        store.name, blob_name, expire_minutes * 60, sign, min_valid_seconds=min_valid_seconds
     )
-    print(f"DEBUG: Generated signed URL for {blob_name}.")
-    return url
+
+def invalidate_signed_url(blob_name):
+    _signed_url_cache.invalidate(get_object_store().name, blob_name)
+
+def copy_object(source_blob_name, source_name, blob_name=None):
+    """在存放層內直接複製既有 blob (不經過本機記憶體)，回傳新 blob 名稱；來源不存在時丟出 ObjectNotFound"""
+    blob_name = blob_name or f"{uuid.uuid4().hex}_{os.path.splitext(os.path.basename(source_name))[0]}.png"
+    get_object_store().copy(source_blob_name, blob_name)
+    print(f"DEBUG: Blob {source_blob_name} copied to {blob_name}.")
+    return blob_name
+
+_rembg_dedupe_cache = RembgDedupeCache(
+    max_entries=REMBG_DEDUPE_LRU_SIZE,
+    persistent=StoreDedupeIndex(get_item_store),
+)
+
+def lookup_rembg_output(input_image_bytes, config=None):
+    """回傳 (快取鍵, 既有去背 blob 名稱或 None)"""
+    key = make_dedupe_key(input_image_bytes, rembg_pipeline_id(config))
+    return key, _rembg_dedupe_cache.lookup(key)
+
+def store_derivatives(blob_name, png_bytes):
+    """
+    產生並上傳衍生圖，回傳 {尺寸名稱: blob 名稱}
+    衍生圖只是列表的最佳化，失敗時不影響上傳本身 (列表會退回原圖)
+    """
+    if not DERIVATIVE_SIZES:
+        return {}
+    try:
+        stored = {}
+        for size_name, data in make_derivatives(png_bytes, DERIVATIVE_SIZES, DERIVATIVE_WEBP_QUALITY).items():
+            stored[size_name] = upload_object(
+                derivative_blob_name(blob_name, size_name), data, content_type='image/webp'
+            )
+        print(f"DEBUG: Derivatives {sorted(stored)} uploaded for {blob_name}.")
+        return stored
+    except Exception as e:
+        print(f"WARN: Failed to create derivatives for {blob_name}: {e}", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        return {}
+
+def reuse_derivatives(cached_blob_name, blob_name):
+    """複製快取來源的衍生圖；來源沒有衍生圖 (功能上線前的舊資料) 時由原圖重新產生"""
+    if not DERIVATIVE_SIZES:
+        return {}
+    try:
+        return {
+            size_name: copy_object(
+                derivative_blob_name(cached_blob_name, size_name), blob_name,
+                blob_name=derivative_blob_name(blob_name, size_name),
+            )
+            for size_name in DERIVATIVE_SIZES
+        }
+    except ObjectNotFound:
+        png_bytes = get_object_store().get(blob_name)
+        return store_derivatives(blob_name, png_bytes)
+
+def reuse_rembg_output(key, cached_blob_name, source_name):
+    """
+    重用已存在的去背 PNG 與其衍生圖
+    Returns:
+        (新 blob 名稱, 衍生圖)；來源 blob 已被刪除時讓快取失效並回傳 None
+    """
+    try:
+        blob_name = copy_object(cached_blob_name, source_name)
+        print(f"DEBUG: Dedupe cache hit, reused rembg output {cached_blob_name}.")
+    except ObjectNotFound:
+        print(f"WARN: Dedupe cache entry {key} points to missing blob {cached_blob_name}, invalidating.")
+        _rembg_dedupe_cache.invalidate(key)
+        return None
+    return blob_name, reuse_derivatives(cached_blob_name, blob_name)
+
+def store_rembg_output(key, source_name, output_image_bytes):
+    """上傳去背 PNG 與衍生圖並寫入去重快取，回傳 (blob 名稱, 衍生圖)"""
+    blob_name = upload_image(source_name, output_image_bytes)
+    stored_derivatives = store_derivatives(blob_name, output_image_bytes)
+    _rembg_dedupe_cache.store(key, blob_name)
+    return blob_name, stored_derivatives
+
+def remove_background_to_storage(input_image_bytes, source_name, config=None, timer=None):
+    """
+    去背並上傳到物件存放層 (含衍生圖)；相同輸入 (同一模型) 直接重用既有結果，跳過推論
+    Returns:
+        (新的 blob 名稱, {尺寸名稱: 衍生圖 blob 名稱})
+    """
+    timer = timer or StageTimer()
+    with timer.stage("dedupe_lookup"):
+        key, cached_blob_name = lookup_rembg_output(input_image_bytes, config)
+    if cached_blob_name:
+        with timer.stage("gcs_copy"):
+            reused = reuse_rembg_output(key, cached_blob_name, source_name)
+        if reused:
+            return reused
+
+    print("DEBUG: Starting background removal...")
+    with timer.stage("rembg"):
+        output_image_bytes = remove_background(input_image_bytes, config)
+    print("DEBUG: Background removal completed.")
+    print(f"DEBUG: Original image bytes size: {len(input_image_bytes)} bytes")
+    print(f"DEBUG: Rembg output image bytes size: {len(output_image_bytes)} bytes")
+
+    with timer.stage("gcs_upload"):
+        return store_rembg_output(key, source_name, output_image_bytes)
 
 def process_and_return(image_bytes, prompt_text="姿勢矯正"):
     """
@@ -118,44 +436,100 @@ def process_and_return(image_bytes, prompt_text="姿勢矯正"):
         print("ERROR: RunningHubImageProcessor not available.", file=sys.stderr)
         return None
 
-    tmp_input = f"/tmp/{uuid.uuid4().hex}.png"
-    with open(tmp_input, "wb") as f:
-        f.write(image_bytes)
-
-    output_dir = f"/tmp/rh_results_{uuid.uuid4().hex}"
-    os.makedirs(output_dir, exist_ok=True)
-
     try:
-        processor = RunningHubImageProcessor(base_url="https://www.runninghub.cn")
-        success = processor.process_image(tmp_input, prompt_text=prompt_text, output_dir=output_dir, max_wait_time=300)
-        if not success:
-            print("ERROR: RunningHub 處理失敗", file=sys.stderr)
-            return None
-
-        results = list(Path(output_dir).glob("*.png"))
+        # 輸入與結果都只存在記憶體中，不經過 /tmp
+        processor = get_rh_client()
+        results = processor.process_image_bytes(image_bytes, filename="input.png", prompt_text=prompt_text, max_wait_time=300)
         if not results:
-            print("ERROR: 沒有找到生成結果", file=sys.stderr)
+            print("ERROR: RunningHub 處理失敗或沒有找到生成結果", file=sys.stderr)
             return None
 
-        result_path = str(results[0])
-        blob_name = upload_image_to_gcs(result_path, GCS_BUCKET)
-        signed_url = get_signed_url(GCS_BUCKET, blob_name)
+        result_name, result_bytes = results[0]
+        blob_name = upload_image(result_name, result_bytes)
+        signed_url = get_signed_url(blob_name)
         return signed_url
 
     except Exception as e:
         print(f"ERROR: process_and_return 發生錯誤: {e}", file=sys.stderr)
         traceback.print_exc(file=sys.stderr)
         return None
-    finally:
-        try:
-            if os.path.exists(tmp_input):
-                os.remove(tmp_input)
-            if os.path.exists(output_dir):
-                shutil.rmtree(output_dir)
-        except:
-            pass
 
 
+upload_jobs = JobManager(
+    "upload",
+    workers=UPLOAD_JOB_WORKERS,
+    max_queue=UPLOAD_JOB_QUEUE_SIZE,
+    retention_seconds=JOB_RETENTION_SECONDS,
+)
+
+pose_jobs = JobManager(
+    "pose",
+    workers=POSE_JOB_WORKERS,
+    max_queue=POSE_JOB_QUEUE_SIZE,
+    retention_seconds=JOB_RETENTION_SECONDS,
+)
+
+_rh_client_lock = threading.Lock()
+_rh_client_instance = None
+
+def get_rh_client():
+    """
+    行程內共用的 RunningHub 用戶端：上傳、建立任務、輪詢狀態與下載結果共用同一個連線池，
+    重用 keep-alive 的 TLS 連線。建立時不發出請求，預設工作流延後到第一次建立任務才查詢 (失敗時下次建立任務再試)
+    """
+    global _rh_client_instance
+    if _rh_client_instance is not None:
+        return _rh_client_instance
+    with _rh_client_lock:
+        if _rh_client_instance is None:
+            _rh_client_instance = RunningHubImageProcessor(
+                base_url=RUNNINGHUB_BASE_URL, pool_maxsize=RUNNINGHUB_POOL_MAXSIZE, lazy_workflow=True
+            )
+    return _rh_client_instance
+
+rh_poller = TaskPoller(
+    lambda task_id: get_rh_client().check_task_status(task_id),
+    policy=PollPolicy(
+        min_interval=RUNNINGHUB_POLL_MIN_INTERVAL_SECONDS,
+        base_interval=RUNNINGHUB_POLL_INTERVAL_SECONDS,
+        max_interval=RUNNINGHUB_POLL_MAX_INTERVAL_SECONDS,
+    ),
+    max_requests_per_second=RUNNINGHUB_MAX_POLLS_PER_SECOND,
+    workers=RUNNINGHUB_POLL_WORKERS,
+)
+
+def rh_webhook_url():
+    """建立 RunningHub 任務時登記的回呼網址；未設定 RUNNINGHUB_WEBHOOK_BASE_URL 時為 None (只輪詢)"""
+    if not RUNNINGHUB_WEBHOOK_BASE_URL:
+        return None
+    return f"{RUNNINGHUB_WEBHOOK_BASE_URL}/runninghub/webhook?{urlencode({'token': RUNNINGHUB_WEBHOOK_SECRET})}"
+
+def is_async_request():
+    value = request.args.get('async') or request.form.get('async') or ""
+    return value.lower() in ("1", "true", "yes")
+
+def run_upload_pipeline(timer, input_image_bytes, category, user_id):
+    """去背 → GCS → Firestore → 簽名 URL，同步與非同步上傳共用"""
+    tags = ""
+    config = rembg_sessions.resolve("upload", category)
+    blob_name, stored_derivatives = remove_background_to_storage(input_image_bytes, "rembg", config=config, timer=timer)
+
+    item_id = item_doc_id(blob_name)
+    with timer.stage("firestore"):
+        get_item_store().put_items('wardrobe', user_id, [(item_id, {
+            'filename': blob_name,
+            'derivatives': stored_derivatives,
+            'category': category,
+            'tags': tags,
+        })])
+        mark_collection_changed('wardrobe', user_id)
+    print(f"DEBUG: Image record saved to Firestore for user {user_id}: {blob_name}")
+
+    with timer.stage("sign_url"):
+        signed_url = get_signed_url(blob_name)
+    print(f"DEBUG: Upload stage timings (ms): {timer.as_ms()}")
+    return {"status": "ok", "id": item_id, "path": signed_url, "category": category, "tags": tags}
+
 @app.route('/upload', methods=['POST'])
 def upload():
     image = request.files.get('image')
@@ -166,50 +540,494 @@ def upload():
 
     input_image_bytes = image.read()
 
-    save_dir = os.path.join(UPLOAD_FOLDER, user_id, category)
-    os.makedirs(save_dir, exist_ok=True)
+    if is_async_request():
+        try:
+            job = upload_jobs.submit(run_upload_pipeline, input_image_bytes, category, user_id)
+        except JobQueueFull:
+            print("WARN: Upload job queue is full, rejecting async upload.", file=sys.stderr)
+            return jsonify({"status": "error", "message": "伺服器忙碌中，請稍後再試"}), 503
+        print(f"DEBUG: Upload job {job.id} queued for user {user_id}.")
+        return jsonify({"status": "accepted", "job_id": job.id, "status_url": f"/jobs/{job.id}"}), 202
+
+    try:
+        return jsonify(run_upload_pipeline(StageTimer(), input_image_bytes, category, user_id))
+    except Exception as e:
+        print(f"ERROR: Upload processing failed (including rembg): {e}", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        return jsonify({"status": "error", "message": f"上傳處理失敗: {e}"}), 500
+
+@app.route('/upload_batch', methods=['POST'])
+def upload_batch():
+    """
+    一次上傳多張同類別衣物：
+    1. 以共用的 rembg session 依序去背 (模型只載入一次，避免每張圖各走一次 HTTP 請求)；
+       啟用行程池時整批同時送進 worker 行程
+    2. 並行上傳去背結果到 GCS
+    3. 以單一 Firestore batch 寫入所有紀錄
+    回傳每張圖片各自的結果，單張失敗不影響其他圖片。
+    """
+    images = request.files.getlist('images')
+    category = request.form.get('category')
+    user_id = request.form.get('user_id')
+    if not images or not category or not user_id:
+        return jsonify({"status": "error", "message": "缺少必要參數"}), 400
+    if len(images) > UPLOAD_BATCH_MAX_FILES:
+        return jsonify({"status": "error", "message": f"單次最多上傳 {UPLOAD_BATCH_MAX_FILES} 張圖片"}), 400
 
     tags = ""
-    temp_output_filepath = None
+    results = [
+        {"index": i, "name": image.filename, "status": "error", "message": None}
+        for i, image in enumerate(images)
+    ]
 
+    rembg_config = rembg_sessions.resolve("upload", category)
     try:
-        print("DEBUG: Starting background removal...")
-        rembg_session = get_rembg_session()
-        output_image_bytes = remove(input_image_bytes, session=rembg_session)
-        print("DEBUG: Background removal completed.")
+        # 啟用行程池時由 worker 行程各自持有 session，主行程不需載入模型
+        if REMBG_PROCESS_POOL_SIZE == 0:
+            get_rembg_session(rembg_config)
+    except Exception as e:
+        print(f"ERROR: Batch upload aborted, rembg session unavailable: {e}", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        return jsonify({"status": "error", "message": f"上傳處理失敗: {e}"}), 500
+
+    source_names = [secure_filename(image.filename or "") or f"batch_{i}" for i, image in enumerate(images)]
+
+    # 1. 去背：共用同一個 session，依序處理整批圖片；重複的圖片直接重用既有結果
+    outputs = {}
+    cached = {}
+    removals = {}
+    print(f"DEBUG: Starting batch background removal for {len(images)} images...")
+    for i, image in enumerate(images):
+        try:
+            input_image_bytes = image.read()
+            key, cached_blob_name = lookup_rembg_output(input_image_bytes, rembg_config)
+            if cached_blob_name:
+                cached[i] = (key, cached_blob_name, input_image_bytes)
+            else:
+                removals[i] = (key, submit_background_removal(input_image_bytes, rembg_config))
+        except Exception as e:
+            print(f"ERROR: Background removal failed for batch item {i} ({image.filename}): {e}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+            results[i]["message"] = f"去背失敗: {e}"
+    for i, (key, future) in removals.items():
+        try:
+            outputs[i] = (key, future.result())
+        except Exception as e:
+            print(f"ERROR: Background removal failed for batch item {i} ({images[i].filename}): {e}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+            results[i]["message"] = f"去背失敗: {e}"
+    print(f"DEBUG: Batch background removal completed ({len(outputs)} inferred, {len(cached)} deduplicated).")
+
+    def store_batch_item(i):
+        if i in cached:
+            key, cached_blob_name, input_image_bytes = cached[i]
+            reused = reuse_rembg_output(key, cached_blob_name, source_names[i])
+            # 快取指向的 blob 已不存在時退回完整流程
+            return reused or remove_background_to_storage(input_image_bytes, source_names[i], rembg_config)
+        key, output_image_bytes = outputs[i]
+        return store_rembg_output(key, source_names[i], output_image_bytes)
+
+    # 2. 並行上傳到 GCS
+    blob_names = {}
+    pending_items = list(outputs) + list(cached)
+    if pending_items:
+        workers = max(1, min(UPLOAD_BATCH_GCS_WORKERS, len(pending_items)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(store_batch_item, i): i for i in pending_items}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    blob_names[i] = future.result()
+                except Exception as e:
+                    print(f"ERROR: GCS upload failed for batch item {i}: {e}", file=sys.stderr)
+                    traceback.print_exc(file=sys.stderr)
+                    results[i]["message"] = f"上傳 GCS 失敗: {e}"
+
+    # 3. Firestore 批次寫入
+    if blob_names:
+        try:
+            get_item_store().put_items('wardrobe', user_id, [
+                (item_doc_id(blob_name), {
+                    'filename': blob_name,
+                    'derivatives': stored_derivatives,
+                    'category': category,
+                    'tags': tags,
+                })
+                for _, (blob_name, stored_derivatives) in sorted(blob_names.items())
+            ])
+            mark_collection_changed('wardrobe', user_id)
+            print(f"DEBUG: Batch of {len(blob_names)} image records saved to Firestore for user {user_id}.")
+        except Exception as e:
+            print(f"ERROR: Firestore batch commit failed: {e}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+            for i in blob_names:
+                results[i]["message"] = f"寫入資料庫失敗: {e}"
+            blob_names = {}
 
-        print(f"DEBUG: Original image bytes size: {len(input_image_bytes)} bytes")
-        print(f"DEBUG: Rembg output image bytes size: {len(output_image_bytes)} bytes")
+    # 4. 產生簽名 URL
+    for i, (blob_name, _) in blob_names.items():
+        try:
+            results[i].update({
+                "status": "ok",
+                "id": item_doc_id(blob_name),
+                "path": get_signed_url(blob_name),
+                "category": category,
+                "tags": tags,
+            })
+            results[i].pop("message", None)
+        except Exception as e:
+            print(f"ERROR: Failed to sign URL for batch item {i}: {e}", file=sys.stderr)
+            results[i]["message"] = f"產生圖片網址失敗: {e}"
+
+    succeeded = sum(1 for r in results if r["status"] == "ok")
+    return jsonify({
+        "status": "ok" if succeeded else "error",
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results,
+    })
+
+def requested_image_size():
+    """列表 API 的 size 參數：thumb / medium / full (預設)，不合法時回傳 None"""
+    size = request.args.get('size') or FULL_SIZE
+    return size if size == FULL_SIZE or size in DEFAULT_SIZES else None
+
+def item_blob_for_size(item_data, size):
+    """依要求的尺寸挑選 blob；該筆資料沒有對應的衍生圖時退回原圖"""
+    if size != FULL_SIZE:
+        derivative = (item_data.get('derivatives') or {}).get(size)
+        if derivative:
+            return derivative
+    return item_data.get('filename')
+
+def filename_from_path(url):
+    """由列表回傳的簽名 URL (或 blob 名稱) 取得原圖的 blob 名稱"""
+    if "storage.googleapis.com" in url or "X-Goog-Algorithm" in url or "/objects/" in url:
+        filename = url.split("/")[-1].split("?")[0]
+    else:
+        filename = url
+    # 列表可能回傳衍生圖的網址，一律以原圖為刪除單位
+    return source_blob_name(filename)
 
-        temp_output_filename = f"rembg_{uuid.uuid4().hex}.png"
-        temp_output_filepath = os.path.join(save_dir, temp_output_filename)
-        with open(temp_output_filepath, 'wb') as f:
-            f.write(output_image_bytes)
-        print(f"DEBUG: Rembg output temporarily saved to {temp_output_filepath}")
+def item_doc_id(blob_name):
+    """項目文件以原圖的 blob 名稱為 doc id，刪除與更新時可直接以 key 定址"""
+    return blob_name
 
-        blob_name = upload_image_to_gcs(temp_output_filepath, GCS_BUCKET, data_bytes=output_image_bytes)
+def resolve_items(store, collection, user_id, ids, filenames):
+    """
+    找出要刪除的項目：ids 與 filenames 都先以 key 批次讀取 (id = blob 名稱)，
+    以 key 找不到的 filename 再以 filename 查詢 (尚未遷移的舊文件，見 scripts/migrate_item_ids.py)
+    Returns:
+        ({id: 資料}, {filename: [(id, 資料), ...]})
+    """
+    # doc id 不能含有 '/'，這類 key 不可能存在，不送出讀取
+    keys = [key for key in list(ids) + [item_doc_id(name) for name in filenames] if key and '/' not in key]
+    by_id = store.get_items(collection, user_id, keys)
+    by_filename = {name: [(item_doc_id(name), by_id[item_doc_id(name)])] for name in filenames if item_doc_id(name) in by_id}
+    legacy = [name for name in dict.fromkeys(filenames) if name not in by_filename]
+    if legacy:
+        print(f"DEBUG: {len(legacy)} filenames not addressable by key, querying by filename.")
+        by_filename.update(store.find_by_filename(collection, user_id, legacy))
+    return by_id, by_filename
+
+def bulk_delete_items(collection, user_id, ids=(), paths=(), tombstones=False):
+    """
+    批次刪除多個項目的 blob (含衍生圖) 與 metadata
 
-        db = get_firestore_db()
-        doc_ref = db.collection('wardrobe').document(user_id).collection('items').document()
-        doc_ref.set({
-            'filename': blob_name,
-            'category': category,
-            'tags': tags,
-            'timestamp': firestore.SERVER_TIMESTAMP
-        })
-        print(f"DEBUG: Image record saved to Firestore for user {user_id}: {blob_name}")
+    以 ids (列表回傳的項目 id) 直接定址；paths (簽名 URL，舊版用戶端) 則先解析出 blob 名稱。
+    項目讀取後，metadata 刪除 (及 tombstone) 與 blob 刪除同時進行。
+    Returns:
+        與 ids、paths 依序對應的結果列表：{"id" 或 "path", "filename", "status": deleted / not_found / error, "message"?}
+    """
+    store = get_item_store()
+    object_store = get_object_store()
+    filenames = [filename_from_path(url) for url in paths]
 
-        signed_url = get_signed_url(GCS_BUCKET, blob_name)
-        return jsonify({"status": "ok", "path": signed_url, "category": category, "tags": tags})
+    lookup_error = None
+    try:
+        items_by_id, items_by_filename = resolve_items(store, collection, user_id, ids, filenames)
     except Exception as e:
-        print(f"ERROR: Upload processing failed (including rembg): {e}", file=sys.stderr)
+        print(f"ERROR: Metadata lookup for bulk delete failed: {e}", file=sys.stderr)
         traceback.print_exc(file=sys.stderr)
-        return jsonify({"status": "error", "message": f"上傳處理失敗: {e}"}), 500
-    finally:
-        if temp_output_filepath and os.path.exists(temp_output_filepath):
-            os.remove(temp_output_filepath)
-            print(f"DEBUG: Cleaned up temporary rembg output file: {temp_output_filepath}")
-        pass
+        items_by_id, items_by_filename, lookup_error = {}, {}, str(e)
+
+    # 每個請求項目對應的 (id, 資料)
+    targets = [("id", item_id, [(item_id, items_by_id[item_id])] if item_id in items_by_id else []) for item_id in ids]
+    targets += [("path", url, items_by_filename.get(filename, [])) for url, filename in zip(paths, filenames)]
+    items = list({item_id: (item_id, data) for _, _, matched in targets for item_id, data in matched}.values())
+
+    blob_names = [name for name in filenames if not lookup_error]
+    for _, item_data in items:
+        if item_data.get('filename'):
+            blob_names.append(item_data['filename'])
+        blob_names.extend((item_data.get('derivatives') or {}).values())
+    blob_names = list(dict.fromkeys(blob_names))
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        blobs_future = pool.submit(object_store.delete_many, blob_names, max_workers=DELETE_MAX_WORKERS)
+        # 刪除項目與寫入 tombstone 在同一個交易 / batch 中完成
+        commit_errors = store.delete_items(
+            collection, user_id, items, tombstone_days=TOMBSTONE_RETENTION_DAYS if tombstones else None)
+        blob_errors = blobs_future.result()
+
+    item_errors = {}
+    for (item_id, _), error in zip(items, commit_errors):
+        if error:
+            item_errors[item_id] = error
+        else:
+            print(f"DEBUG: Item {item_id} deleted from {collection}/{user_id}.")
+
+    for name in blob_names:
+        _rembg_dedupe_cache.forget_blob(name)
+        invalidate_signed_url(name)
+
+    results = []
+    for kind, key, matched in targets:
+        result = {kind: key}
+        filenames_matched = [item_data.get('filename') for _, item_data in matched]
+        if filenames_matched:
+            result["filename"] = filenames_matched[0]
+        elif kind == "path":
+            result["filename"] = filename_from_path(key)
+        errors = [item_errors[item_id] for item_id, _ in matched if item_id in item_errors]
+        if lookup_error:
+            result.update(status="error", message=lookup_error)
+        elif errors:
+            result.update(status="error", message=errors[0])
+        elif not matched:
+            print(f"WARN: No item found for {kind} {key} under {collection}/{user_id}.")
+            result["status"] = "not_found"
+        else:
+            result["status"] = "deleted"
+            blob_error = next((blob_errors[name] for name in filenames_matched if blob_errors.get(name)), None)
+            if blob_error:
+                # 項目已刪除，列表不再顯示；殘留的 blob 只記錄警告
+                result["message"] = blob_error
+        results.append(result)
+    return results
+
+def bulk_delete_request():
+    """解析刪除請求：user_id 與要刪除的 ids (項目 id) / paths (舊版用戶端傳送的簽名 URL)"""
+    data = request.get_json() or {}
+    ids = [str(doc_id) for doc_id in data.get('ids') or []]
+    return data.get('user_id'), ids, data.get('paths') or []
+
+def bulk_delete_response(collection, user_id, ids, paths, tombstones=False):
+    """/delete 與 /delete_wannabe 的共用流程"""
+    try:
+        results = bulk_delete_items(collection, user_id, ids=ids, paths=paths, tombstones=tombstones)
+    except Exception as e:
+        print(f"[WARN] 刪除失敗 (GCS 或 Firestore): {e}", file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        return jsonify({"status": "error", "message": f"刪除失敗: {e}"}), 500
+
+    deleted_count = sum(1 for result in results if result["status"] == "deleted")
+    failed_count = sum(1 for result in results if result["status"] == "error")
+    if deleted_count:
+        mark_collection_changed(collection, user_id)
+    print(f"DEBUG: Bulk delete for {collection}/{user_id}: {deleted_count} deleted, {failed_count} failed of {len(results)}.")
+    return jsonify({"status": "ok", "deleted": deleted_count, "failed": failed_count, "results": results})
+
+collection_versions = CollectionVersions(
+    StoreVersions(get_item_store),
+    ttl_seconds=LIST_VERSION_CACHE_TTL_SECONDS,
+)
+
+item_cache = UserItemCache(
+    ttl_seconds=ITEM_CACHE_TTL_SECONDS,
+    max_items=ITEM_CACHE_MAX_ITEMS,
+    max_items_per_user=ITEM_CACHE_MAX_ITEMS_PER_USER,
+)
+
+def mark_collection_changed(collection, user_id):
+    """上傳 / 刪除寫入完成後呼叫：遞增版本號 (ETag 與其他實例的快取隨之失效) 並丟棄本行程的快取"""
+    collection_versions.bump(collection, user_id)
+    item_cache.invalidate(collection, user_id)
+
+def list_url_min_valid_seconds():
+    """列表回應中的簽名 URL 至少要涵蓋一個 ETag 時間窗"""
+    return LIST_ETAG_WINDOW_SECONDS + SIGNED_URL_SAFETY_MARGIN_SECONDS
+
+def listing_etag(collection, user_id):
+    """
+    由 (collection, 使用者, 版本號, 時間窗, 查詢參數) 產生強 ETag，不需查詢項目本身
+    版本號讀取失敗時回傳 None (不使用條件式請求)
+    """
+    version = collection_versions.get(collection, user_id)
+    if version is None:
+        return None
+    window = int(time.time() // LIST_ETAG_WINDOW_SECONDS)
+    args = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+    return hashlib.sha256(f"{collection}|{user_id}|{version}|{window}|{args}".encode()).hexdigest()[:32]
+
+def not_modified(etag):
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def listing_response(payload, etag):
+    """列表回應加上 ETag；no-cache 讓瀏覽器每次以 If-None-Match 重新驗證"""
+    response = jsonify(payload)
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def encode_page_cursor(timestamp, doc_id):
+    """以最後一筆文件的 (timestamp, doc id) 產生不透明的下一頁 token"""
+    payload = {"ts": timestamp.isoformat(), "id": doc_id}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def decode_page_cursor(token):
+    payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    return {"timestamp": datetime.datetime.fromisoformat(payload["ts"]), "__name__": payload["id"]}
+
+def requested_page():
+    """
+    解析列表 API 的 limit / cursor 參數
+    Returns:
+        (limit 或 None, start_after 的欄位值或 None)
+    Raises:
+        ValueError: 參數不合法
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is not None:
+        if not limit.isdigit():
+            raise ValueError("limit 必須是正整數")
+        limit = int(limit)
+        if not 1 <= limit <= LIST_PAGE_MAX_LIMIT:
+            raise ValueError(f"limit 需介於 1 到 {LIST_PAGE_MAX_LIMIT}")
+    try:
+        return limit, decode_page_cursor(cursor) if cursor else None
+    except Exception:
+        raise ValueError("cursor 無效或已損毀")
+
+def fetch_items_page(collection, user_id, limit, cursor, category=None):
+    """
+    依 timestamp (新到舊) 向存放層取一頁項目；同一批次寫入的項目 timestamp 相同，以 id 作為次要排序確保不重複不遺漏
+    Returns:
+        ([(id, 資料), ...], 下一頁 token 或 None)
+    """
+    after = (cursor["timestamp"], cursor["__name__"]) if cursor else None
+    # 多取一筆以判斷是否還有下一頁
+    items = get_item_store().list_items(
+        collection, user_id, category=category, limit=limit + 1 if limit else None, after=after)
+    return paginate_items(items, limit, None)
+
+def paginate_items(items, limit, cursor):
+    """在已排序 (新到舊) 的項目中取出 cursor 之後的一頁，規則與 fetch_items_page 相同"""
+    if cursor:
+        position = (cursor["timestamp"], cursor["__name__"])
+        items = [item for item in items if (item[1]['timestamp'], item[0]) < position]
+    if limit and len(items) > limit:
+        items = items[:limit]
+        return items, encode_page_cursor(items[-1][1]['timestamp'], items[-1][0])
+    return items, None
+
+def load_user_items(collection, user_id):
+    """讀取使用者全部項目 (新到舊)；超過單一使用者的快取上限時回傳 None"""
+    items = get_item_store().list_items(collection, user_id, limit=ITEM_CACHE_MAX_ITEMS_PER_USER + 1)
+    if len(items) > ITEM_CACHE_MAX_ITEMS_PER_USER:
+        return None
+    return items
+
+def list_user_items(collection, user_id, limit, cursor, category=None):
+    """
+    列出使用者的一頁項目：優先使用行程內快取並在記憶體中篩選類別，
+    快取停用或使用者項目過多時直接向存放層分頁查詢
+    Returns:
+        ([(id, 資料), ...], 下一頁 token 或 None)
+    """
+    category = category if category and category != "all" else None
+    items = None
+    if ITEM_CACHE_MAX_ITEMS > 0:
+        version = collection_versions.get(collection, user_id)
+        items = item_cache.get(collection, user_id, version, lambda: load_user_items(collection, user_id))
+    if items is None:
+        return fetch_items_page(collection, user_id, limit, cursor, category)
+
+    if category:
+        items = [item for item in items if item[1].get('category') == category]
+    return paginate_items(items, limit, cursor)
+
+def encode_sync_token(synced_at):
+    payload = {"ts": synced_at.isoformat()}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def decode_sync_token(token):
+    payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    return datetime.datetime.fromisoformat(payload["ts"])
+
+def wardrobe_item_response(doc_id, item_data, size, min_valid_seconds=None):
+    """衣櫃列表中的單筆資料；沒有圖片的文件回傳 None"""
+    blob_name = item_blob_for_size(item_data, size)
+    if not blob_name:
+        return None
+    signed_url, expires_at = get_signed_url_with_expiry(blob_name, min_valid_seconds=min_valid_seconds)
+    timestamp = item_data.get('timestamp')
+    return {
+        "id": doc_id,
+        "path": signed_url,
+        "path_expires_at": int(expires_at),
+        "category": item_data.get('category'),
+        "tags": item_data.get('tags') or '',
+        "timestamp": timestamp.isoformat() if timestamp else None,
+    }
+
+def wardrobe_delta(user_id, category, size, since, refresh_ids=()):
+    """
+    增量同步：回傳 since token 之後新增的項目與刪除的項目 id
+    since 為空字串、已超過 tombstone 保留期限或早於項目 id 遷移時回傳完整快照 (reset=True)；
+    refresh_ids 中的項目會重新回傳 (換新快到期的簽名 URL)，已不存在的則列入 deleted
+    """
+    synced_at = datetime.datetime.now(datetime.timezone.utc)
+    since_at = decode_sync_token(since) if since else None
+    reset = since_at is None or since_at < synced_at - datetime.timedelta(days=TOMBSTONE_RETENTION_DAYS)
+
+    store = get_item_store()
+    category = category if category and category != "all" else None
+    if not reset:
+        # 項目 id 重新編排 (scripts/migrate_item_ids.py) 後，之前的本機快取一律重新取得完整快照
+        resync_at = store.get_resync_at('wardrobe', user_id)
+        reset = bool(resync_at and since_at < resync_at)
+
+    deleted = []
+    if reset:
+        items = store.list_items('wardrobe', user_id, category=category)
+    else:
+        window_start = since_at - datetime.timedelta(seconds=SYNC_OVERLAP_SECONDS)
+        items = store.changed_since('wardrobe', user_id, window_start, category=category)
+        deleted = store.deleted_since('wardrobe', user_id, window_start, category=category)
+
+    if refresh_ids and not reset:
+        seen = {item_id for item_id, _ in items}
+        missing = [item_id for item_id in refresh_ids if item_id not in seen]
+        found = store.get_items('wardrobe', user_id, missing) if missing else {}
+        for item_id in missing:
+            if item_id in found:
+                items.append((item_id, found[item_id]))
+            elif item_id not in deleted:
+                deleted.append(item_id)
+
+    images = [
+        item for item in (
+            wardrobe_item_response(
+                item_id, item_data, size,
+                min_valid_seconds=max(SYNC_URL_MIN_VALID_SECONDS, list_url_min_valid_seconds()),
+            )
+            for item_id, item_data in items
+        )
+        if item
+    ]
+    print(f"DEBUG: Wardrobe delta for user {user_id}: {len(images)} upserts, {len(deleted)} deletions, reset={reset}.")
+    return {
+        "images": images,
+        "deleted": deleted,
+        "reset": reset,
+        "sync_token": encode_sync_token(synced_at),
+    }
 
 @app.route('/wardrobe', methods=['GET'])
 def wardrobe():
@@ -217,83 +1035,59 @@ def wardrobe():
     category = request.args.get('category')
     if not user_id:
         return jsonify({"status": "error", "message": "缺少 user_id"}), 400
+    size = requested_image_size()
+    if size is None:
+        return jsonify({"status": "error", "message": "size 參數只能是 thumb、medium 或 full"}), 400
+
+    # 衣櫃自上次回應後沒有變動時直接回 304，不查詢 Firestore 也不重新簽名
+    etag = listing_etag('wardrobe', user_id)
+    if etag and request.if_none_match.contains(etag):
+        return not_modified(etag)
+
+    # ?since=<sync token> (初次同步帶空字串)：只回傳變更
+    since = request.args.get('since')
+    if since is not None:
+        refresh_ids = [doc_id for doc_id in (request.args.get('refresh') or '').split(',') if doc_id]
+        if len(refresh_ids) > SYNC_REFRESH_MAX_IDS:
+            return jsonify({"status": "error", "message": f"refresh 最多 {SYNC_REFRESH_MAX_IDS} 筆"}), 400
+        try:
+            return listing_response(wardrobe_delta(user_id, category, size, since, refresh_ids), etag)
+        except (ValueError, KeyError) as e:
+            return jsonify({"status": "error", "message": f"since token 無效: {e}"}), 400
+        except Exception as e:
+            print(f"ERROR: Failed to compute wardrobe delta: {e}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+            return jsonify({"status": "error", "message": f"同步衣櫃失敗: {e}"}), 500
 
-    images = []
     try:
-        db = get_firestore_db()
-        query = db.collection('wardrobe').document(user_id).collection('items')
-
-        if category and category != "all":
-            query = query.where('category', '==', category)
+        limit, cursor = requested_page()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
-        query = query.order_by('timestamp', direction=firestore.Query.DESCENDING)
+    images = []
+    try:
+        items, next_cursor = list_user_items('wardrobe', user_id, limit, cursor, category)
 
-        docs = query.stream()
-
-        for doc in docs:
-            item_data = doc.to_dict()
-            blob_name = item_data.get('filename')
-            if blob_name:
-                signed_url = get_signed_url(GCS_BUCKET, blob_name)
-                images.append({
-                    "path": signed_url,
-                    "category": item_data.get('category'),
-                    "tags": item_data.get('tags') or ''
-                })
-        print(f"DEBUG: Retrieved {len(images)} images from Firestore for user {user_id}.")
+        for doc_id, item_data in items:
+            item = wardrobe_item_response(doc_id, item_data, size, min_valid_seconds=list_url_min_valid_seconds())
+            if item:
+                images.append(item)
+        print(f"DEBUG: Retrieved {len(images)} images for user {user_id}.")
 
     except Exception as e:
         print(f"ERROR: Failed to retrieve wardrobe from Firestore: {e}", file=sys.stderr)
         traceback.print_exc(file=sys.stderr)
         return jsonify({"status": "error", "message": f"載入衣櫃失敗: {e}"}), 500
 
-    return jsonify({"images": images})
+    return listing_response({"images": images, "next_cursor": next_cursor}, etag)
 
 @app.route('/delete', methods=['POST'])
 def delete():
-    data = request.get_json()
-    user_id = data.get('user_id')
-    paths = data.get('paths', [])
-    if not user_id or not paths:
-        return jsonify({"status": "error", "message": "缺少 user_id 或 paths"}), 400
-
-    deleted_count = 0
-    db = get_firestore_db()
-
-    for url in paths:
-        if "storage.googleapis.com" in url:
-            filename = url.split("/")[-1].split("?")[0]
-        elif "X-Goog-Algorithm" in url:
-            filename = url.split("/")[-1].split("?")[0]
-        else:
-            filename = url
+    user_id, ids, paths = bulk_delete_request()
+    if not user_id or not (ids or paths):
+        return jsonify({"status": "error", "message": "缺少 user_id 或 ids"}), 400
 
-        try:
-            client = get_gcs_client()
-            bucket = client.bucket(GCS_BUCKET)
-            blob = bucket.blob(filename)
-            blob.delete()
-            print(f"DEBUG: GCS blob {filename} deleted.")
-
-            query = db.collection('wardrobe').document(user_id).collection('items').where('filename', '==', filename)
-            docs = query.stream()
-
-            found_docs = 0
-            for doc in docs:
-                doc.reference.delete()
-                print(f"DEBUG: Firestore document {doc.id} deleted for filename {filename}.")
-                found_docs += 1
-
-            if found_docs > 0:
-                deleted_count += 1
-            else:
-                print(f"WARN: No Firestore document found for filename {filename} under user {user_id}.")
-
-        except Exception as e:
-            print(f"[WARN] 刪除失敗 (GCS 或 Firestore): {e}", file=sys.stderr)
-            traceback.print_exc(file=sys.stderr)
-
-    return jsonify({"status": "ok", "deleted": deleted_count})
+    return bulk_delete_response('wardrobe', user_id, ids, paths, tombstones=True)
 
 # --- New routes for 'Wannabe' images ---
 
@@ -306,47 +1100,29 @@ def upload_wannabe():
 
     input_image_bytes = image.read()
 
-    # Save to a different directory or just use a generic one for wannabe
-    save_dir = os.path.join(UPLOAD_FOLDER, user_id, "wannabe")
-    os.makedirs(save_dir, exist_ok=True)
-
-    temp_output_filepath = None
-
     try:
-        print("DEBUG: Starting background removal for wannabe image...")
-        rembg_session = get_rembg_session()
-        output_image_bytes = remove(input_image_bytes, session=rembg_session)
-        print("DEBUG: Background removal completed for wannabe image.")
-
-        temp_output_filename = f"rembg_wannabe_{uuid.uuid4().hex}.png"
-        temp_output_filepath = os.path.join(save_dir, temp_output_filename)
-        with open(temp_output_filepath, 'wb') as f:
-            f.write(output_image_bytes)
-        print(f"DEBUG: Rembg output temporarily saved to {temp_output_filepath}")
-
-        # Upload to GCS
-        blob_name = upload_image_to_gcs(temp_output_filepath, GCS_BUCKET, data_bytes=output_image_bytes)
-
-        # Save record to a new Firestore collection 'wannabe_wardrobe'
-        db = get_firestore_db()
-        doc_ref = db.collection('wannabe_wardrobe').document(user_id).collection('items').document()
-        doc_ref.set({
+        # 去背並上傳到 GCS (重複的圖片直接重用既有結果)
+        print("DEBUG: Processing wannabe image...")
+        blob_name, stored_derivatives = remove_background_to_storage(
+            input_image_bytes, "rembg_wannabe", config=rembg_sessions.resolve("upload_wannabe")
+        )
+
+        # Save record to the 'wannabe_wardrobe' collection
+        item_id = item_doc_id(blob_name)
+        get_item_store().put_items('wannabe_wardrobe', user_id, [(item_id, {
             'filename': blob_name,
-            'timestamp': firestore.SERVER_TIMESTAMP
+            'derivatives': stored_derivatives,
             # 'tags' field can be added later if needed for AI descriptions
-        })
+        })])
+        mark_collection_changed('wannabe_wardrobe', user_id)
         print(f"DEBUG: Wannabe image record saved to Firestore for user {user_id}: {blob_name}")
 
-        signed_url = get_signed_url(GCS_BUCKET, blob_name)
-        return jsonify({"status": "ok", "path": signed_url})
+        signed_url = get_signed_url(blob_name)
+        return jsonify({"status": "ok", "id": item_id, "path": signed_url})
     except Exception as e:
         print(f"ERROR: Wannabe image upload processing failed (including rembg): {e}", file=sys.stderr)
         traceback.print_exc(file=sys.stderr) # 打印完整的堆棧追溯
         return jsonify({"status": "error", "message": f"上傳「我想成為」圖片失敗: {e}"}), 500
-    finally:
-        if temp_output_filepath and os.path.exists(temp_output_filepath):
-            os.remove(temp_output_filepath)
-            print(f"DEBUG: Cleaned up temporary rembg wannabe output file: {temp_output_filepath}")
 
 
 @app.route('/wannabe_wardrobe', methods=['GET'])
@@ -354,86 +1130,120 @@ def wannabe_wardrobe():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({"status": "error", "message": "缺少 user_id"}), 400
+    size = requested_image_size()
+    if size is None:
+        return jsonify({"status": "error", "message": "size 參數只能是 thumb、medium 或 full"}), 400
+    try:
+        limit, cursor = requested_page()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    etag = listing_etag('wannabe_wardrobe', user_id)
+    if etag and request.if_none_match.contains(etag):
+        return not_modified(etag)
 
     images = []
     try:
-        db = get_firestore_db()
-        # Query the new collection 'wannabe_wardrobe'
-        query = db.collection('wannabe_wardrobe').document(user_id).collection('items')
-        query = query.order_by('timestamp', direction=firestore.Query.DESCENDING)
-
-        docs = query.stream()
+        # Query the new collection 'wannabe_wardrobe' (through the per-user item cache)
+        items, next_cursor = list_user_items('wannabe_wardrobe', user_id, limit, cursor)
 
-        for doc in docs:
-            item_data = doc.to_dict()
-            blob_name = item_data.get('filename')
+        for doc_id, item_data in items:
+            blob_name = item_blob_for_size(item_data, size)
             if blob_name:
-                signed_url = get_signed_url(GCS_BUCKET, blob_name)
+                signed_url, _ = get_signed_url_with_expiry(
+                    blob_name, min_valid_seconds=list_url_min_valid_seconds()
+                )
                 images.append({
+                    "id": doc_id,
                     "path": signed_url,
                     "tags": item_data.get('tags', '') # Can be empty for now
                 })
-        print(f"DEBUG: Retrieved {len(images)} wannabe images from Firestore for user {user_id}.")
+        print(f"DEBUG: Retrieved {len(images)} wannabe images for user {user_id}.")
 
     except Exception as e:
         print(f"ERROR: Failed to retrieve wannabe wardrobe from Firestore: {e}", file=sys.stderr)
         traceback.print_exc(file=sys.stderr) # 打印完整的堆棧追溯
         return jsonify({"status": "error", "message": f"載入「我想成為」圖片失敗: {e}"}), 500
 
-    return jsonify({"images": images})
+    return listing_response({"images": images, "next_cursor": next_cursor}, etag)
 
 @app.route('/delete_wannabe', methods=['POST'])
 def delete_wannabe():
-    data = request.get_json()
-    user_id = data.get('user_id')
-    paths = data.get('paths', [])
-    if not user_id or not paths:
-        return jsonify({"status": "error", "message": "缺少 user_id 或 paths"}), 400
-
-    deleted_count = 0
-    db = get_firestore_db()
-
-    for url in paths:
-        # Extract filename from signed URL
-        if "storage.googleapis.com" in url:
-            filename = url.split("/")[-1].split("?")[0]
-        elif "X-Goog-Algorithm" in url:
-            filename = url.split("/")[-1].split("?")[0]
-        else:
-            filename = url
+    user_id, ids, paths = bulk_delete_request()
+    if not user_id or not (ids or paths):
+        return jsonify({"status": "error", "message": "缺少 user_id 或 ids"}), 400
 
-        try:
-            # --- GCS: Delete the actual image file ---
-            client = get_gcs_client()
-            bucket = client.bucket(GCS_BUCKET)
-            blob = bucket.blob(filename)
-            blob.delete()
-            print(f"DEBUG: GCS blob {filename} deleted for wannabe.")
-
-            # --- Firestore: Find and delete the record in the 'wannabe_wardrobe' collection ---
-            query = db.collection('wannabe_wardrobe').document(user_id).collection('items').where('filename', '==', filename)
-            docs = query.stream()
-
-            found_docs = 0
-            for doc in docs:
-                doc.reference.delete()
-                print(f"DEBUG: Firestore document {doc.id} deleted for wannabe filename {filename}.")
-                found_docs += 1
-
-            if found_docs > 0:
-                deleted_count += 1
-            else:
-                print(f"WARN: No Firestore document found for wannabe filename {filename} under user {user_id}.")
+    # Delete GCS blobs and the 'wannabe_wardrobe' records in batches
+    return bulk_delete_response('wannabe_wardrobe', user_id, ids, paths)
 
-        except Exception as e:
-            print(f"[WARN] Failed to delete wannabe image (GCS or Firestore): {e}", file=sys.stderr)
-            traceback.print_exc(file=sys.stderr)
+# --- Pose Correction (RunningHub，非同步工作) ---
+def run_pose_correction(timer, image_bytes, filename):
+    """
+    上傳圖片並建立 RunningHub 任務，於背景工作執行緒中執行；
+    任務交給共用的輪詢器追蹤，完成後由 finish_pose_correction 取回結果
+
+    Returns:
+        Deferred，工作結果為結果圖片的簽名 URL；任何步驟失敗時丟出 RuntimeError (訊息會成為工作的 error)
+    """
+    processor = get_rh_client()
+
+    # 1. 上傳圖片
+    with timer.stage("rh_upload"):
+        uploaded_filename = processor.upload_image(image_bytes, filename=filename)
+    if not uploaded_filename:
+        raise RuntimeError("姿勢矯正失敗：圖片上傳到 RunningHub 失敗")
+
+    # 2. 創建任務 (有設定回呼網址時一併登記 webhook)
+    webhook_url = rh_webhook_url()
+    with timer.stage("rh_create"):
+        task_id = processor.create_task(uploaded_filename, prompt_text="姿勢矯正", webhook_url=webhook_url)
+    if not task_id:
+        raise RuntimeError("姿勢矯正失敗：創建 RunningHub 任務失敗")
+    print(f"DEBUG: RunningHub pose task {task_id} created for {filename}.")
+
+    # 3. 等待任務完成：不佔用工作執行緒，由 webhook 通知或輪詢器統一查詢狀態
+    return Deferred(
+        rh_poller.watch(
+            task_id,
+            timeout=POSE_MAX_WAIT_SECONDS,
+            workflow=processor.workflow_id,
+            fallback_interval=RUNNINGHUB_WEBHOOK_FALLBACK_POLL_SECONDS if webhook_url else None,
+        ),
+        lambda timer, status: finish_pose_correction(timer, processor, task_id, status),
+    )
 
-    return jsonify({"status": "ok", "deleted": deleted_count})
+def finish_pose_correction(timer, processor, task_id, status):
+    """RunningHub 任務結束後：取得結果 → 下載到記憶體 → 存放並簽名"""
+    if status == TIMEOUT:
+        raise RuntimeError("姿勢矯正失敗：RunningHub 任務超時")
+    if status != SUCCESS:
+        raise RuntimeError("姿勢矯正失敗：RunningHub 任務未成功完成")
+
+    # 4. 獲取結果並下載到記憶體
+    with timer.stage("rh_fetch"):
+        results = processor.get_task_results(task_id)
+        if not results:
+            raise RuntimeError("姿勢矯正失敗：獲取 RunningHub 結果失敗")
+        result_images = processor.fetch_results(results)
+    if not result_images:
+        raise RuntimeError("姿勢矯正失敗：未生成圖片")
+
+    # 取第一張結果圖片，存放後回傳簽名 URL
+    result_name, result_bytes = result_images[0]
+    print(f"DEBUG: Pose correction result downloaded: {result_name} ({len(result_bytes)} bytes)")
+    with timer.stage("storage"):
+        blob_name = upload_image(result_name, result_bytes)
+    with timer.stage("sign_url"):
+        signed_url = get_signed_url(blob_name)
+    print(f"INFO: Pose correction successful. Result URL: {signed_url} (timings ms: {timer.as_ms()})")
+    return signed_url
 
-# --- New route for Pose Correction (Modified to use multi-step RH05.py) ---
 @app.route('/pose_correction', methods=['POST'])
 def pose_correction():
+    """
+    送出姿勢矯正工作後立即回傳 202 與 job id；RunningHub 任務最久需數分鐘，
+    不佔住請求執行緒。以 GET /pose_correction/<job_id> 查詢狀態與結果 URL。
+    """
     # 檢查 RunningHubImageProcessor 是否成功導入
     if RunningHubImageProcessor is None:
         print("ERROR: RunningHubImageProcessor is not available. Pose correction aborted.", file=sys.stderr)
@@ -443,110 +1253,148 @@ def pose_correction():
     if not image:
         return jsonify({"status": "error", "message": "缺少圖片"}), 400
 
-    # 為了姿勢矯正模型，將圖片暫存到 /tmp
-    save_path = f"/tmp/{uuid.uuid4().hex}_{secure_filename(image.filename)}"
-    # 將圖片內容讀取到 BytesIO，然後保存到暫存路徑
+    # 圖片 bytes 留在記憶體中交給背景工作，結果也只下載到記憶體，不寫入 /tmp
+    filename = secure_filename(image.filename) or "image.png"
     image_bytes = image.read()
-    with open(save_path, 'wb') as f:
-        f.write(image_bytes)
-    print(f"DEBUG: Original image saved to {save_path} for pose correction.")
-
-    # 設置 RunningHub 輸出目錄
-    output_dir = "/tmp/pose_results_rh" # 使用不同的目錄名，避免衝突
-    os.makedirs(output_dir, exist_ok=True)
 
     try:
-
-        # 初始化 RunningHubImageProcessor，使用與您提供的 runninghub_processor.py 匹配的 base_url
-        processor = RunningHubImageProcessor(base_url="https://www.runninghub.cn")
-        print(f"DEBUG: Initialized RunningHubImageProcessor with base_url: {processor.base_url}")
-
-        # --- 多步驟調用 RunningHub API ---
-        # 1. 上傳圖片
-        uploaded_filename = processor.upload_image(save_path)
-        if not uploaded_filename:
-            print("ERROR: RunningHub image upload failed.", file=sys.stderr)
-            return jsonify({"status": "error", "message": "姿勢矯正失敗：圖片上傳到 RunningHub 失敗"}), 500
-
-        # 2. 創建任務
-        task_id = processor.create_task(uploaded_filename, prompt_text="姿勢矯正")
-        if not task_id:
-            print("ERROR: RunningHub task creation failed.", file=sys.stderr)
-            return jsonify({"status": "error", "message": "姿勢矯正失敗：創建 RunningHub 任務失敗"}), 500
-
-        # 3. 等待任務完成
-        # max_wait_time 應該足夠長，例如 300 秒 (5 分鐘)
-        if not processor.wait_for_completion(task_id, max_wait_time=300):
-            print("ERROR: RunningHub task did not complete successfully or timed out.", file=sys.stderr)
-            return jsonify({"status": "error", "message": "姿勢矯正失敗：RunningHub 任務超時或未成功完成"}), 500
-
-        # 4. 獲取結果
-        results = processor.get_task_results(task_id)
-        if not results:
-            print("ERROR: RunningHub failed to get task results.", file=sys.stderr)
-            return jsonify({"status": "error", "message": "姿勢矯正失敗：獲取 RunningHub 結果失敗"}), 500
-
-        # 5. 保存結果 (下載到本地)
-        # save_results 會將圖片下載到 output_dir，並返回保存的檔案路徑列表
-        saved_local_paths = processor.save_results(results, output_dir=output_dir)
-
-        if saved_local_paths:
-            # runninghub_processor.py 應該會將結果保存為 PNG 或 JPG
-            # 這裡我們預期它會保存至少一張圖片
-            result_path = saved_local_paths[0] # 取第一張結果圖片
-            print(f"DEBUG: Pose correction result generated locally at {result_path}")
-
-            # 上傳姿勢矯正後的圖片到 GCS
-            blob_name = upload_image_to_gcs(result_path, GCS_BUCKET)
-            signed_url = get_signed_url(GCS_BUCKET, blob_name)
-            print(f"INFO: Pose correction successful. Result URL: {signed_url}")
-            return jsonify({"status": "ok", "result": signed_url})
-        else:
-            print("WARN: Pose correction succeeded but no output image found locally.", file=sys.stderr)
-            return jsonify({"status": "error", "message": "姿勢矯正失敗：未生成圖片"}), 500
-    except Exception as e:
-        print(f"ERROR: Pose correction failed: {e}", file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
-        return jsonify({"status": "error", "message": f"姿勢矯正過程中發生錯誤: {e}"}), 500
-    finally:
-        # 清理暫存檔案和目錄
-        if os.path.exists(save_path):
-            os.remove(save_path)
-            print(f"DEBUG: Cleaned up temporary input file: {save_path}")
-        if os.path.exists(output_dir):
-            shutil.rmtree(output_dir) # 刪除整個目錄
-            print(f"DEBUG: Cleaned up temporary pose results directory: {output_dir}")
-
+        job = pose_jobs.submit(run_pose_correction, image_bytes, filename)
+    except JobQueueFull:
+        print("WARN: Pose job queue is full, rejecting pose correction.", file=sys.stderr)
+        return jsonify({"status": "error", "message": "伺服器忙碌中，請稍後再試"}), 503
+    print(f"DEBUG: Pose correction job {job.id} queued for {filename}.")
+    return jsonify({"status": "accepted", "job_id": job.id, "status_url": f"/pose_correction/{job.id}"}), 202
+
+@app.route('/pose_correction/<job_id>', methods=['GET'])
+def pose_correction_status(job_id):
+    """回傳工作狀態 (queued / running / succeeded / failed)；成功時 result 為結果圖片的簽名 URL"""
+    job = pose_jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "找不到此工作或已過期"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/runninghub/webhook', methods=['POST'])
+def runninghub_webhook():
+    """
+    RunningHub 任務結束的回呼：{"event": "TASK_END", "taskId": ..., "eventData": "<outputs 回應的 JSON 字串>"}
+    喚醒等待該任務的工作；任務不在此實例時回傳 matched=false，由該實例的備援輪詢完成
+    """
+    if not RUNNINGHUB_WEBHOOK_SECRET:
+        # 未啟用回呼模式
+        return jsonify({"status": "error", "message": "webhook disabled"}), 404
+    token = request.args.get('token') or ""
+    if not hmac.compare_digest(token, RUNNINGHUB_WEBHOOK_SECRET):
+        print("WARN: RunningHub webhook rejected: invalid token.", file=sys.stderr)
+        return jsonify({"status": "error", "message": "invalid token"}), 403
+
+    payload = request.get_json(silent=True) or {}
+    task_id = str(payload.get('taskId') or "")
+    if not task_id:
+        return jsonify({"status": "error", "message": "缺少 taskId"}), 400
+
+    if payload.get('event') != 'TASK_END':
+        print(f"DEBUG: Ignoring RunningHub webhook event {payload.get('event')} for task {task_id}.")
+        return jsonify({"status": "ok", "matched": False})
+
+    event_data = payload.get('eventData')
+    if isinstance(event_data, str):
+        try:
+            event_data = json.loads(event_data)
+        except ValueError:
+            event_data = None
+    succeeded = isinstance(event_data, dict) and event_data.get('code') == 0
+    matched = rh_poller.complete(task_id, SUCCESS if succeeded else FAILED)
+    print(f"DEBUG: RunningHub webhook for task {task_id}: succeeded={succeeded}, matched={matched}")
+    # 一律回傳 200，避免 RunningHub 對不在此實例的任務重送
+    return jsonify({"status": "ok", "matched": matched})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = upload_jobs.get(job_id) or pose_jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "找不到此工作或已過期"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/objects/<name>', methods=['GET'])
+def serve_object(name):
+    """OBJECT_STORE_BACKEND=local 時提供圖片內容；只接受未過期且簽名正確的 URL"""
+    store = get_object_store()
+    if not isinstance(store, LocalObjectStore):
+        return jsonify({"status": "error", "message": "找不到此圖片"}), 404
+    if not store.verify(name, request.args.get('expires'), request.args.get('signature')):
+        return jsonify({"status": "error", "message": "圖片網址無效或已過期"}), 403
+    try:
+        path = store.path(name)
+    except (ObjectNotFound, ValueError):
+        return jsonify({"status": "error", "message": "找不到此圖片"}), 404
+    # conditional=True：支援 ETag / If-Modified-Since 與 Range
+    response = send_file(path, mimetype=store.content_type(name), conditional=True)
+    response.headers['Cache-Control'] = IMAGE_CACHE_CONTROL
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify({
+        "rembg_dedupe": _rembg_dedupe_cache.stats(),
+        "signed_urls": _signed_url_cache.stats(),
+        "list_versions": collection_versions.stats(),
+        "item_cache": item_cache.stats(),
+        "upload_jobs": upload_jobs.stats(),
+        "pose_jobs": pose_jobs.stats(),
+        "runninghub_poller": rh_poller.stats(),
+        "rembg_pool": get_rembg_process_pool().stats() if REMBG_PROCESS_POOL_SIZE > 0 else None,
+        "rembg_sessions": rembg_sessions.stats(),
+        "startup": dict(startup_warmup.status(), import_ms=IMPORT_MS),
+    })
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """就緒檢查：必要的預熱項目 (去背模型) 完成前回傳 503，可作為 Cloud Run 的 startup probe"""
+    status = startup_warmup.status()
+    return jsonify(status), 200 if status["ready"] else 503
 
 @app.route('/')
 def home():
     return jsonify({"status": "running", "message": "Flask 伺服器運行中"})
 
+def warm_up_rembg():
+    if REMBG_PROCESS_POOL_SIZE > 0:
+        get_rembg_process_pool().warm_up()
+        return
+    for config in rembg_sessions.configured():
+        get_rembg_session(config)
+        rembg_sessions.warm_up(config)
+    timings = rembg_sessions.timings.get(rembg_sessions.default, {})
+    print(f"INFO: Startup timing: import {IMPORT_MS} ms, "
+          f"model load {timings.get('model_load_ms')} ms, "
+          f"first inference {timings.get('first_inference_ms')} ms.")
+
+# GCS / Firestore 用戶端與去背模型在各自的執行緒中並行預熱。
+# 模組載入時不建立執行緒 (gunicorn --preload 會在 fork 前載入模組)：gunicorn 下由 gunicorn.conf.py 的
+# post_worker_init 在每個 worker 中啟動，其他情況 (python app.py、其他 WSGI 伺服器) 則在第一個請求時啟動。
+# GCS / Firestore 失敗時請求仍會在第一次使用時重試初始化，因此不列為就緒條件
+startup_warmup = Warmup(startup_timeline)
+if OBJECT_STORE_BACKEND == "gcs":
+    startup_warmup.add("gcs", get_gcs_client, required=False)
+if METADATA_BACKEND == "firestore":
+    startup_warmup.add("firestore", get_firestore_db, required=False)
+startup_warmup.add("metadata", get_item_store, required=False)
+startup_warmup.add("rembg", warm_up_rembg)
+if not STARTUP_WARMUP:
+    # 停用預熱時立即就緒，/readyz 不會一直回傳 503
+    startup_warmup.disable()
+
+@app.before_request
+def ensure_startup_warmup():
+    startup_warmup.start()
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 8080))
     # 捕獲所有啟動時的異常
     try:
-        with app.app_context():
-            try:
-                get_gcs_client()
-                print("INFO: GCS Client successfully initialized on app startup.")
-            except Exception as e:
-                print(f"CRITICAL ERROR: GCS Client failed to initialize on app startup: {e}", file=sys.stderr)
-                traceback.print_exc(file=sys.stderr)
-
-            try:
-                get_firestore_db()
-                print("INFO: Firestore Client successfully initialized on app startup.")
-            except Exception as e:
-                print(f"CRITICAL ERROR: Firestore Client failed to initialize on app startup: {e}", file=sys.stderr)
-                traceback.print_exc(file=sys.stderr)
-
-            try:
-                get_rembg_session()
-                print("INFO: Rembg model pre-loaded on app startup.")
-            except Exception as e:
-                print(f"CRITICAL ERROR: Rembg model pre-load failed on app startup: {e}", file=sys.stderr)
-                traceback.print_exc(file=sys.stderr)
+        # 直接執行時不經過 gunicorn 的 hook，在開始接受請求前啟動預熱 (STARTUP_WARMUP=0 時不做任何事)
+        startup_warmup.start()
         app.run(host="0.0.0.0", port=port)
     except Exception as e:
         print(f"CRITICAL ERROR: Application failed to start: {e}", file=sys.stderr)
@@ -4,3 +4,57 @@ CREATE TABLE IF NOT EXISTS wardrobe (
     filename TEXT NOT NULL,
     category TEXT NOT NULL
 );
+
+-- 衣物 metadata (backend/model/store.py 的 SQLiteItemStore)
+-- collection 為 'wardrobe' 或 'wannabe_wardrobe'；id 為原圖的 blob 名稱
+-- timestamp / deleted_at 皆為 UTC ISO 8601 字串 (固定到微秒)，字串排序即時間排序
+CREATE TABLE IF NOT EXISTS items (
+    collection TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    category TEXT,
+    tags TEXT NOT NULL DEFAULT '',
+    derivatives TEXT NOT NULL DEFAULT '{}',
+    timestamp TEXT NOT NULL,
+    PRIMARY KEY (collection, user_id, id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_items_user_timestamp
+    ON items (collection, user_id, timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_items_user_category_timestamp
+    ON items (collection, user_id, category, timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_items_user_filename
+    ON items (collection, user_id, filename);
+
+-- 已刪除項目的紀錄，供增量同步使用；expire_at 之後清除
+CREATE TABLE IF NOT EXISTS tombstones (
+    collection TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    filename TEXT,
+    category TEXT,
+    deleted_at TEXT NOT NULL,
+    expire_at TEXT NOT NULL,
+    PRIMARY KEY (collection, user_id, id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_tombstones_user_deleted
+    ON tombstones (collection, user_id, deleted_at);
+CREATE INDEX IF NOT EXISTS idx_tombstones_expire
+    ON tombstones (expire_at);
+
+-- 每位使用者、每個 collection 的版本號 (列表 ETag) 與強制完整同步的時間點
+CREATE TABLE IF NOT EXISTS collection_versions (
+    collection TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    resync_at TEXT,
+    PRIMARY KEY (collection, user_id)
+) WITHOUT ROWID;
+
+-- 去背結果去重索引 (對應 Firestore 的 rembg_cache)
+CREATE TABLE IF NOT EXISTS rembg_cache (
+    key TEXT PRIMARY KEY,
+    blob TEXT NOT NULL
+) WITHOUT ROWID;
@@ -1,17 +1,19 @@
 import os
 import sqlite3
-from flask import g
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(BASE_DIR, 'database', 'db.sqlite')
 
 def get_db():
+    # flask 只在請求中使用；延後載入讓 backend.model.store 不依賴 flask
+    from flask import g
     if 'db' not in g:
         g.db = sqlite3.connect(DB_PATH)
         g.db.row_factory = sqlite3.Row
     return g.db
 
 def close_db(e=None):
+    from flask import g
     db = g.pop('db', None)
     if db is not None:
         db.close()
@@ -0,0 +1,430 @@
+"""
+衣物 metadata 的存放層 (wardrobe / wannabe_wardrobe)
+
+app.py 只透過 ItemStore 的方法讀寫項目、tombstone、列表版本號與去背去重索引，
+實際存放位置由 METADATA_BACKEND 決定：
+- FirestoreItemStore：正式環境，資料結構與原本相同 (<collection>/<user_id>/items/<id>)
+- SQLiteItemStore：單機部署或離線 benchmark 用；WAL 模式、每個執行緒重用一條連線，
+  並以 (collection, user_id, category, timestamp) 建立索引
+
+項目以 (id, 資料) 表示，資料的欄位與 Firestore 文件相同：
+filename、derivatives、category、tags、timestamp (datetime，由存放層寫入時產生)。
+列表一律依 timestamp、id 由新到舊排序。
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from backend.utils import bulk_delete
+from backend.utils.dedupe import FirestoreDedupeIndex
+from backend.utils.versions import FirestoreVersionStore
+
+Item = Tuple[str, Dict]
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 預設放在原始碼目錄之外：WAL 模式會在資料庫旁產生 -wal / -shm 檔，也不應改動版本控制中的 db.sqlite
+DEFAULT_SQLITE_PATH = os.path.join(tempfile.gettempdir(), 'wardrobe-metadata.sqlite')
+SCHEMA_PATH = os.path.join(BASE_DIR, 'database', 'schema.sql')
+
+
+class ItemStore:
+    """存放層介面"""
+
+    def put_items(self, collection: str, user_id: str, items: List[Item]):
+        """寫入項目 (同 id 則覆蓋)，timestamp 由存放層設定"""
+        raise NotImplementedError
+
+    def list_items(self, collection: str, user_id: str, category: Optional[str] = None,
+                   limit: Optional[int] = None, after: Optional[Tuple] = None) -> List[Item]:
+        """由新到舊列出項目；after 為 (timestamp, id)，只回傳排在它之後的項目"""
+        raise NotImplementedError
+
+    def get_items(self, collection: str, user_id: str, ids: Iterable[str]) -> Dict[str, Dict]:
+        """以 id 批次讀取，不存在的 id 不列入結果"""
+        raise NotImplementedError
+
+    def find_by_filename(self, collection: str, user_id: str, filenames: Iterable[str]) -> Dict[str, List[Item]]:
+        """以 filename 查詢 (供 id 不是 blob 名稱的舊資料使用)"""
+        raise NotImplementedError
+
+    def delete_items(self, collection: str, user_id: str, items: List[Item],
+                     tombstone_days: Optional[int] = None) -> List[Optional[str]]:
+        """
+        刪除項目；tombstone_days 不為 None 時同時寫入保留該天數的 tombstone
+        Returns:
+            與 items 對應的錯誤訊息列表 (None 表示成功)
+        """
+        raise NotImplementedError
+
+    def changed_since(self, collection: str, user_id: str, since: datetime.datetime,
+                      category: Optional[str] = None) -> List[Item]:
+        raise NotImplementedError
+
+    def deleted_since(self, collection: str, user_id: str, since: datetime.datetime,
+                      category: Optional[str] = None) -> List[str]:
+        raise NotImplementedError
+
+    def get_version(self, collection: str, user_id: str) -> int:
+        raise NotImplementedError
+
+    def bump_version(self, collection: str, user_id: str):
+        raise NotImplementedError
+
+    def get_resync_at(self, collection: str, user_id: str) -> Optional[datetime.datetime]:
+        """早於此時間的同步 token 需要重新取得完整快照 (項目 id 遷移後設定)"""
+        raise NotImplementedError
+
+    def get_dedupe(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set_dedupe(self, key: str, blob_name: str):
+        raise NotImplementedError
+
+    def delete_dedupe(self, key: str):
+        raise NotImplementedError
+
+
+class StoreVersions:
+    """CollectionVersions 的持久層，轉呼叫目前的 ItemStore"""
+
+    def __init__(self, get_store: Callable[[], ItemStore]):
+        self._get_store = get_store
+
+    def get(self, collection: str, user_id: str) -> int:
+        return self._get_store().get_version(collection, user_id)
+
+    def bump(self, collection: str, user_id: str):
+        self._get_store().bump_version(collection, user_id)
+
+
+class StoreDedupeIndex:
+    """RembgDedupeCache 的持久層，轉呼叫目前的 ItemStore"""
+
+    def __init__(self, get_store: Callable[[], ItemStore]):
+        self._get_store = get_store
+
+    def get(self, key: str) -> Optional[str]:
+        return self._get_store().get_dedupe(key)
+
+    def set(self, key: str, blob_name: str):
+        self._get_store().set_dedupe(key, blob_name)
+
+    def delete(self, key: str):
+        self._get_store().delete_dedupe(key)
+
+
+class FirestoreItemStore(ItemStore):
+    def __init__(self, get_db: Callable, max_workers: int = 8):
+        self._get_db = get_db
+        self.max_workers = max_workers
+        self._versions = FirestoreVersionStore(get_db)
+        self._dedupe = FirestoreDedupeIndex(get_db)
+
+    def _user_ref(self, collection, user_id):
+        return self._get_db().collection(collection).document(user_id)
+
+    def _items_ref(self, collection, user_id):
+        return self._user_ref(collection, user_id).collection('items')
+
+    def _ordered(self, query):
+        from google.cloud import firestore
+
+        query = query.order_by('timestamp', direction=firestore.Query.DESCENDING)
+        return query.order_by('__name__', direction=firestore.Query.DESCENDING)
+
+    def put_items(self, collection, user_id, items):
+        from google.cloud import firestore
+
+        db = self._get_db()
+        items_ref = self._items_ref(collection, user_id)
+        for chunk in bulk_delete.chunked(list(items), bulk_delete.FIRESTORE_BATCH_LIMIT):
+            batch = db.batch()
+            for item_id, data in chunk:
+                batch.set(items_ref.document(item_id), dict(data, timestamp=firestore.SERVER_TIMESTAMP))
+            batch.commit()
+
+    def list_items(self, collection, user_id, category=None, limit=None, after=None):
+        query = self._items_ref(collection, user_id)
+        if category:
+            query = query.where('category', '==', category)
+        query = self._ordered(query)
+        if after:
+            query = query.start_after({"timestamp": after[0], "__name__": after[1]})
+        if limit:
+            query = query.limit(limit)
+        return [(doc.id, doc.to_dict()) for doc in query.stream()]
+
+    def get_items(self, collection, user_id, ids):
+        docs = bulk_delete.get_docs_by_id(
+            self._get_db(), self._items_ref(collection, user_id), list(ids), max_workers=self.max_workers)
+        return {doc_id: doc.to_dict() for doc_id, doc in docs.items()}
+
+    def find_by_filename(self, collection, user_id, filenames):
+        found = bulk_delete.find_docs_by_field(
+            self._items_ref(collection, user_id), 'filename', list(filenames), max_workers=self.max_workers)
+        return {name: [(doc.id, doc.to_dict()) for doc in docs] for name, docs in found.items() if docs}
+
+    def delete_items(self, collection, user_id, items, tombstone_days=None):
+        from google.cloud import firestore
+
+        user_ref = self._user_ref(collection, user_id)
+        items_ref = user_ref.collection('items')
+        expire_at = None
+        if tombstone_days is not None:
+            expire_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=tombstone_days)
+
+        def delete_write(item_id, data):
+            def write(batch):
+                batch.delete(items_ref.document(item_id))
+                if expire_at is not None:
+                    # 刪除文件與寫入 tombstone 在同一個 batch 中完成；expire_at 由 Firestore TTL 政策清除
+                    batch.set(user_ref.collection('tombstones').document(item_id), {
+                        'filename': data.get('filename'),
+                        'category': data.get('category'),
+                        'deleted_at': firestore.SERVER_TIMESTAMP,
+                        'expire_at': expire_at,
+                    })
+            return write
+
+        return bulk_delete.commit_in_batches(
+            self._get_db(), [delete_write(item_id, data) for item_id, data in items],
+            writes_per_item=1 if expire_at is None else 2, max_workers=self.max_workers)
+
+    def changed_since(self, collection, user_id, since, category=None):
+        query = self._items_ref(collection, user_id)
+        if category:
+            query = query.where('category', '==', category)
+        query = query.where('timestamp', '>', since)
+        return [(doc.id, doc.to_dict()) for doc in query.stream()]
+
+    def deleted_since(self, collection, user_id, since, category=None):
+        tombstones = self._user_ref(collection, user_id).collection('tombstones')
+        # 以 deleted_at 範圍查詢，類別在記憶體中篩選 (避免額外的複合索引)
+        return [
+            doc.id for doc in tombstones.where('deleted_at', '>', since).stream()
+            if not category or (doc.to_dict() or {}).get('category') == category
+        ]
+
+    def get_version(self, collection, user_id):
+        return self._versions.get(collection, user_id)
+
+    def bump_version(self, collection, user_id):
+        self._versions.bump(collection, user_id)
+
+    def get_resync_at(self, collection, user_id):
+        return (self._user_ref(collection, user_id).get().to_dict() or {}).get('resync_at')
+
+    def get_dedupe(self, key):
+        return self._dedupe.get(key)
+
+    def set_dedupe(self, key, blob_name):
+        self._dedupe.set(key, blob_name)
+
+    def delete_dedupe(self, key):
+        self._dedupe.delete(key)
+
+
+def _format_timestamp(value: datetime.datetime) -> str:
+    """固定格式的 UTC 字串，字串排序與時間排序一致"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc).isoformat(timespec='microseconds')
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime.datetime]:
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+class SQLiteItemStore(ItemStore):
+    _ITEM_COLUMNS = "id, filename, category, tags, derivatives, timestamp"
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH, schema_path: str = SCHEMA_PATH,
+                 busy_timeout_ms: int = 5000, clock: Callable = None):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._clock = clock or (lambda: datetime.datetime.now(datetime.timezone.utc))
+        self._local = threading.local()
+        # 同一毫秒內的多次寫入也要有遞增的 timestamp，增量同步才不會漏掉
+        self._last_timestamp = None
+        self._timestamp_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(schema_path, 'r', encoding='utf-8') as f:
+            self._connection().executescript(f.read())
+
+    def _connection(self) -> sqlite3.Connection:
+        """每個執行緒重用一條連線 (sqlite3 連線預設不可跨執行緒使用)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000)
+            conn.row_factory = sqlite3.Row
+            # WAL：讀取不會被寫入阻擋；synchronous=NORMAL 在 WAL 下仍保證一致性，只在斷電時可能遺失最後的交易
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+        return conn
+
+    def _now(self) -> str:
+        with self._timestamp_lock:
+            now = self._clock()
+            if self._last_timestamp is not None and now <= self._last_timestamp:
+                now = self._last_timestamp + datetime.timedelta(microseconds=1)
+            self._last_timestamp = now
+            return _format_timestamp(now)
+
+    @staticmethod
+    def _row_to_item(row) -> Item:
+        data = {
+            'filename': row['filename'],
+            'derivatives': json.loads(row['derivatives'] or '{}'),
+            'tags': row['tags'],
+            'timestamp': _parse_timestamp(row['timestamp']),
+        }
+        if row['category'] is not None:
+            data['category'] = row['category']
+        return row['id'], data
+
+    def put_items(self, collection, user_id, items):
+        timestamp = self._now()
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO items (collection, user_id, id, filename, category, tags, derivatives, timestamp)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (collection, user_id, item_id, data['filename'], data.get('category'),
+                     data.get('tags') or '', json.dumps(data.get('derivatives') or {}), timestamp)
+                    for item_id, data in items
+                ],
+            )
+
+    def list_items(self, collection, user_id, category=None, limit=None, after=None):
+        sql = f"SELECT {self._ITEM_COLUMNS} FROM items WHERE collection = ? AND user_id = ?"
+        params = [collection, user_id]
+        if category:
+            sql += " AND category = ?"
+            params.append(category)
+        if after:
+            after_ts = _format_timestamp(after[0])
+            sql += " AND (timestamp < ? OR (timestamp = ? AND id < ?))"
+            params += [after_ts, after_ts, after[1]]
+        sql += " ORDER BY timestamp DESC, id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [self._row_to_item(row) for row in self._connection().execute(sql, params)]
+
+    def _select_in(self, column, values, collection, user_id):
+        rows = []
+        # SQLite 的參數數量有上限，分批查詢
+        for chunk in bulk_delete.chunked(list(dict.fromkeys(values)), 500):
+            placeholders = ", ".join("?" * len(chunk))
+            rows += self._connection().execute(
+                f"SELECT {self._ITEM_COLUMNS} FROM items WHERE collection = ? AND user_id = ?"
+                f" AND {column} IN ({placeholders})",
+                [collection, user_id, *chunk],
+            ).fetchall()
+        return rows
+
+    def get_items(self, collection, user_id, ids):
+        return dict(self._row_to_item(row) for row in self._select_in('id', ids, collection, user_id))
+
+    def find_by_filename(self, collection, user_id, filenames):
+        found = {}
+        for row in self._select_in('filename', filenames, collection, user_id):
+            item = self._row_to_item(row)
+            found.setdefault(item[1]['filename'], []).append(item)
+        return found
+
+    def delete_items(self, collection, user_id, items, tombstone_days=None):
+        items = list(items)
+        conn = self._connection()
+        try:
+            with conn:
+                conn.executemany(
+                    "DELETE FROM items WHERE collection = ? AND user_id = ? AND id = ?",
+                    [(collection, user_id, item_id) for item_id, _ in items],
+                )
+                if tombstone_days is not None:
+                    deleted_at = self._now()
+                    now = _parse_timestamp(deleted_at)
+                    expire_at = _format_timestamp(now + datetime.timedelta(days=tombstone_days))
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO tombstones (collection, user_id, id, filename, category, deleted_at, expire_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [
+                            (collection, user_id, item_id, data.get('filename'), data.get('category'), deleted_at, expire_at)
+                            for item_id, data in items
+                        ],
+                    )
+                    # 沒有 TTL 政策，順便清除過期的 tombstone
+                    conn.execute("DELETE FROM tombstones WHERE expire_at < ?", (deleted_at,))
+        except sqlite3.Error as e:
+            return [str(e)] * len(items)
+        return [None] * len(items)
+
+    def changed_since(self, collection, user_id, since, category=None):
+        sql = f"SELECT {self._ITEM_COLUMNS} FROM items WHERE collection = ? AND user_id = ? AND timestamp > ?"
+        params = [collection, user_id, _format_timestamp(since)]
+        if category:
+            sql += " AND category = ?"
+            params.append(category)
+        return [self._row_to_item(row) for row in self._connection().execute(sql, params)]
+
+    def deleted_since(self, collection, user_id, since, category=None):
+        sql = "SELECT id FROM tombstones WHERE collection = ? AND user_id = ? AND deleted_at > ?"
+        params = [collection, user_id, _format_timestamp(since)]
+        if category:
+            sql += " AND category = ?"
+            params.append(category)
+        return [row['id'] for row in self._connection().execute(sql, params)]
+
+    def get_version(self, collection, user_id):
+        row = self._connection().execute(
+            "SELECT version FROM collection_versions WHERE collection = ? AND user_id = ?", (collection, user_id)
+        ).fetchone()
+        return row['version'] if row else 0
+
+    def bump_version(self, collection, user_id):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO collection_versions (collection, user_id, version) VALUES (?, ?, 1)"
+                " ON CONFLICT (collection, user_id) DO UPDATE SET version = version + 1",
+                (collection, user_id),
+            )
+
+    def get_resync_at(self, collection, user_id):
+        row = self._connection().execute(
+            "SELECT resync_at FROM collection_versions WHERE collection = ? AND user_id = ?", (collection, user_id)
+        ).fetchone()
+        return _parse_timestamp(row['resync_at']) if row else None
+
+    def get_dedupe(self, key):
+        row = self._connection().execute("SELECT blob FROM rembg_cache WHERE key = ?", (key,)).fetchone()
+        return row['blob'] if row else None
+
+    def set_dedupe(self, key, blob_name):
+        conn = self._connection()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO rembg_cache (key, blob) VALUES (?, ?)", (key, blob_name))
+
+    def delete_dedupe(self, key):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM rembg_cache WHERE key = ?", (key,))
+
+
+def create_item_store(backend: str, get_firestore_db: Callable = None, sqlite_path: str = DEFAULT_SQLITE_PATH,
+                      max_workers: int = 8) -> ItemStore:
+    """依 METADATA_BACKEND 建立存放層"""
+    if backend == "sqlite":
+        return SQLiteItemStore(sqlite_path)
+    if backend == "firestore":
+        return FirestoreItemStore(get_firestore_db, max_workers=max_workers)
+    raise ValueError(f"未知的 METADATA_BACKEND: {backend}")
@@ -0,0 +1,74 @@
+"""
+記憶體內的圖片緩衝 (zero-disk pipeline)
+
+Cloud Run 的 /tmp 是記憶體檔案系統，先寫暫存檔再讀回等於同一張圖在記憶體中放兩份。
+上傳、去背、GCS 上傳與 RunningHub 上傳都直接傳遞 bytes / memoryview / 檔案物件：
+- BufferReader 以檔案介面包裝既有緩衝區而不複製內容，供 GCS upload_from_file 使用
+- make_upload_stream 決定 multipart 上傳的暫存方式：預設全部留在記憶體，
+  設定門檻後超過門檻的檔案才溢寫到磁碟 (SpooledTemporaryFile)
+"""
+
+import io
+import tempfile
+
+
+def buffer_size(data) -> int:
+    """bytes-like 物件或可 seek 的檔案物件的位元組數"""
+    if hasattr(data, "read"):
+        position = data.tell()
+        size = data.seek(0, io.SEEK_END)
+        data.seek(position)
+        return size
+    return memoryview(data).nbytes
+
+
+class BufferReader(io.RawIOBase):
+    """以唯讀檔案介面包裝 bytes / bytearray / memoryview，讀取時才逐段複製"""
+
+    def __init__(self, data):
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = len(self._view) + offset
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+        if self._pos < 0:
+            raise ValueError("negative seek position")
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+
+def make_upload_stream(spool_threshold: int = 0):
+    """
+    建立接收上傳檔案的緩衝
+
+    Args:
+        spool_threshold: 超過此位元組數才寫到磁碟；0 表示永遠留在記憶體
+    """
+    if spool_threshold > 0:
+        return tempfile.SpooledTemporaryFile(max_size=spool_threshold)
+    return io.BytesIO()
@@ -0,0 +1,136 @@
+"""
+批次刪除 (GCS 與 Firestore)
+
+多選刪除原本逐一處理每個路徑：刪 blob、查詢文件、逐筆刪文件，N 個項目約 3N 次循序的網路往返。
+這裡把同類的操作合併並平行執行：
+- GCS：以 batch request 一次送出最多 100 個刪除；batch 中有任何失敗時，
+  改為平行逐一刪除該批，以取得每個 blob 的結果 (NotFound 視為已刪除)
+- Firestore：以 doc id 直接批次讀取 (get_all)；尚未遷移、doc id 不是 blob 名稱的舊文件
+  才以 'in' 查詢一次找出多個檔名的文件。寫入以 WriteBatch 合併 (每批最多 500 次寫入)
+"""
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+GCS_BATCH_LIMIT = 100
+FIRESTORE_IN_LIMIT = 30
+FIRESTORE_BATCH_LIMIT = 500
+FIRESTORE_GET_ALL_LIMIT = 100
+
+
+def chunked(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def parallel_map(fn: Callable, chunks: List, max_workers: int = 8) -> List:
+    """在執行緒池中對每個 chunk 呼叫 fn，依原順序回傳結果；只有一個 chunk 時直接在目前執行緒執行"""
+    if len(chunks) <= 1:
+        return [fn(chunk) for chunk in chunks]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+        return list(pool.map(fn, chunks))
+
+
+def delete_blobs(client, bucket_name: str, blob_names: List[str], max_workers: int = 8) -> Dict[str, Optional[str]]:
+    """
+    刪除多個 blob
+
+    Returns:
+        {blob 名稱: None (成功或原本就不存在) 或錯誤訊息}
+    """
+    from google.api_core import exceptions as gcloud_exceptions
+
+    bucket = client.bucket(bucket_name)
+    names = list(dict.fromkeys(blob_names))
+
+    def delete_one(name):
+        try:
+            bucket.blob(name).delete()
+        except gcloud_exceptions.NotFound:
+            pass
+        except Exception as e:
+            return str(e)
+        return None
+
+    def delete_chunk(chunk):
+        try:
+            with client.batch():
+                for name in chunk:
+                    bucket.blob(name).delete()
+            return {name: None for name in chunk}
+        except Exception as e:
+            # batch 只回報第一個失敗 (常見的是 NotFound)，改為逐一刪除以取得每個 blob 的結果
+            print(f"DEBUG: GCS batch delete of {len(chunk)} blobs failed ({e}), retrying individually.")
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(chunk))) as pool:
+                return dict(zip(chunk, pool.map(delete_one, chunk)))
+
+    results = {}
+    for chunk_results in parallel_map(delete_chunk, list(chunked(names, GCS_BATCH_LIMIT)), max_workers):
+        results.update(chunk_results)
+    for name, error in results.items():
+        if error:
+            print(f"WARN: Failed to delete GCS blob {name}: {error}", file=sys.stderr)
+    return results
+
+
+def get_docs_by_id(db, collection_ref, doc_ids: List[str], max_workers: int = 8) -> Dict[str, object]:
+    """
+    以 doc id 批次讀取文件
+
+    Returns:
+        {doc id: 文件快照 (不存在的文件不列入)}
+    """
+    def get_chunk(chunk):
+        return list(db.get_all([collection_ref.document(doc_id) for doc_id in chunk]))
+
+    found = {}
+    for docs in parallel_map(get_chunk, list(chunked(list(dict.fromkeys(doc_ids)), FIRESTORE_GET_ALL_LIMIT)), max_workers):
+        for doc in docs:
+            if doc.exists:
+                found[doc.id] = doc
+    return found
+
+
+def find_docs_by_field(collection_ref, field: str, values: List[str], max_workers: int = 8) -> Dict[str, List]:
+    """
+    以 'in' 查詢找出欄位值在 values 中的文件
+
+    Returns:
+        {欄位值: [文件快照, ...]}
+    """
+    found = {value: [] for value in values}
+
+    def query_chunk(chunk):
+        return list(collection_ref.where(field, 'in', chunk).stream())
+
+    for docs in parallel_map(query_chunk, list(chunked(list(found), FIRESTORE_IN_LIMIT)), max_workers):
+        for doc in docs:
+            found.setdefault(doc.get(field), []).append(doc)
+    return found
+
+
+def commit_in_batches(db, writes: List[Callable], writes_per_item: int = 1, max_workers: int = 8) -> List[Optional[str]]:
+    """
+    以 WriteBatch 提交寫入；writes 中的每個函式接收 batch 並加入 writes_per_item 次寫入
+
+    Returns:
+        與 writes 對應的錯誤訊息列表 (None 表示成功)
+    """
+    per_batch = max(1, FIRESTORE_BATCH_LIMIT // max(1, writes_per_item))
+
+    def commit_chunk(chunk):
+        batch = db.batch()
+        for write in chunk:
+            write(batch)
+        try:
+            batch.commit()
+        except Exception as e:
+            print(f"WARN: Firestore batch commit of {len(chunk)} items failed: {e}", file=sys.stderr)
+            return [str(e)] * len(chunk)
+        return [None] * len(chunk)
+
+    errors = []
+    for chunk_errors in parallel_map(commit_chunk, list(chunked(writes, per_batch)), max_workers):
+        errors.extend(chunk_errors)
+    return errors
@@ -0,0 +1,137 @@
+"""
+去背結果的內容定址快取 (content-addressed dedupe cache)
+
+以「輸入圖片 SHA-256 + 模型名稱」為鍵，對應到已存在 GCS 上的去背 PNG blob。
+- 第一層：行程內有上限的 LRU
+- 第二層：持久化索引 (預設為 Firestore collection)，跨實例、跨重啟共用
+命中時呼叫端可直接重用既有 blob，完全跳過 u2net 推論。
+"""
+
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+
+def make_dedupe_key(input_bytes: bytes, model_name: str) -> str:
+    """產生快取鍵：<model>_<sha256(input)>"""
+    digest = hashlib.sha256(input_bytes).hexdigest()
+    return f"{model_name}_{digest}"
+
+
+class FirestoreDedupeIndex:
+    """以 Firestore collection 作為持久層，doc id 即快取鍵"""
+
+    def __init__(self, get_db: Callable, collection: str = "rembg_cache"):
+        self._get_db = get_db
+        self.collection = collection
+
+    def _doc(self, key: str):
+        return self._get_db().collection(self.collection).document(key)
+
+    def get(self, key: str) -> Optional[str]:
+        snapshot = self._doc(key).get()
+        if not snapshot.exists:
+            return None
+        return (snapshot.to_dict() or {}).get("blob")
+
+    def set(self, key: str, blob_name: str):
+        self._doc(key).set({"blob": blob_name})
+
+    def delete(self, key: str):
+        self._doc(key).delete()
+
+
+class RembgDedupeCache:
+    """兩層式去背結果索引，並記錄命中 / 未命中次數"""
+
+    def __init__(self, max_entries: int = 1024, persistent=None):
+        self.max_entries = max(0, max_entries)
+        self.persistent = persistent
+        self._lru: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "persistent_errors": 0,
+        }
+
+    def _remember(self, key: str, blob_name: str):
+        # 呼叫端需持有 self._lock
+        if self.max_entries == 0:
+            return
+        self._lru[key] = blob_name
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def lookup(self, key: str) -> Optional[str]:
+        """回傳已存在的 blob 名稱，未命中則回傳 None"""
+        with self._lock:
+            blob_name = self._lru.get(key)
+            if blob_name is not None:
+                self._lru.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return blob_name
+
+        blob_name = None
+        if self.persistent is not None:
+            try:
+                blob_name = self.persistent.get(key)
+            except Exception as e:
+                print(f"WARN: Dedupe persistent lookup failed for {key}: {e}", file=sys.stderr)
+                with self._lock:
+                    self._counters["persistent_errors"] += 1
+
+        with self._lock:
+            if blob_name:
+                self._counters["persistent_hits"] += 1
+                self._remember(key, blob_name)
+            else:
+                self._counters["misses"] += 1
+        return blob_name
+
+    def store(self, key: str, blob_name: str):
+        with self._lock:
+            self._remember(key, blob_name)
+        if self.persistent is not None:
+            try:
+                self.persistent.set(key, blob_name)
+            except Exception as e:
+                print(f"WARN: Dedupe persistent store failed for {key}: {e}", file=sys.stderr)
+                with self._lock:
+                    self._counters["persistent_errors"] += 1
+
+    def invalidate(self, key: str):
+        """快取指向的 blob 已不存在時呼叫 (例如已被刪除)"""
+        with self._lock:
+            self._lru.pop(key, None)
+            self._counters["stale"] += 1
+        if self.persistent is not None:
+            try:
+                self.persistent.delete(key)
+            except Exception as e:
+                print(f"WARN: Dedupe persistent invalidate failed for {key}: {e}", file=sys.stderr)
+
+    def forget_blob(self, blob_name: str):
+        """刪除 blob 時清掉行程內指向它的項目；持久層則在下次命中時延遲失效"""
+        with self._lock:
+            for key in [k for k, v in self._lru.items() if v == blob_name]:
+                del self._lru[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._lru)
+        hits = counters["memory_hits"] + counters["persistent_hits"]
+        lookups = hits + counters["misses"]
+        counters.update({
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "lru_size": size,
+            "lru_capacity": self.max_entries,
+        })
+        return counters
@@ -0,0 +1,61 @@
+"""
+去背結果的多解析度衍生圖 (thumbnail / medium / full)
+
+衣櫃列表只以 150px 顯示，卻下載完整解析度的去背 PNG。上傳時另外產生
+有 alpha 的 WebP 縮圖，blob 名稱以固定規則由原圖推導：
+  <原圖 stem>__<size>.webp   例如 abcd_rembg.png → abcd_rembg__thumb.webp
+列表 API 依 size 參數回傳對應的衍生圖；舊資料沒有衍生圖時退回原圖。
+"""
+
+import os
+import re
+from io import BytesIO
+from typing import Dict
+
+DEFAULT_SIZES = {"thumb": 320, "medium": 1024}
+DEFAULT_WEBP_QUALITY = 80
+FULL_SIZE = "full"
+
+_DERIVATIVE_PATTERN = re.compile(r"^(?P<stem>.+)__(?P<size>[a-z]+)\.webp$")
+
+
+def derivative_blob_name(blob_name: str, size_name: str) -> str:
+    stem = os.path.splitext(blob_name)[0]
+    return f"{stem}__{size_name}.webp"
+
+
+def source_blob_name(blob_name: str) -> str:
+    """衍生圖 blob 名稱 → 原圖 blob 名稱；不是衍生圖時原樣回傳"""
+    match = _DERIVATIVE_PATTERN.match(blob_name)
+    return f"{match.group('stem')}.png" if match else blob_name
+
+
+def make_derivatives(png_bytes: bytes, sizes: Dict[str, int] = None,
+                     quality: int = DEFAULT_WEBP_QUALITY) -> Dict[str, bytes]:
+    """
+    由去背 PNG 產生各尺寸的 WebP (保留 alpha)
+
+    Args:
+        png_bytes: 去背後的 PNG
+        sizes: {尺寸名稱: 長邊上限}
+        quality: WebP 品質 (0-100)
+    Returns:
+        {尺寸名稱: WebP bytes}
+    """
+    from PIL import Image
+
+    sizes = DEFAULT_SIZES if sizes is None else sizes
+    img = Image.open(BytesIO(png_bytes))
+    img.load()
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+
+    derivatives = {}
+    # 由大到小依序縮小，較小的尺寸以前一張為來源，減少重複縮放的成本
+    for name, max_size in sorted(sizes.items(), key=lambda item: -item[1]):
+        img = img.copy()
+        img.thumbnail((max_size, max_size), Image.LANCZOS)
+        output = BytesIO()
+        img.save(output, format="WEBP", quality=quality, method=4)
+        derivatives[name] = output.getvalue()
+    return derivatives
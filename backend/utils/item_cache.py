@@ -0,0 +1,118 @@
+"""
+每位使用者衣物 metadata 的行程內 read-through 快取
+
+列表 API 每次都查詢 Firestore，且每個類別各自一次查詢。這裡快取使用者整個 items
+collection (新到舊排序)，類別篩選與分頁都在記憶體中完成：
+- 每個項目記錄載入時的版本號 (backend/utils/versions.py)，版本改變 (任何實例的寫入) 即重新載入
+- TTL 到期也會重新載入，作為版本號讀取失敗時的保險
+- 以總項目數作為記憶體上限，超過時淘汰最久未使用的使用者；單一使用者超過上限則不快取項目，
+  只記錄「超過上限」的標記 (同樣以版本號與 TTL 失效)，之後的請求直接分頁查詢，不再每次探測整個 collection
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+Item = Tuple[str, Dict]
+
+
+class UserItemCache:
+    def __init__(self, ttl_seconds: float = 300, max_items: int = 50000, max_items_per_user: int = 1000,
+                 clock: Callable = time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max(0, max_items)
+        self.max_items_per_user = max(0, max_items_per_user)
+        self._clock = clock
+        # (collection, user_id) → (版本號, 載入時間, [(doc id, 資料), ...] 或 None (超過單一使用者上限的標記))
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Optional[int], float, Optional[List[Item]]]]" = OrderedDict()
+        self._total_items = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "expired": 0,
+            "oversized": 0,
+            "oversized_hits": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    @staticmethod
+    def _size(items: Optional[List[Item]]) -> int:
+        # 超過上限的標記也佔一個名額，避免標記本身無限增長
+        return len(items) if items is not None else 1
+
+    def _drop(self, key):
+        # 呼叫端需持有 self._lock
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_items -= self._size(entry[2])
+        return entry
+
+    def _store(self, key, version: int, now: float, items: Optional[List[Item]]):
+        # 呼叫端需持有 self._lock
+        self._drop(key)
+        self._entries[key] = (version, now, items)
+        self._total_items += self._size(items)
+        while self._total_items > self.max_items:
+            evicted_key = next(iter(self._entries))
+            self._drop(evicted_key)
+            self._counters["evictions"] += 1
+
+    def get(self, collection: str, user_id: str, version: Optional[int],
+            loader: Callable[[], Optional[List[Item]]]) -> Optional[List[Item]]:
+        """
+        回傳使用者的全部項目；未命中時呼叫 loader 載入
+        loader 回傳 None 表示項目超過單一使用者上限，呼叫端應改為直接分頁查詢；
+        同一版本號下之後的呼叫直接回傳 None，不再呼叫 loader
+        """
+        key = (collection, user_id)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                cached_version, loaded_at, items = entry
+                if version is None or cached_version != version:
+                    self._counters["stale"] += 1
+                    self._drop(key)
+                elif now - loaded_at >= self.ttl_seconds:
+                    self._counters["expired"] += 1
+                    self._drop(key)
+                else:
+                    self._entries.move_to_end(key)
+                    self._counters["oversized_hits" if items is None else "hits"] += 1
+                    return items
+            self._counters["misses"] += 1
+
+        items = loader()
+        if items is None:
+            with self._lock:
+                self._counters["oversized"] += 1
+                if version is not None and self.max_items > 0:
+                    self._store(key, version, now, None)
+            return None
+        if version is None or self.max_items == 0 or len(items) > self.max_items:
+            return items
+
+        with self._lock:
+            self._store(key, version, now, items)
+        return items
+
+    def invalidate(self, collection: str, user_id: str):
+        with self._lock:
+            if self._drop((collection, user_id)) is not None:
+                self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+            counters.update({"users": len(self._entries), "items": self._total_items})
+        lookups = counters["hits"] + counters["misses"]
+        counters.update({
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            "capacity_items": self.max_items,
+            "max_items_per_user": self.max_items_per_user,
+        })
+        return counters
@@ -0,0 +1,236 @@
+"""
+背景工作佇列 (in-process job queue)
+
+讓耗時的請求 (去背 + GCS + Firestore + 簽名) 不必佔住 gunicorn 執行緒：
+路由送出工作後立即回傳 job id，由固定數量的背景執行緒依序處理，
+呼叫端再以 job id 查詢狀態與結果。
+
+工作函式可以回傳 Deferred(future, then)：等待外部事件 (例如 RunningHub 任務完成) 時
+工作進入 "waiting" 狀態並釋放背景執行緒，future 完成後再由續行執行緒呼叫 then 完成工作。
+
+注意：工作狀態只存在於目前的行程中，查詢必須打到同一個實例。
+"""
+
+import queue
+import sys
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+
+class JobQueueFull(Exception):
+    """佇列已滿，呼叫端應回傳 503 讓客戶端稍後重試"""
+
+
+class StageTimer:
+    """記錄各處理階段的耗時 (秒)"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def as_ms(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+
+
+class Deferred:
+    """
+    工作函式的回傳值：future 完成後以 then(timer, future.result()) 的回傳值作為工作結果
+
+    等待期間不佔用背景執行緒；future 以例外結束時工作失敗。
+    """
+
+    def __init__(self, future: Future, then: Callable):
+        self.future = future
+        self.then = then
+
+
+class Job:
+    def __init__(self, kind: str, fn: Callable, args: tuple, kwargs: dict):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.timer = StageTimer()
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+
+    def to_dict(self) -> Dict:
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timings_ms": self.timer.as_ms(),
+        }
+        if self.result is not None:
+            data["result"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+class JobManager:
+    """
+    固定大小的背景執行緒池 + 有上限的佇列
+
+    Args:
+        name: 名稱 (用於日誌與統計)
+        workers: 背景執行緒數
+        max_queue: 等待中工作的上限，超過時 submit 會丟出 JobQueueFull
+        retention_seconds: 已完成工作保留多久供查詢
+    """
+
+    def __init__(self, name: str, workers: int = 2, max_queue: int = 32, retention_seconds: int = 3600):
+        self.name = name
+        self.workers = max(1, workers)
+        self.retention_seconds = retention_seconds
+        self._queue: "queue.Queue[Job]" = queue.Queue(maxsize=max(1, max_queue))
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+        self._waiting = 0
+        self._resume_executor = None
+        self._completed = {"succeeded": 0, "failed": 0}
+        self._stage_totals: Dict[str, float] = {}
+        self._stage_counts: Dict[str, int] = {}
+
+    def _ensure_started(self):
+        # 延遲到第一次送出工作時才啟動執行緒，避免在 import 階段 (例如 gunicorn fork 前) 建立執行緒
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"{self.name}-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Job:
+        """
+        送出工作；fn 會以 fn(timer, *args, **kwargs) 呼叫，回傳值即為工作結果
+        """
+        self._ensure_started()
+        self._prune()
+        job = Job(self.name, fn, args, kwargs)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise JobQueueFull(f"{self.name} queue is full ({self._queue.maxsize})")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            job.started_at = time.time()
+            job.timer.record("queue_wait", job.started_at - job.created_at)
+            try:
+                self._execute(job, job._fn, *job._args, **job._kwargs)
+            finally:
+                self._queue.task_done()
+
+    def _execute(self, job: Job, fn: Callable, *args, **kwargs):
+        job.status = "running"
+        with self._lock:
+            self._running += 1
+        try:
+            result = fn(job.timer, *args, **kwargs)
+            if isinstance(result, Deferred):
+                self._defer(job, result)
+                return
+            job.result = result
+            job.status = "succeeded"
+        except Exception as e:
+            print(f"ERROR: {self.name} job {job.id} failed: {e}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            with self._lock:
+                self._running -= 1
+        self._finish(job)
+
+    def _defer(self, job: Job, deferred: Deferred):
+        # 釋放輸入資料 (例如圖片 bytes)；等待期間不佔用背景執行緒
+        job._args = ()
+        job._kwargs = {}
+        job.status = "waiting"
+        waiting_since = time.perf_counter()
+        with self._lock:
+            self._waiting += 1
+            if self._resume_executor is None:
+                self._resume_executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{self.name}-resume")
+
+        def resume(future):
+            job.timer.record("deferred_wait", time.perf_counter() - waiting_since)
+            with self._lock:
+                self._waiting -= 1
+            # future 的回呼在完成它的執行緒中執行 (例如輪詢器)，續行工作交給續行執行緒
+            self._resume_executor.submit(self._execute, job, lambda timer: deferred.then(timer, future.result()))
+
+        deferred.future.add_done_callback(resume)
+
+    def _finish(self, job: Job):
+        job.finished_at = time.time()
+        # 釋放輸入資料 (例如圖片 bytes)，只保留結果供查詢
+        job._args = ()
+        job._kwargs = {}
+        with self._lock:
+            self._completed[job.status] += 1
+            for stage, seconds in job.timer.stages.items():
+                self._stage_totals[stage] = self._stage_totals.get(stage, 0.0) + seconds
+                self._stage_counts[stage] = self._stage_counts.get(stage, 0) + 1
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "running": self._running,
+                "waiting": self._waiting,
+                "tracked_jobs": len(self._jobs),
+                "succeeded": self._completed["succeeded"],
+                "failed": self._completed["failed"],
+                "stage_avg_ms": {
+                    stage: round(total / self._stage_counts[stage] * 1000, 1)
+                    for stage, total in self._stage_totals.items()
+                },
+            }
@@ -0,0 +1,202 @@
+"""
+多行程去背執行器 (process pool)
+
+u2net 推論本身由 ONNX Runtime 執行，但前後處理 (解碼、縮放、alpha 合成、PNG 編碼)
+都在 Python / PIL 中，多個請求執行緒同時去背時會互搶 GIL。
+這裡把整段去背交給一組常駐的 worker 行程，每個行程各自持有已載入模型的 session。
+
+圖片資料以 multiprocessing.shared_memory 傳遞：主行程把輸入寫進共享記憶體，
+worker 直接從共享記憶體解碼，輸出 PNG 也寫進 worker 建立的共享記憶體，
+避免把整張圖片 pickle 後經由 pipe 來回複製。
+"""
+
+import atexit
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import replace
+from multiprocessing import shared_memory
+from typing import Optional
+
+from backend.utils.sessions import SessionConfig, SessionRegistry, model_home
+
+# --- worker 行程內的狀態 ---
+_worker_registry: Optional[SessionRegistry] = None
+_worker_threads = 0
+_worker_options = {}
+
+
+def _worker_config(config: SessionConfig) -> SessionConfig:
+    # 未指定執行緒數時套用 worker 的配額，避免多個 worker 互相超額訂閱 CPU
+    if _worker_threads and not config.intra_op_threads:
+        return replace(config, intra_op_threads=_worker_threads)
+    return config
+
+
+def _init_worker(default_config: SessionConfig, threads: int, options: dict):
+    """worker 啟動時載入預設模型，之後的工作都重用同一個 session"""
+    global _worker_registry, _worker_threads, _worker_options
+    os.environ.setdefault('XDG_CACHE_HOME', '/tmp')
+    _worker_registry = SessionRegistry(default_config, model_dir=model_home())
+    _worker_threads = threads
+    _worker_options = options
+    _worker_registry.warm_up(_worker_config(default_config))
+    print(f"DEBUG: Rembg pool worker {os.getpid()} ready (model={default_config.model}, threads={threads}).")
+
+
+def _remove_in_worker(input_name: str, input_size: int, config: SessionConfig):
+    """在 worker 中去背；回傳 (輸出共享記憶體名稱, 輸出大小)"""
+    from backend.utils import segmentation
+
+    session = _worker_registry.get(_worker_config(config))
+    shm_in = shared_memory.SharedMemory(name=input_name)
+    try:
+        output_bytes = segmentation.remove_background(
+            bytes(shm_in.buf[:input_size]), session, **_worker_options
+        )
+    finally:
+        shm_in.close()
+
+    shm_out = shared_memory.SharedMemory(create=True, size=max(1, len(output_bytes)))
+    try:
+        shm_out.buf[:len(output_bytes)] = output_bytes
+    finally:
+        # 只關閉本行程的映射，由主行程讀取後 unlink
+        shm_out.close()
+    return shm_out.name, len(output_bytes)
+
+
+def _read_and_unlink(name: str, size: int) -> bytes:
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:size])
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+class RembgProcessPool:
+    """
+    Args:
+        size: worker 行程數
+        default_config: worker 啟動時預先載入的 session 設定
+        threads_per_worker: 每個 worker 的 ONNX Runtime 執行緒數 (0 表示依 CPU 數平均分配)
+        **options: 傳給 segmentation.remove_background 的參數 (working_size、max_output_size 等)
+    """
+
+    def __init__(self, size: int, default_config: Optional[SessionConfig] = None,
+                 threads_per_worker: int = 0, **options):
+        self.size = max(1, size)
+        self.default_config = default_config or SessionConfig()
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.size)
+        self.options = options
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "restarts": 0}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # 使用 spawn：gunicorn 的請求執行緒仍在運作時 fork 並不安全
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.size,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.default_config, self.threads_per_worker, self.options),
+                )
+                print(f"DEBUG: Rembg process pool started with {self.size} workers.")
+            return self._executor
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _reset_executor(self, broken: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+                self._counters["restarts"] += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def warm_up(self):
+        """預先啟動所有 worker (各自載入模型)"""
+        executor = self._get_executor()
+        for future in [executor.submit(os.getpid) for _ in range(self.size)]:
+            future.result()
+
+    def submit(self, input_image_bytes: bytes, config: Optional[SessionConfig] = None) -> Future:
+        """送出一張圖片，回傳結果為 PNG bytes 的 Future"""
+        config = config or self.default_config
+        shm_in = shared_memory.SharedMemory(create=True, size=max(1, len(input_image_bytes)))
+        shm_in.buf[:len(input_image_bytes)] = input_image_bytes
+        result: Future = Future()
+
+        def on_done(inner: Future):
+            try:
+                output_name, output_size = inner.result()
+                result.set_result(_read_and_unlink(output_name, output_size))
+                self._count("completed")
+            except BrokenProcessPool as e:
+                print(f"ERROR: Rembg process pool broken, restarting: {e}", file=sys.stderr)
+                self._reset_executor(executor)
+                self._count("failed")
+                result.set_exception(e)
+            except BaseException as e:
+                self._count("failed")
+                result.set_exception(e)
+            finally:
+                shm_in.close()
+                shm_in.unlink()
+
+        try:
+            executor = self._get_executor()
+            try:
+                inner = executor.submit(_remove_in_worker, shm_in.name, len(input_image_bytes), config)
+            except BrokenProcessPool:
+                # 重建行程池後重試一次；重試仍失敗時由外層釋放共享記憶體
+                self._reset_executor(executor)
+                executor = self._get_executor()
+                inner = executor.submit(_remove_in_worker, shm_in.name, len(input_image_bytes), config)
+        except BaseException:
+            shm_in.close()
+            shm_in.unlink()
+            raise
+        self._count("submitted")
+        inner.add_done_callback(on_done)
+        return result
+
+    def remove(self, input_image_bytes: bytes, config: Optional[SessionConfig] = None) -> bytes:
+        return self.submit(input_image_bytes, config).result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update({
+            "size": self.size,
+            "threads_per_worker": self.threads_per_worker,
+            "inflight": counters["submitted"] - counters["completed"] - counters["failed"],
+        })
+        return counters
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+_pool_instance: Optional[RembgProcessPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_rembg_pool(size: int, default_config: Optional[SessionConfig] = None, **options) -> RembgProcessPool:
+    """取得 (必要時建立) 行程共用的 RembgProcessPool"""
+    global _pool_instance
+    with _pool_lock:
+        if _pool_instance is None:
+            _pool_instance = RembgProcessPool(size, default_config, **options)
+            atexit.register(_pool_instance.shutdown)
+        return _pool_instance
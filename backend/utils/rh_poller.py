@@ -0,0 +1,330 @@
+"""
+RunningHub 任務輪詢器 (shared task poller)
+
+原本每個姿勢矯正任務各自在 wait_for_completion 中 while + time.sleep(2) 查詢狀態，
+N 個進行中的任務就有 N 個睡眠中的執行緒，各自對 RunningHub 發出請求。
+這裡改為單一排程執行緒追蹤所有進行中的 task id：
+- 以 min-heap 依「下次查詢時間」排序，只在有任務到期時醒來
+- 所有查詢共用同一個 session (連線池)，由少量執行緒送出，並受全域速率上限 (每秒請求數) 限制
+- 查詢間隔由 PollPolicy 依目前狀態與各工作流的歷史耗時決定 (見下方說明)
+- 任務結束 (SUCCESS / FAILED) 或超過等待上限時完成對應的 Future；
+  呼叫端以 future.result() 等待，或以 future.add_done_callback 註冊回呼
+- 回呼模式：建立任務時登記 webhook，收到完成通知後以 complete(task_id, status) 立即完成 Future；
+  這類任務 watch 時指定 fallback_interval，只以低頻率輪詢作為漏接通知時的備援
+
+注意：追蹤狀態只存在於目前的行程中；送到其他實例的 webhook 找不到任務，由備援輪詢完成。
+"""
+
+import heapq
+import itertools
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+QUEUED = "QUEUED"
+RUNNING = "RUNNING"
+SUCCESS = "SUCCESS"
+FAILED = "FAILED"
+TIMEOUT = "TIMEOUT"
+TERMINAL_STATUSES = (SUCCESS, FAILED)
+
+
+class RateLimiter:
+    """Token bucket：平均每秒最多 rate 次，允許 burst 次的瞬間突發"""
+
+    def __init__(self, rate: float, burst: int = 1, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        取得一個 token
+
+        Returns:
+            需要等待的秒數 (0 表示可立即送出)；rate <= 0 表示不限速
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class _Tracked:
+    def __init__(self, task_id: str, workflow: str, deadline: float, started_at: float):
+        self.task_id = task_id
+        self.workflow = workflow
+        self.deadline = deadline
+        self.started_at = started_at
+        self.future: Future = Future()
+        self.checks = 0
+        self.last_status: Optional[str] = None
+        self.status_since = started_at
+        self.status_checks = 0
+        self.last_check_at = started_at
+        self.running_seen_at: Optional[float] = None
+        self.fallback_interval: Optional[float] = None
+
+
+class PollPolicy:
+    """
+    依任務狀態與歷史耗時決定下次查詢的間隔
+
+    - QUEUED / 查詢失敗：從 base_interval 開始，每次查詢乘以 backoff，最多 max_interval
+      (排隊時間取決於 RunningHub 的負載，早點查詢也不會更快)
+    - RUNNING 且已有該工作流的耗時估計：距離預估完成還久時睡剩餘時間的一半 (逐步逼近)，
+      接近或超過預估時改為 min_interval，讓完成後盡快被發現；超過預估越久再逐步放寬到 base_interval
+    - RUNNING 但尚無估計：固定 base_interval
+
+    耗時估計以 EWMA 從已完成的任務學習：從第一次看到 RUNNING 到偵測完成 (取最後兩次查詢的中點)。
+    """
+
+    def __init__(self, min_interval: float = 1.0, base_interval: float = 2.0, max_interval: float = 15.0,
+                 backoff: float = 1.5, alpha: float = 0.3):
+        self.min_interval = min_interval
+        self.base_interval = max(min_interval, base_interval)
+        self.max_interval = max(self.base_interval, max_interval)
+        self.backoff = max(1.0, backoff)
+        self.alpha = alpha
+        self._estimates: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def estimate(self, workflow: str) -> Optional[float]:
+        """該工作流從 RUNNING 到完成的預估秒數 (尚無樣本時為 None)"""
+        with self._lock:
+            entry = self._estimates.get(workflow)
+            return entry["running_s"] if entry and entry["running_s"] is not None else None
+
+    def next_delay(self, tracked: _Tracked, status: Optional[str], now: float) -> float:
+        if status == RUNNING:
+            expected = self.estimate(tracked.workflow)
+            if expected is None:
+                return self.base_interval
+            expected = max(expected, self.min_interval)
+            remaining = expected - (now - tracked.running_seen_at)
+            if remaining > 2 * self.base_interval:
+                return min(self.max_interval, remaining / 2)
+            if remaining > -expected:
+                return self.min_interval
+            # 已遠超過預估 (例如該次輸入特別大)，逐步放寬避免持續高頻查詢
+            return min(self.base_interval, self.min_interval * (1 + (-remaining - expected) / expected))
+        # QUEUED、未知狀態或查詢失敗：指數退避
+        return min(self.max_interval, self.base_interval * self.backoff ** max(0, tracked.status_checks - 1))
+
+    def learn(self, tracked: _Tracked, finished_at: float):
+        """以成功完成的任務更新工作流的耗時估計"""
+        total = finished_at - tracked.started_at
+        running = finished_at - tracked.running_seen_at if tracked.running_seen_at is not None else None
+        with self._lock:
+            entry = self._estimates.setdefault(tracked.workflow, {"samples": 0, "total_s": None, "running_s": None})
+            entry["samples"] += 1
+            for key, value in (("total_s", total), ("running_s", running)):
+                if value is None:
+                    continue
+                previous = entry[key]
+                entry[key] = value if previous is None else previous + self.alpha * (value - previous)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                workflow: {key: round(value, 1) if isinstance(value, float) else value for key, value in entry.items()}
+                for workflow, entry in self._estimates.items()
+            }
+
+
+class TaskPoller:
+    """
+    追蹤所有進行中的 RunningHub 任務並依 PollPolicy 查詢狀態
+
+    Args:
+        check_status: 查詢單一任務狀態的函式 task_id -> 狀態字串 (QUEUED / RUNNING / SUCCESS / FAILED) 或 None (查詢失敗)
+        policy: 查詢間隔策略 (預設為 PollPolicy())
+        max_requests_per_second: 對 RunningHub 的全域查詢速率上限 (0 表示不限)
+        workers: 同時送出查詢的執行緒數 (共用同一個 session)
+        name: 名稱 (用於日誌與執行緒名稱)
+    """
+
+    def __init__(self, check_status: Callable[[str], Optional[str]], policy: Optional[PollPolicy] = None,
+                 max_requests_per_second: float = 5.0, workers: int = 2, name: str = "runninghub",
+                 clock: Callable[[], float] = time.monotonic):
+        self.check_status = check_status
+        self.policy = policy or PollPolicy()
+        self.workers = max(1, workers)
+        self.name = name
+        self._clock = clock
+        self._limiter = RateLimiter(max_requests_per_second, burst=self.workers, clock=clock)
+        self._tasks: Dict[str, _Tracked] = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._executor = None
+        self._stats = {"checks": 0, "check_errors": 0, "succeeded": 0, "failed": 0, "timed_out": 0,
+                       "webhook_completions": 0, "webhook_unmatched": 0, "throttled_seconds": 0.0}
+        self._checks_by_status: Dict[str, int] = {}
+        # 偵測延遲上限：任務完成的時間點落在最後兩次查詢之間，最多晚了這段間隔才被發現
+        self._lag = {"count": 0, "total_s": 0.0, "max_s": 0.0}
+        self._completed_checks = 0
+
+    def _ensure_started(self):
+        # 延遲到第一次追蹤任務時才啟動執行緒，避免在 import 階段 (例如 gunicorn fork 前) 建立執行緒
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{self.name}-poll")
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-poller", daemon=True)
+            self._thread.start()
+
+    def watch(self, task_id: str, timeout: float = 300, workflow: str = "default",
+              fallback_interval: Optional[float] = None) -> Future:
+        """
+        開始追蹤任務；同一 task id 重複追蹤時回傳同一個 Future
+
+        Args:
+            workflow: 工作流 id，耗時估計以工作流為單位學習
+            fallback_interval: 已登記 webhook 的任務以固定的低頻率輪詢 (秒)，不使用 PollPolicy
+
+        Returns:
+            Future，結果為最終狀態：SUCCESS、FAILED 或 TIMEOUT (超過 timeout 秒仍未結束)
+        """
+        self._ensure_started()
+        with self._cond:
+            tracked = self._tasks.get(task_id)
+            if tracked is not None:
+                return tracked.future
+            now = self._clock()
+            tracked = _Tracked(task_id, workflow or "default", now + timeout, now)
+            tracked.fallback_interval = fallback_interval
+            self._tasks[task_id] = tracked
+            # 剛建立的任務不會立即完成，第一次查詢延後一個基本間隔
+            first_delay = fallback_interval or self.policy.base_interval
+            heapq.heappush(self._heap, (min(now + first_delay, tracked.deadline), next(self._seq), task_id))
+            self._cond.notify()
+        return tracked.future
+
+    def complete(self, task_id: str, status: str) -> bool:
+        """
+        收到完成通知 (webhook) 時立即完成任務的 Future
+
+        Returns:
+            是否有對應的任務 (False 表示任務不在此行程中或已經完成)
+        """
+        status = status if status in TERMINAL_STATUSES else FAILED
+        with self._cond:
+            tracked = self._tasks.pop(task_id, None)
+            if tracked is None:
+                self._stats["webhook_unmatched"] += 1
+                return False
+            now = self._clock()
+            self._stats["webhook_completions"] += 1
+            self._stats["succeeded" if status == SUCCESS else "failed"] += 1
+            if status == SUCCESS:
+                self.policy.learn(tracked, now)
+            # heap 中殘留的查詢項目會在到期時因找不到任務而略過
+        print(f"DEBUG: {self.name} task {tracked.task_id} is {status} via webhook "
+              f"(after {now - tracked.started_at:.1f}s, {tracked.checks} checks)")
+        tracked.future.set_result(status)
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due_at, _, task_id = self._heap[0]
+                delay = due_at - self._clock()
+                if delay > 0:
+                    # 有新任務加入時會被喚醒並重新檢查最早到期的任務
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                tracked = self._tasks.get(task_id)
+            if tracked is None:
+                continue
+
+            wait = self._limiter.reserve()
+            if wait > 0:
+                with self._cond:
+                    self._stats["throttled_seconds"] += wait
+                time.sleep(wait)
+            self._executor.submit(self._check, tracked)
+
+    def _check(self, tracked: _Tracked):
+        try:
+            status = self.check_status(tracked.task_id)
+        except Exception as e:
+            print(f"WARN: {self.name} status check for task {tracked.task_id} failed: {e}", file=sys.stderr)
+            status = None
+        now = self._clock()
+        with self._cond:
+            if self._tasks.get(tracked.task_id) is not tracked:
+                # 查詢期間已由 webhook 完成
+                return
+            self._stats["checks"] += 1
+            self._checks_by_status[status or "ERROR"] = self._checks_by_status.get(status or "ERROR", 0) + 1
+            tracked.checks += 1
+            if status is None:
+                self._stats["check_errors"] += 1
+            elif status != tracked.last_status:
+                print(f"DEBUG: {self.name} task {tracked.task_id} is {status} "
+                      f"(after {now - tracked.started_at:.1f}s, {tracked.checks} checks)")
+                tracked.last_status = status
+                tracked.status_since = now
+                tracked.status_checks = 0
+                if status == RUNNING:
+                    tracked.running_seen_at = now
+            tracked.status_checks += 1
+            previous_check_at, tracked.last_check_at = tracked.last_check_at, now
+
+            if status in TERMINAL_STATUSES:
+                final = status
+                lag = now - previous_check_at
+                self._lag["count"] += 1
+                self._lag["total_s"] += lag
+                self._lag["max_s"] = max(self._lag["max_s"], lag)
+                self._completed_checks += tracked.checks
+                if status == SUCCESS:
+                    self.policy.learn(tracked, (previous_check_at + now) / 2)
+            elif now >= tracked.deadline:
+                final = TIMEOUT
+            else:
+                delay = tracked.fallback_interval or self.policy.next_delay(tracked, status, now)
+                heapq.heappush(self._heap, (min(now + delay, tracked.deadline), next(self._seq), tracked.task_id))
+                self._cond.notify()
+                return
+            del self._tasks[tracked.task_id]
+            self._stats[{SUCCESS: "succeeded", FAILED: "failed", TIMEOUT: "timed_out"}[final]] += 1
+
+        if final == TIMEOUT:
+            print(f"WARN: {self.name} task {tracked.task_id} did not finish within "
+                  f"{tracked.deadline - tracked.started_at:.0f}s (last status {tracked.last_status}).", file=sys.stderr)
+        # 在鎖外完成 Future，回呼中可以再呼叫 watch
+        tracked.future.set_result(final)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["throttled_seconds"] = round(stats["throttled_seconds"], 1)
+            stats["in_flight"] = len(self._tasks)
+            stats["checks_by_status"] = dict(self._checks_by_status)
+            completed = self._lag["count"]
+            stats["checks_per_task"] = round(self._completed_checks / completed, 1) if completed else None
+            stats["detection_lag_s"] = {
+                # 平均延遲約為上限的一半 (完成時間在兩次查詢之間均勻分布)
+                "avg_bound": round(self._lag["total_s"] / completed, 2) if completed else None,
+                "max_bound": round(self._lag["max_s"], 2),
+            }
+            stats["max_requests_per_second"] = self._limiter.rate
+        stats["workflow_estimates"] = self.policy.stats()
+        return stats
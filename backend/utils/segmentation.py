@@ -0,0 +1,95 @@
+"""
+去背前處理 (resolution-aware ingestion)
+
+手機照片常為 12MP 以上，但 u2net 內部只以 320x320 推論。直接把原圖丟進
+rembg.remove 會讓解碼、縮放與 alpha 合成佔掉大部分 CPU 與記憶體。
+這裡的流程：
+1. 解碼時利用 JPEG draft 模式直接以較小尺寸解碼，並依 EXIF 修正方向
+2. 將輸出圖限制在 max_output_size 內
+3. 以 working_size 的縮圖推論出 mask，再把 mask 放大套用到輸出圖
+"""
+
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# rembg 會連帶匯入 onnxruntime / scipy 等大型套件，延遲到第一次推論時才匯入以縮短冷啟動
+
+DEFAULT_WORKING_SIZE = 1024
+DEFAULT_MAX_OUTPUT_SIZE = 2048
+DEFAULT_PNG_COMPRESS_LEVEL = 6
+
+
+def load_oriented_image(image_bytes: bytes, max_size: int = 0) -> Image.Image:
+    """
+    解碼圖片並依 EXIF 修正方向
+
+    Args:
+        image_bytes: 原始圖片內容
+        max_size: 長邊上限 (0 表示不限制)；JPEG 會直接以縮小比例解碼
+    Returns:
+        RGB 或 RGBA 的 PIL Image
+    """
+    img = Image.open(BytesIO(image_bytes))
+    if max_size:
+        # draft 只對 JPEG 有效，會選擇不小於要求尺寸的 1/2、1/4、1/8 解碼比例
+        img.draft("RGB", (max_size, max_size))
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+    if max_size and max(img.size) > max_size:
+        img.thumbnail((max_size, max_size), Image.LANCZOS)
+    return img
+
+
+def encode_png(img: Image.Image, compress_level: int = DEFAULT_PNG_COMPRESS_LEVEL) -> bytes:
+    buffer = BytesIO()
+    img.save(buffer, format="PNG", compress_level=compress_level)
+    return buffer.getvalue()
+
+
+def predict_mask(img: Image.Image, session, working_size: int = DEFAULT_WORKING_SIZE) -> Image.Image:
+    """
+    在工作解析度上推論 mask，回傳與輸入同尺寸的 L 模式 mask
+    """
+    working = img
+    if working_size and max(img.size) > working_size:
+        working = img.copy()
+        working.thumbnail((working_size, working_size), Image.BILINEAR)
+
+    from rembg import remove
+
+    mask = remove(working, session=session, only_mask=True).convert("L")
+    if mask.size != img.size:
+        mask = mask.resize(img.size, Image.BILINEAR)
+    return mask
+
+
+def warm_up(session):
+    """以小張空白圖跑一次推論，讓第一個真正的請求不必負擔 ONNX Runtime 的初始化成本"""
+    predict_mask(Image.new("RGB", (64, 64), (255, 255, 255)), session, working_size=0)
+
+
+def remove_background(image_bytes: bytes, session, working_size: int = DEFAULT_WORKING_SIZE,
+                      max_output_size: int = DEFAULT_MAX_OUTPUT_SIZE,
+                      compress_level: int = DEFAULT_PNG_COMPRESS_LEVEL) -> bytes:
+    """
+    以縮小後的工作解析度推論 mask，再套用到限制尺寸的輸出圖
+
+    Args:
+        image_bytes: 原始圖片內容
+        session: rembg session
+        working_size: 推論用的長邊尺寸；0 表示沿用舊流程 (整張原圖交給 rembg)
+        max_output_size: 輸出 PNG 的長邊上限 (0 表示不限制)
+        compress_level: PNG 壓縮等級 (0-9)
+    Returns:
+        bytes: 含 alpha 的 PNG
+    """
+    if not working_size:
+        from rembg import remove
+
+        return remove(image_bytes, session=session)
+
+    output = load_oriented_image(image_bytes, max_output_size).convert("RGB")
+    output.putalpha(predict_mask(output, session, working_size))
+    return encode_png(output, compress_level)
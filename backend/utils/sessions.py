@@ -0,0 +1,284 @@
+"""
+rembg session 註冊表
+
+以 (模型, ONNX Runtime 選項) 為鍵快取 session，讓不同端點或衣物類別可以選用不同模型
+(例如鞋子用較輕量的 u2netp)，並可調整 intra/inter-op 執行緒數、圖最佳化等級與執行模式。
+
+設定來源 (後者覆蓋前者)：
+1. 環境變數 REMBG_MODEL、REMBG_INTRA_OP_THREADS、REMBG_INTER_OP_THREADS、
+   REMBG_GRAPH_OPT_LEVEL、REMBG_EXECUTION_MODE、REMBG_MODEL_PATH → 預設設定
+2. REMBG_SESSION_CONFIG：JSON 檔案路徑或 JSON 字串，格式如下
+
+    {
+      "default":    {"model": "u2net", "intra_op_threads": 2},
+      "endpoints":  {"upload_wannabe": {"model": "u2net_human_seg"}},
+      "categories": {"shoes": {"model": "u2netp"}}
+    }
+
+端點與類別的設定只需寫出與預設不同的欄位；解析順序為 類別 > 端點 > 預設。
+
+模型檔位於 U2NET_HOME (rembg 的模型目錄)。Docker 映像在建置階段以
+scripts/provision_models.py 下載模型並寫入 MANIFEST.sha256，執行時直接從唯讀路徑載入；
+第一次建立 session 前會依清單檢查模型檔 (REMBG_VERIFY_CHECKSUMS=1 時比對完整 sha256)。
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from dataclasses import asdict, dataclass, replace
+from typing import Dict, Optional
+
+GRAPH_OPT_LEVELS = ("disable", "basic", "extended", "all")
+EXECUTION_MODES = ("sequential", "parallel")
+MANIFEST_NAME = "MANIFEST.sha256"
+
+
+class ModelVerificationError(Exception):
+    """模型檔與建置時的清單不符 (缺檔、大小或雜湊不同)"""
+
+
+def model_home(environ=os.environ) -> str:
+    """rembg 的模型目錄，與 rembg 本身的解析方式相同"""
+    return environ.get("U2NET_HOME", os.path.join(os.path.expanduser(environ.get("XDG_DATA_HOME", "~")), ".u2net"))
+
+
+def sha256sum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(model_dir: str) -> Dict[str, Dict]:
+    """讀取 MANIFEST.sha256 (每行：<sha256> <bytes> <檔名>)；沒有清單時回傳空 dict"""
+    path = os.path.join(model_dir, MANIFEST_NAME)
+    if not os.path.isfile(path):
+        return {}
+    entries = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip() and not line.startswith('#'):
+                digest, size, name = line.split(None, 2)
+                entries[name.strip()] = {"sha256": digest, "size": int(size)}
+    return entries
+
+
+def write_manifest(model_dir: str, names) -> Dict[str, Dict]:
+    entries = {}
+    for name in sorted(names):
+        path = os.path.join(model_dir, name)
+        entries[name] = {"sha256": sha256sum(path), "size": os.path.getsize(path)}
+    with open(os.path.join(model_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        for name, entry in entries.items():
+            f.write(f"{entry['sha256']} {entry['size']} {name}\n")
+    return entries
+
+
+def verify_model_dir(model_dir: str, full_hash: bool = False) -> Dict[str, Dict]:
+    """
+    依清單檢查模型檔；預設只比對大小 (冷啟動時不必讀完整個檔案)，full_hash=True 時比對 sha256
+    Raises:
+        ModelVerificationError: 檔案缺失或不符
+    """
+    entries = read_manifest(model_dir)
+    for name, entry in entries.items():
+        path = os.path.join(model_dir, name)
+        if not os.path.isfile(path):
+            raise ModelVerificationError(f"Model file {path} listed in manifest is missing")
+        if os.path.getsize(path) != entry["size"]:
+            raise ModelVerificationError(f"Model file {path} size mismatch ({os.path.getsize(path)} != {entry['size']})")
+        if full_hash and sha256sum(path) != entry["sha256"]:
+            raise ModelVerificationError(f"Model file {path} sha256 mismatch")
+    return entries
+
+
+@dataclass(frozen=True)
+class SessionConfig:
+    model: str = "u2net"
+    intra_op_threads: int = 0
+    inter_op_threads: int = 0
+    graph_optimization: str = "all"
+    execution_mode: str = "sequential"
+    # 自訂 ONNX 檔案 (例如量化後的模型)，搭配 model="u2net_custom" 使用
+    model_path: Optional[str] = None
+
+    @property
+    def pipeline_id(self) -> str:
+        """去重快取鍵使用的模型識別；只有會影響輸出的欄位才納入"""
+        if self.model_path:
+            return f"{self.model}:{os.path.basename(self.model_path)}"
+        return self.model
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def _config_from_dict(base: SessionConfig, data: Dict) -> SessionConfig:
+    fields = {k: v for k, v in data.items() if k in SessionConfig.__dataclass_fields__}
+    config = replace(base, **fields)
+    if config.graph_optimization not in GRAPH_OPT_LEVELS:
+        raise ValueError(f"Unknown graph_optimization '{config.graph_optimization}', expected one of {GRAPH_OPT_LEVELS}")
+    if config.execution_mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution_mode '{config.execution_mode}', expected one of {EXECUTION_MODES}")
+    return config
+
+
+def config_from_env(environ=os.environ) -> SessionConfig:
+    return _config_from_dict(SessionConfig(), {
+        "model": environ.get("REMBG_MODEL", "u2net"),
+        "intra_op_threads": int(environ.get("REMBG_INTRA_OP_THREADS", 0)),
+        "inter_op_threads": int(environ.get("REMBG_INTER_OP_THREADS", 0)),
+        "graph_optimization": environ.get("REMBG_GRAPH_OPT_LEVEL", "all"),
+        "execution_mode": environ.get("REMBG_EXECUTION_MODE", "sequential"),
+        "model_path": environ.get("REMBG_MODEL_PATH") or None,
+    })
+
+
+def load_routing_config(raw: Optional[str]) -> Dict:
+    """REMBG_SESSION_CONFIG 可以是檔案路徑或直接的 JSON 字串"""
+    if not raw:
+        return {}
+    if os.path.isfile(raw):
+        with open(raw, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return json.loads(raw)
+
+
+def build_session(config: SessionConfig):
+    """依設定建立 rembg session"""
+    import onnxruntime as ort
+
+    sess_opts = ort.SessionOptions()
+    if config.intra_op_threads:
+        sess_opts.intra_op_num_threads = config.intra_op_threads
+    if config.inter_op_threads:
+        sess_opts.inter_op_num_threads = config.inter_op_threads
+    sess_opts.graph_optimization_level = {
+        "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }[config.graph_optimization]
+    sess_opts.execution_mode = (
+        ort.ExecutionMode.ORT_PARALLEL if config.execution_mode == "parallel" else ort.ExecutionMode.ORT_SEQUENTIAL
+    )
+
+    from rembg.sessions import sessions_class
+
+    session_class = next((cls for cls in sessions_class if cls.name() == config.model), None)
+    if session_class is None:
+        raise ValueError(f"Unknown rembg model '{config.model}'")
+    kwargs = {"model_path": config.model_path} if config.model_path else {}
+    return session_class(config.model, sess_opts, **kwargs)
+
+
+class SessionRegistry:
+    """依 SessionConfig 快取 rembg session，並依端點 / 類別解析該用哪一組設定"""
+
+    def __init__(self, default: SessionConfig, routing: Optional[Dict] = None,
+                 model_dir: Optional[str] = None, verify_checksums: bool = False):
+        routing = routing or {}
+        self.model_dir = model_dir
+        self.verify_checksums = verify_checksums
+        self._verified = model_dir is None
+        self.timings: Dict[SessionConfig, Dict[str, float]] = {}
+        self.default = _config_from_dict(default, routing.get("default", {}))
+        self.endpoints = {
+            name: _config_from_dict(self.default, data) for name, data in routing.get("endpoints", {}).items()
+        }
+        self.categories = {
+            name: _config_from_dict(self.default, data) for name, data in routing.get("categories", {}).items()
+        }
+        self._sessions: Dict[SessionConfig, object] = {}
+        self._locks: Dict[SessionConfig, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, environ=os.environ) -> "SessionRegistry":
+        return cls(
+            config_from_env(environ),
+            load_routing_config(environ.get("REMBG_SESSION_CONFIG")),
+            model_dir=model_home(environ),
+            verify_checksums=environ.get("REMBG_VERIFY_CHECKSUMS", "").lower() in ("1", "true", "yes"),
+        )
+
+    def _verify_once(self):
+        # 呼叫端需持有 self._lock
+        if self._verified:
+            return
+        start = time.perf_counter()
+        entries = verify_model_dir(self.model_dir, full_hash=self.verify_checksums)
+        if entries:
+            mode = "sha256" if self.verify_checksums else "size"
+            print(f"DEBUG: Verified {len(entries)} provisioned model(s) in {self.model_dir} by {mode} "
+                  f"in {(time.perf_counter() - start) * 1000:.0f} ms.")
+        else:
+            print(f"WARN: No {MANIFEST_NAME} in {self.model_dir}; rembg will download models on demand.")
+        self._verified = True
+
+    def resolve(self, endpoint: Optional[str] = None, category: Optional[str] = None) -> SessionConfig:
+        if category and category in self.categories:
+            return self.categories[category]
+        if endpoint and endpoint in self.endpoints:
+            return self.endpoints[endpoint]
+        return self.default
+
+    def get(self, config: Optional[SessionConfig] = None):
+        """取得 (必要時建立) 對應設定的 session；同一設定只會載入一次"""
+        config = config or self.default
+        session = self._sessions.get(config)
+        if session is not None:
+            return session
+        with self._lock:
+            self._verify_once()
+            lock = self._locks.setdefault(config, threading.Lock())
+        with lock:
+            session = self._sessions.get(config)
+            if session is None:
+                try:
+                    print(f"DEBUG: Initializing rembg session {config.to_dict()}...")
+                    start = time.perf_counter()
+                    session = build_session(config)
+                    load_ms = (time.perf_counter() - start) * 1000
+                    print(f"DEBUG: Rembg session for '{config.model}' initialized and model loaded successfully "
+                          f"in {load_ms:.0f} ms.")
+                except Exception as e:
+                    print(f"CRITICAL ERROR: Rembg model initialization failed for {config.to_dict()}: {e}", file=sys.stderr)
+                    traceback.print_exc(file=sys.stderr)
+                    raise
+                self.timings.setdefault(config, {})["model_load_ms"] = round(load_ms, 1)
+                self._sessions[config] = session
+        return session
+
+    def warm_up(self, config: Optional[SessionConfig] = None):
+        """載入模型並跑一次推論 (ONNX Runtime 第一次執行會額外配置記憶體與最佳化圖)"""
+        from backend.utils import segmentation
+
+        config = config or self.default
+        session = self.get(config)
+        if "first_inference_ms" in self.timings.get(config, {}):
+            return session
+        start = time.perf_counter()
+        segmentation.warm_up(session)
+        first_ms = (time.perf_counter() - start) * 1000
+        self.timings.setdefault(config, {})["first_inference_ms"] = round(first_ms, 1)
+        print(f"DEBUG: Rembg '{config.model}' first inference took {first_ms:.0f} ms.")
+        return session
+
+    def configured(self):
+        """所有設定過的組合 (預設 + 端點 + 類別)，用於預熱與 benchmark"""
+        return list(dict.fromkeys([self.default, *self.endpoints.values(), *self.categories.values()]))
+
+    def stats(self) -> Dict:
+        return {
+            "default": self.default.to_dict(),
+            "endpoints": {name: c.to_dict() for name, c in self.endpoints.items()},
+            "categories": {name: c.to_dict() for name, c in self.categories.items()},
+            "loaded": [dict(c.to_dict(), **self.timings.get(c, {})) for c in list(self._sessions)],
+            "model_dir": self.model_dir,
+        }
@@ -0,0 +1,148 @@
+"""
+啟動子系統：延遲匯入、並行預熱與就緒狀態
+
+冷啟動時依序匯入 rembg / google-cloud 並逐一建立 GCS、Firestore 用戶端與去背 session，
+總時間是各步驟相加。這裡改為：
+- 重量級模組以 LazyModule 包裝，第一次使用屬性時才真正 import
+- 三個用戶端在各自的執行緒中同時預熱
+- 只有必要的預熱項目 (去背模型) 完成後 /readyz 才回傳 200，
+  Cloud Run 的 startup probe 可指向它，讓流量只進到已預熱的實例
+所有步驟都記錄在 StartupTimeline 中 (相對於行程啟動的毫秒數)。
+"""
+
+import importlib
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+
+class StartupTimeline:
+    def __init__(self, t0: Optional[float] = None):
+        self.t0 = t0 if t0 is not None else time.perf_counter()
+        self._events: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def record(self, name: str, started: float, finished: float, error: Optional[str] = None):
+        event = {
+            "name": name,
+            "start_ms": round((started - self.t0) * 1000, 1),
+            "duration_ms": round((finished - started) * 1000, 1),
+            "status": "failed" if error else "ok",
+        }
+        if error:
+            event["error"] = error
+        with self._lock:
+            self._events.append(event)
+
+    @contextmanager
+    def span(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.record(name, started, time.perf_counter(), error=str(e))
+            raise
+        self.record(name, started, time.perf_counter())
+
+    def events(self) -> List[Dict]:
+        with self._lock:
+            return sorted(self._events, key=lambda e: e["start_ms"])
+
+
+class LazyModule:
+    """第一次存取屬性時才 import 的模組代理，匯入時間會記錄在 timeline 中"""
+
+    def __init__(self, name: str, timeline: Optional[StartupTimeline] = None):
+        self._name = name
+        self._timeline = timeline
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    if self._timeline is not None:
+                        with self._timeline.span(f"import:{self._name}"):
+                            self._module = importlib.import_module(self._name)
+                    else:
+                        self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+class Warmup:
+    """在背景執行緒中並行執行預熱工作，並追蹤就緒狀態"""
+
+    def __init__(self, timeline: StartupTimeline):
+        self.timeline = timeline
+        self._tasks: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._disabled = False
+        self._done = threading.Event()
+
+    def add(self, name: str, fn: Callable, required: bool = True):
+        """required=True 的工作全部成功後才算就緒"""
+        self._tasks[name] = {"fn": fn, "required": required, "state": "pending", "error": None}
+
+    def _run(self, name: str):
+        task = self._tasks[name]
+        task["state"] = "running"
+        try:
+            with self.timeline.span(f"warmup:{name}"):
+                task["fn"]()
+            task["state"] = "ready"
+            print(f"INFO: Startup warm-up '{name}' ready.")
+        except Exception as e:
+            task["state"] = "failed"
+            task["error"] = str(e)
+            print(f"CRITICAL ERROR: Startup warm-up '{name}' failed: {e}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+        finally:
+            if all(t["state"] in ("ready", "failed") for t in self._tasks.values()):
+                self._done.set()
+
+    def start(self):
+        """啟動預熱執行緒 (可重複呼叫，只有第一次生效)；應在 worker 行程中呼叫，不要在 fork 前"""
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if not self._tasks:
+            self._done.set()
+        for name in self._tasks:
+            threading.Thread(target=self._run, args=(name,), name=f"warmup-{name}", daemon=True).start()
+
+    def disable(self):
+        """停用預熱：不啟動任何執行緒，並立即視為就緒 (模型等改為第一次使用時載入)"""
+        with self._lock:
+            self._started = True
+            self._disabled = True
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def is_ready(self) -> bool:
+        if self._disabled:
+            return True
+        return self._started and all(t["state"] == "ready" for t in self._tasks.values() if t["required"])
+
+    def status(self) -> Dict:
+        return {
+            "ready": self.is_ready(),
+            "disabled": self._disabled,
+            "tasks": {
+                name: {k: v for k, v in (("state", t["state"]), ("required", t["required"]), ("error", t["error"])) if v is not None}
+                for name, t in self._tasks.items()
+            },
+            "timeline": self.timeline.events(),
+        }
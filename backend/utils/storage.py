@@ -0,0 +1,345 @@
+"""
+圖片物件存放層與簽名 URL 快取
+
+每次列出衣櫃都為每件衣物重新產生 V4 簽名，成本隨衣櫃大小線性成長，
+而且每次的 URL 都不同，瀏覽器無法快取圖片。
+SignedUrlCache 以 (bucket, blob) 為鍵保存已簽好的 URL，直到到期前的安全邊際才重新簽名：
+- 同一件衣物在 URL 有效期間內的多次列表得到相同的 URL
+- 有上限的 LRU，超過時淘汰最久未使用的項目
+- blob 被刪除時呼叫 invalidate 移除
+
+ObjectStore 是圖片物件的存放介面 (OBJECT_STORE_BACKEND)：
+- GCSObjectStore：正式環境的 GCS bucket
+- LocalObjectStore：本機磁碟，內容定址並以 HMAC 簽名的 URL 由 app 的靜態路由提供
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+
+class SignedUrlCache:
+    def __init__(self, max_entries: int = 4096, safety_margin_seconds: int = 300, clock: Callable = time.time):
+        self.max_entries = max(0, max_entries)
+        self.safety_margin_seconds = safety_margin_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    def get_or_sign(self, bucket_name: str, blob_name: str, ttl_seconds: int, sign: Callable[[], str],
+                    min_valid_seconds: Optional[int] = None) -> Tuple[str, float]:
+        """
+        回傳仍在有效期內的快取 URL，否則呼叫 sign() 產生新的 URL 並快取
+
+        Args:
+            ttl_seconds: 新簽名 URL 的有效秒數 (需大於安全邊際才會被快取)
+            sign: 實際產生簽名 URL 的函式
+            min_valid_seconds: 回傳的 URL 至少還要有效多久 (預設為安全邊際)；
+                用戶端會保存 URL 較久時 (例如增量同步的本機快取) 可要求更長的剩餘效期
+        Returns:
+            (URL, 到期時間 epoch 秒)
+        """
+        key = (bucket_name, blob_name)
+        margin = max(self.safety_margin_seconds, min_valid_seconds or 0)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                url, expires_at = entry
+                if now < expires_at - margin:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return url, expires_at
+                # 只是剩餘效期不足這次的要求時，由下面新簽的 URL 覆蓋此項目
+                if now >= expires_at - self.safety_margin_seconds:
+                    del self._entries[key]
+                    self._counters["expired"] += 1
+            self._counters["misses"] += 1
+
+        # 簽名可能需要呼叫 IAM signBlob，不在鎖內進行
+        url = sign()
+        expires_at = now + ttl_seconds
+        if self.max_entries == 0 or ttl_seconds <= self.safety_margin_seconds:
+            return url, expires_at
+
+        with self._lock:
+            self._entries[key] = (url, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+        return url, expires_at
+
+    def invalidate(self, bucket_name: str, blob_name: str):
+        with self._lock:
+            if self._entries.pop((bucket_name, blob_name), None) is not None:
+                self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        lookups = counters["hits"] + counters["misses"]
+        counters.update({
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            "size": size,
+            "capacity": self.max_entries,
+            "safety_margin_seconds": self.safety_margin_seconds,
+        })
+        return counters
+
+
+class ObjectNotFound(Exception):
+    """物件不存在 (各後端的 NotFound 統一轉成此例外)"""
+
+
+class ObjectStore:
+    """
+    圖片物件存放層介面
+
+    name 作為簽名 URL 快取的命名空間 (GCS 為 bucket 名稱)。
+    put / copy 的 name 由呼叫端決定 (<uuid>_<stem>.png 等)，不得含有 '/'。
+    """
+
+    name = ""
+
+    def put(self, name: str, data, content_type: str = "image/png", cache_control: Optional[str] = None):
+        """寫入 bytes / bytearray / memoryview / 檔案物件"""
+        raise NotImplementedError
+
+    def get(self, name: str) -> bytes:
+        raise NotImplementedError
+
+    def copy(self, source_name: str, name: str):
+        """複製既有物件；來源不存在時丟出 ObjectNotFound"""
+        raise NotImplementedError
+
+    def delete_many(self, names, max_workers: int = 8) -> Dict[str, Optional[str]]:
+        """刪除多個物件，回傳 {名稱: None (成功或原本就不存在) 或錯誤訊息}"""
+        raise NotImplementedError
+
+    def sign_url(self, name: str, ttl_seconds: int) -> str:
+        """產生有效 ttl_seconds 秒的讀取 URL"""
+        raise NotImplementedError
+
+
+class GCSObjectStore(ObjectStore):
+    def __init__(self, get_client: Callable, bucket_name: str):
+        self._get_client = get_client
+        self.name = bucket_name
+
+    def _blob(self, name):
+        return self._get_client().bucket(self.name).blob(name)
+
+    def put(self, name, data, content_type="image/png", cache_control=None):
+        from backend.utils.buffers import BufferReader, buffer_size
+
+        blob = self._blob(name)
+        if cache_control:
+            blob.cache_control = cache_control
+        if isinstance(data, bytes):
+            blob.upload_from_string(data, content_type=content_type)
+        elif hasattr(data, 'read'):
+            blob.upload_from_file(data, size=buffer_size(data), content_type=content_type, rewind=True)
+        else:
+            # memoryview / bytearray 以檔案介面包裝，避免先複製成 bytes
+            with BufferReader(data) as reader:
+                blob.upload_from_file(reader, size=buffer_size(data), content_type=content_type)
+
+    def get(self, name):
+        from google.api_core import exceptions as gcloud_exceptions
+
+        try:
+            return self._blob(name).download_as_bytes()
+        except gcloud_exceptions.NotFound as e:
+            raise ObjectNotFound(name) from e
+
+    def copy(self, source_name, name):
+        from google.api_core import exceptions as gcloud_exceptions
+
+        bucket = self._get_client().bucket(self.name)
+        try:
+            # 在 GCS 端直接複製，不經過本機
+            bucket.copy_blob(bucket.blob(source_name), bucket, name)
+        except gcloud_exceptions.NotFound as e:
+            raise ObjectNotFound(source_name) from e
+
+    def delete_many(self, names, max_workers=8):
+        from backend.utils import bulk_delete
+
+        return bulk_delete.delete_blobs(self._get_client(), self.name, list(names), max_workers=max_workers)
+
+    def sign_url(self, name, ttl_seconds):
+        import datetime
+
+        return self._blob(name).generate_signed_url(
+            version='v4',
+            expiration=datetime.timedelta(seconds=ttl_seconds),
+            method='GET'
+        )
+
+
+class LocalObjectStore(ObjectStore):
+    """
+    本機磁碟的物件存放 (單機部署與離線 benchmark)
+
+    內容定址：實際內容存在 objects/<sha256 前兩碼>/<sha256>，每個物件名稱是 names/<名稱> 指向它的 hard link。
+    相同內容 (例如去重快取的 copy) 只佔一份空間；刪除名稱後若已沒有其他名稱指向該內容，一併刪除內容。
+    讀取 URL 為 <base_url>/objects/<名稱>?expires=<epoch>&signature=<HMAC-SHA256>，由 app.py 的靜態路由驗證後回傳。
+    簽名金鑰未指定時產生一把並存在 <root>/.signing_key，讓同一台機器上的多個 worker 共用。
+    """
+
+    name = "local"
+    CONTENT_TYPES = {".png": "image/png", ".webp": "image/webp", ".jpg": "image/jpeg", ".jpeg": "image/jpeg"}
+    _NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+    def __init__(self, root: str, secret: Optional[str] = None, base_url: str = "", clock: Callable = time.time):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+        self._clock = clock
+        self._objects_dir = os.path.join(self.root, "objects")
+        self._names_dir = os.path.join(self.root, "names")
+        self._tmp_dir = os.path.join(self.root, "tmp")
+        for path in (self._objects_dir, self._names_dir, self._tmp_dir):
+            os.makedirs(path, exist_ok=True)
+        self._secret = (secret or self._load_or_create_secret()).encode()
+        # 寫入與刪除內容檔時避免與同一行程內的其他執行緒競爭
+        self._lock = threading.Lock()
+
+    def _load_or_create_secret(self) -> str:
+        path = os.path.join(self.root, ".signing_key")
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read().strip()
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            key = secrets.token_hex(32)
+            f.write(key)
+        return key
+
+    def _name_path(self, name: str) -> str:
+        if not self._NAME_PATTERN.match(name or ""):
+            raise ValueError(f"invalid object name: {name!r}")
+        return os.path.join(self._names_dir, name)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self._objects_dir, digest[:2], digest)
+
+    def _link_name(self, object_path: str, name_path: str):
+        """以暫存 link + rename 原子地讓名稱指向內容 (覆蓋既有名稱)"""
+        tmp_path = os.path.join(self._tmp_dir, f"link-{uuid.uuid4().hex}")
+        os.link(object_path, tmp_path)
+        os.replace(tmp_path, name_path)
+
+    def put(self, name, data, content_type="image/png", cache_control=None):
+        from backend.utils.buffers import BufferReader
+
+        name_path = self._name_path(name)
+        digest = hashlib.sha256()
+        tmp_path = os.path.join(self._tmp_dir, f"put-{uuid.uuid4().hex}")
+        reader = data if hasattr(data, 'read') else BufferReader(data)
+        if hasattr(reader, 'seek'):
+            reader.seek(0)
+        with open(tmp_path, "wb") as f:
+            for chunk in iter(lambda: reader.read(1 << 20), b""):
+                digest.update(chunk)
+                f.write(chunk)
+        object_path = self._object_path(digest.hexdigest())
+        with self._lock:
+            try:
+                if os.path.exists(object_path):
+                    os.remove(tmp_path)
+                else:
+                    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                    os.replace(tmp_path, object_path)
+                self._link_name(object_path, name_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def path(self, name: str) -> str:
+        """物件在磁碟上的路徑 (供靜態路由回傳)"""
+        name_path = self._name_path(name)
+        if not os.path.isfile(name_path):
+            raise ObjectNotFound(name)
+        return name_path
+
+    def get(self, name):
+        try:
+            with open(self._name_path(name), "rb") as f:
+                return f.read()
+        except FileNotFoundError as e:
+            raise ObjectNotFound(name) from e
+
+    def copy(self, source_name, name):
+        # hard link 指向同一份內容，不複製資料
+        try:
+            self._link_name(self._name_path(source_name), self._name_path(name))
+        except FileNotFoundError as e:
+            raise ObjectNotFound(source_name) from e
+
+    def _delete(self, name):
+        name_path = self._name_path(name)
+        with self._lock:
+            try:
+                links = os.stat(name_path).st_nlink
+            except FileNotFoundError:
+                return
+            object_path = None
+            if links <= 2:
+                # 只剩內容檔與這個名稱：刪除名稱後內容也不再需要
+                digest = hashlib.sha256()
+                with open(name_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(chunk)
+                object_path = self._object_path(digest.hexdigest())
+            os.remove(name_path)
+            if object_path:
+                try:
+                    if os.stat(object_path).st_nlink == 1:
+                        os.remove(object_path)
+                except FileNotFoundError:
+                    pass
+
+    def delete_many(self, names, max_workers=8):
+        results = {}
+        for name in dict.fromkeys(names):
+            try:
+                self._delete(name)
+                results[name] = None
+            except Exception as e:
+                results[name] = str(e)
+        return results
+
+    def _signature(self, name: str, expires: int) -> str:
+        mac = hmac.new(self._secret, f"{name}\n{expires}".encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(mac).decode().rstrip("=")
+
+    def sign_url(self, name, ttl_seconds):
+        expires = int(self._clock() + ttl_seconds)
+        query = urlencode({"expires": expires, "signature": self._signature(name, expires)})
+        return f"{self.base_url}/objects/{quote(name)}?{query}"
+
+    def verify(self, name: str, expires, signature) -> bool:
+        """檢查靜態路由收到的 expires / signature"""
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return False
+        if expires < self._clock() or not signature:
+            return False
+        return hmac.compare_digest(self._signature(name, expires), signature)
+
+    def content_type(self, name: str) -> str:
+        return self.CONTENT_TYPES.get(os.path.splitext(name)[1].lower(), "application/octet-stream")
@@ -0,0 +1,92 @@
+"""
+每位使用者、每個 collection 的版本號 (供列表 API 的 ETag 使用)
+
+上傳與刪除時以 Firestore Increment 遞增 <collection>/<user_id> 文件的 version 欄位；
+讀取時在行程內快取一段短時間 (TTL)，讓 If-None-Match 的 304 回應不必查詢 Firestore。
+本行程寫入後立即丟棄快取 (讀得到自己的寫入)，其他實例的寫入最多延遲 TTL 秒才反映。
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+
+class FirestoreVersionStore:
+    """版本號存放在 <collection>/<user_id> 文件的 version 欄位"""
+
+    def __init__(self, get_db: Callable, field: str = "version"):
+        self._get_db = get_db
+        self.field = field
+
+    def get(self, collection: str, user_id: str) -> int:
+        snapshot = self._get_db().collection(collection).document(user_id).get()
+        return int((snapshot.to_dict() or {}).get(self.field, 0)) if snapshot.exists else 0
+
+    def bump(self, collection: str, user_id: str):
+        from google.cloud import firestore
+
+        ref = self._get_db().collection(collection).document(user_id)
+        ref.set({self.field: firestore.Increment(1)}, merge=True)
+
+
+class CollectionVersions:
+    def __init__(self, store, ttl_seconds: float = 5.0, max_entries: int = 10000, clock: Callable = time.monotonic):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self._clock = clock
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "loads": 0, "bumps": 0, "errors": 0}
+
+    def get(self, collection: str, user_id: str) -> Optional[int]:
+        """回傳目前版本號；讀取失敗時回傳 None (呼叫端應略過 ETag)"""
+        key = (collection, user_id)
+        now = self._clock()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and now - entry[1] < self.ttl_seconds:
+                self._cache.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry[0]
+
+        try:
+            version = self.store.get(collection, user_id)
+        except Exception as e:
+            print(f"WARN: Failed to load version of {collection}/{user_id}: {e}", file=sys.stderr)
+            with self._lock:
+                self._counters["errors"] += 1
+            return None
+
+        with self._lock:
+            self._counters["loads"] += 1
+            self._cache[key] = (version, now)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return version
+
+    def bump(self, collection: str, user_id: str):
+        """
+        在資料寫入完成後遞增版本號
+        失敗只記錄警告 (最壞情況是用戶端在 TTL 內拿到舊的 304)
+        """
+        try:
+            self.store.bump(collection, user_id)
+        except Exception as e:
+            print(f"WARN: Failed to bump version of {collection}/{user_id}: {e}", file=sys.stderr)
+            with self._lock:
+                self._counters["errors"] += 1
+        with self._lock:
+            self._cache.pop((collection, user_id), None)
+            self._counters["bumps"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+            counters["cached_users"] = len(self._cache)
+        lookups = counters["hits"] + counters["loads"]
+        counters["hit_rate"] = round(counters["hits"] / lookups, 4) if lookups else 0.0
+        return counters
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+上傳 → 列表 → 讀圖 → 刪除 的端到端 benchmark (離線)
+
+以 METADATA_BACKEND=sqlite 與 OBJECT_STORE_BACKEND=local 載入 app，透過 Flask test client
+走完 /upload → /wardrobe → /objects/<blob> → /delete，不需要 GCP 認證或網路。
+去背使用真實的 rembg 模型；重複上傳同一張圖時會命中去重快取 (比較 --unique 的結果)。
+
+使用範例:
+  python benchmarks/bench_flow.py --count 10
+  python benchmarks/bench_flow.py --images ./samples --unique
+  python benchmarks/bench_flow.py --workdir /tmp/flow --keep
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench_preprocess import synthetic_jpeg, IMAGE_SUFFIXES  # noqa: E402
+
+
+def summarize(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name:<12} {len(latencies):>5} {statistics.median(latencies):>10.1f} {p95:>9.1f}")
+
+
+def timed(latencies, fn):
+    start = time.perf_counter()
+    response = fn()
+    latencies.append((time.perf_counter() - start) * 1000)
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="離線端到端 (upload → wardrobe → delete) benchmark")
+    parser.add_argument('--images', help='圖片資料夾 (未指定則使用合成圖片)')
+    parser.add_argument('--synthetic', default='1600x1200', help='合成圖片尺寸')
+    parser.add_argument('--count', type=int, default=5, help='上傳張數')
+    parser.add_argument('--unique', action='store_true', help='每次上傳不同的圖片 (預設重複同一張，測試去重快取)')
+    parser.add_argument('--page', type=int, default=30, help='列表分頁大小')
+    parser.add_argument('--list-runs', type=int, default=20, help='列表請求次數')
+    parser.add_argument('--workdir', help='SQLite 與物件存放的資料夾 (預設為暫存資料夾)')
+    parser.add_argument('--keep', action='store_true', help='保留 workdir')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_flow_")
+    os.environ.update({
+        "METADATA_BACKEND": "sqlite",
+        "SQLITE_DB_PATH": os.path.join(workdir, "metadata.sqlite"),
+        "OBJECT_STORE_BACKEND": "local",
+        "LOCAL_STORAGE_DIR": os.path.join(workdir, "objects"),
+        "LOCAL_STORAGE_BASE_URL": "",
+        "STARTUP_WARMUP": "0",
+    })
+
+    if args.images:
+        paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        inputs = [p.read_bytes() for p in paths][:args.count]
+    else:
+        width, height = (int(v) for v in args.synthetic.lower().split("x"))
+        inputs = [synthetic_jpeg(width, height, i if args.unique else 0) for i in range(args.count)]
+
+    import app as app_module
+
+    app_module.warm_up_rembg()
+    client = app_module.app.test_client()
+    user_id = "bench-user"
+    upload_ms, list_ms, fetch_ms, not_modified_ms, delete_ms = [], [], [], [], []
+
+    for i, data in enumerate(inputs):
+        response = timed(upload_ms, lambda: client.post('/upload', data={
+            "image": (BytesIO(data), f"bench_{i}.jpg"),
+            "category": "top",
+            "user_id": user_id,
+        }, content_type='multipart/form-data'))
+        if response.status_code != 200:
+            print(f"ERROR: upload failed: {response.get_json()}", file=sys.stderr)
+            sys.exit(1)
+
+    etag = None
+    images = []
+    for _ in range(args.list_runs):
+        response = timed(list_ms, lambda: client.get(f'/wardrobe?user_id={user_id}&limit={args.page}&size=thumb'))
+        images = response.get_json()["images"]
+        etag = response.headers.get('ETag')
+    if etag:
+        for _ in range(args.list_runs):
+            timed(not_modified_ms, lambda: client.get(
+                f'/wardrobe?user_id={user_id}&limit={args.page}&size=thumb', headers={"If-None-Match": etag}))
+
+    for image in images:
+        url = urlsplit(image["path"])
+        response = timed(fetch_ms, lambda: client.get(f"{url.path}?{url.query}"))
+        if response.status_code != 200:
+            print(f"ERROR: fetching {url.path} returned {response.status_code}", file=sys.stderr)
+
+    ids = [image["id"] for image in images]
+    result = timed(delete_ms, lambda: client.post('/delete', json={"user_id": user_id, "ids": ids})).get_json()
+
+    print(f"{len(inputs)} uploads, workdir {workdir}")
+    print(f"{'stage':<12} {'n':>5} {'median ms':>10} {'p95 ms':>9}")
+    summarize("upload", upload_ms)
+    summarize("wardrobe", list_ms)
+    if not_modified_ms:
+        summarize("wardrobe 304", not_modified_ms)
+    if fetch_ms:
+        summarize("fetch thumb", fetch_ms)
+    summarize(f"delete {len(ids)}", delete_ms)
+    print(f"deleted {result.get('deleted')}, failed {result.get('failed')}")
+    print(f"dedupe: {app_module._rembg_dedupe_cache.stats()}")
+
+    if not args.keep and not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+衣物 metadata 存放層 benchmark (SQLite)
+
+以 SQLiteItemStore 建立合成的衣櫃資料，量測列表 (全部 / 依類別 / 分頁)、
+以 id 批次讀取、批次寫入與刪除的延遲；不需要 GCP 認證，可作為 Firestore 的離線替身。
+
+使用範例:
+  python benchmarks/bench_metadata_store.py
+  python benchmarks/bench_metadata_store.py --users 50 --items 500 --runs 200
+  python benchmarks/bench_metadata_store.py --db /tmp/bench.sqlite --keep
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from backend.model.store import SQLiteItemStore  # noqa: E402
+
+CATEGORIES = ("top", "bottom", "shoes", "accessory")
+
+
+def measure(fn, runs):
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "median_ms": statistics.median(latencies),
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+def populate(store, users, items, batch):
+    for u in range(users):
+        pending = [
+            (f"{u:04d}_{i:06d}_rembg.png", {
+                "filename": f"{u:04d}_{i:06d}_rembg.png",
+                "derivatives": {"thumb": f"{u:04d}_{i:06d}_rembg__thumb.webp"},
+                "category": CATEGORIES[i % len(CATEGORIES)],
+                "tags": "",
+            })
+            for i in range(items)
+        ]
+        for start in range(0, len(pending), batch):
+            store.put_items("wardrobe", f"user{u}", pending[start:start + batch])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite metadata 存放層延遲 benchmark")
+    parser.add_argument('--db', help='SQLite 檔案路徑 (預設為暫存檔)')
+    parser.add_argument('--users', type=int, default=20, help='使用者數')
+    parser.add_argument('--items', type=int, default=300, help='每位使用者的項目數')
+    parser.add_argument('--batch', type=int, default=50, help='每次寫入的項目數')
+    parser.add_argument('--page', type=int, default=30, help='分頁大小')
+    parser.add_argument('--runs', type=int, default=100, help='每項量測的次數')
+    parser.add_argument('--keep', action='store_true', help='保留資料庫檔案')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench.sqlite")
+    store = SQLiteItemStore(path)
+
+    start = time.perf_counter()
+    populate(store, args.users, args.items, args.batch)
+    total = args.users * args.items
+    elapsed = time.perf_counter() - start
+    print(f"populated {total} items in {elapsed:.2f}s ({total / elapsed:.0f} items/s) at {path}")
+
+    rng = random.Random(0)
+
+    def user():
+        return f"user{rng.randrange(args.users)}"
+
+    first_page = store.list_items("wardrobe", "user0", limit=args.page)
+    after = (first_page[-1][1]["timestamp"], first_page[-1][0])
+    ids = [f"0000_{i:06d}_rembg.png" for i in range(0, args.items, max(1, args.items // 50))]
+
+    cases = {
+        "list all": lambda: store.list_items("wardrobe", user()),
+        "list category": lambda: store.list_items("wardrobe", user(), category=rng.choice(CATEGORIES)),
+        "first page": lambda: store.list_items("wardrobe", user(), limit=args.page + 1),
+        "next page": lambda: store.list_items("wardrobe", "user0", limit=args.page + 1, after=after),
+        f"get {len(ids)} ids": lambda: store.get_items("wardrobe", "user0", ids),
+        "version": lambda: store.get_version("wardrobe", user()),
+    }
+
+    print(f"{'case':<16} {'median ms':>10} {'p95 ms':>8}")
+    for name, fn in cases.items():
+        result = measure(fn, args.runs)
+        print(f"{name:<16} {result['median_ms']:>10.3f} {result['p95_ms']:>8.3f}")
+
+    doomed = store.list_items("wardrobe", "user0", limit=args.batch)
+    start = time.perf_counter()
+    store.delete_items("wardrobe", "user0", doomed, tombstone_days=30)
+    print(f"{'delete ' + str(len(doomed)):<16} {(time.perf_counter() - start) * 1000:>10.3f}")
+
+    if not args.keep and not args.db:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+去背前處理 benchmark
+
+比較兩種流程的延遲與峰值 RSS：
+- legacy:  整張原圖直接交給 rembg.remove (舊的 /upload 行為)
+- resized: EXIF 修正 + 縮小工作解析度推論 + mask 放大套用到限制尺寸的輸出
+
+每種流程在獨立子行程中執行，峰值 RSS 才不會互相污染。
+
+使用範例:
+  python benchmarks/bench_preprocess.py --images ./samples
+  python benchmarks/bench_preprocess.py --synthetic 4032x3024 --count 3 --runs 2
+  python benchmarks/bench_preprocess.py --working 768 --max-output 1600
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.webp'}
+
+
+def synthetic_jpeg(width: int, height: int, seed: int) -> bytes:
+    """產生近似手機照片大小的 JPEG (雜訊 + 中央色塊)"""
+    from PIL import Image, ImageDraw
+
+    img = Image.effect_noise((width, height), 40 + seed).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((width // 4, height // 5, width * 3 // 4, height * 4 // 5), fill=(180, 40 + seed * 20, 60))
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def load_inputs(args):
+    if args.images:
+        paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        return [(p.name, p.read_bytes()) for p in paths]
+    width, height = (int(v) for v in args.synthetic.lower().split("x"))
+    return [(f"synthetic_{i}.jpg", synthetic_jpeg(width, height, i)) for i in range(args.count)]
+
+
+def peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 單位為 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(args):
+    """子行程：載入模型後依序處理所有圖片，輸出 JSON 結果"""
+    from rembg import new_session
+    from backend.utils import segmentation
+
+    inputs = load_inputs(args)
+    session = new_session(args.model)
+    rss_after_load = peak_rss_mb()
+
+    working = args.working if args.mode == "resized" else 0
+    latencies = []
+    output_sizes = []
+    for _ in range(args.runs):
+        for _, data in inputs:
+            start = time.perf_counter()
+            output = segmentation.remove_background(
+                data, session, working_size=working, max_output_size=args.max_output
+            )
+            latencies.append(time.perf_counter() - start)
+            output_sizes.append(len(output))
+
+    print(json.dumps({
+        "mode": args.mode,
+        "images": len(inputs),
+        "runs": args.runs,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "rss_after_model_mb": rss_after_load,
+        "peak_rss_mb": peak_rss_mb(),
+        "mean_output_kb": statistics.mean(output_sizes) / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="rembg 前處理延遲 / 記憶體 benchmark")
+    parser.add_argument('--images', help='圖片資料夾 (未指定則使用合成圖片)')
+    parser.add_argument('--synthetic', default='4032x3024', help='合成圖片尺寸 (預設 12MP)')
+    parser.add_argument('--count', type=int, default=3, help='合成圖片張數')
+    parser.add_argument('--runs', type=int, default=2, help='每張圖片重複次數')
+    parser.add_argument('--model', default=os.environ.get('REMBG_MODEL', 'u2net'))
+    parser.add_argument('--working', type=int, default=1024, help='resized 流程的工作解析度')
+    parser.add_argument('--max-output', type=int, default=2048, help='resized 流程的輸出長邊上限')
+    parser.add_argument('--mode', choices=['legacy', 'resized'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_child(args)
+        return
+
+    results = []
+    for mode in ('legacy', 'resized'):
+        cmd = [sys.executable, __file__, '--mode', mode] + sys.argv[1:]
+        completed = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(f"{'mode':<8} {'mean ms':>9} {'p50 ms':>9} {'max ms':>9} {'model MB':>9} {'peak MB':>9} {'out KB':>8}")
+    for r in results:
+        print(f"{r['mode']:<8} {r['mean_ms']:>9.1f} {r['p50_ms']:>9.1f} {r['max_ms']:>9.1f} "
+              f"{r['rss_after_model_mb']:>9.1f} {r['peak_rss_mb']:>9.1f} {r['mean_output_kb']:>8.1f}")
+    legacy, resized = results
+    print(f"\nspeedup: {legacy['mean_ms'] / resized['mean_ms']:.2f}x, "
+          f"peak RSS delta: {resized['peak_rss_mb'] - legacy['peak_rss_mb']:+.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+FP32 與 INT8 分割模型的品質 / 效能比較
+
+對同一組本機圖片分別以 FP32 (rembg 內建模型) 與 INT8 (scripts/quantize_model.py 產生)
+推論 mask，回報：
+- 每張延遲 (mean / p50 / p95) 與 session 載入時間
+- 峰值 RSS (各模型在獨立子行程中執行)
+- 與 FP32 mask 的 IoU (以 0.5 為門檻二值化)
+
+圖片依檔名排序、推論前先暖機一次，結果可重現。
+
+使用範例:
+  python benchmarks/bench_quantized.py --images ./samples --int8 models/u2net_int8.onnx
+  python benchmarks/bench_quantized.py --images ./samples --int8 models/u2net_int8.onnx --json > report.json
+"""
+
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench_preprocess import IMAGE_SUFFIXES  # noqa: E402
+
+
+def image_paths(image_dir):
+    paths = sorted(p for p in Path(image_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not paths:
+        raise SystemExit(f"ERROR: {image_dir} 中沒有圖片")
+    return paths
+
+
+def run_child(args):
+    """子行程：載入單一模型，推論所有圖片並把 mask 存到 --mask-dir"""
+    import onnxruntime
+    from backend.utils import segmentation
+    from backend.utils.sessions import SessionConfig, build_session
+
+    if args.variant == "int8":
+        config = SessionConfig(model="u2net_custom", model_path=args.int8, intra_op_threads=args.threads)
+    else:
+        config = SessionConfig(model=args.model, intra_op_threads=args.threads)
+
+    start = time.perf_counter()
+    session = build_session(config)
+    load_s = time.perf_counter() - start
+
+    images = [segmentation.load_oriented_image(p.read_bytes(), args.working) for p in image_paths(args.images)]
+    segmentation.predict_mask(images[0], session, args.working)
+
+    latencies = []
+    mask_dir = Path(args.mask_dir)
+    for i, img in enumerate(images):
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            mask = segmentation.predict_mask(img, session, args.working)
+            latencies.append(time.perf_counter() - start)
+        mask.save(mask_dir / f"{i:04d}.png")
+
+    print(json.dumps({
+        "variant": args.variant,
+        "config": config.to_dict(),
+        "onnxruntime": onnxruntime.__version__,
+        "images": len(images),
+        "load_ms": load_s * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": (statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]) * 1000,
+        # Linux 上 ru_maxrss 單位為 KB
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def mask_iou(path_a: Path, path_b: Path) -> float:
+    import numpy as np
+    from PIL import Image
+
+    a = np.asarray(Image.open(path_a).convert("L")) >= 128
+    b = np.asarray(Image.open(path_b).convert("L")) >= 128
+    union = np.logical_or(a, b).sum()
+    return float(np.logical_and(a, b).sum() / union) if union else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FP32 vs INT8 分割模型 benchmark")
+    parser.add_argument('--images', required=True, help='評估用圖片資料夾')
+    parser.add_argument('--int8', required=True, help='INT8 ONNX 模型路徑')
+    parser.add_argument('--model', default='u2net', help='FP32 對照組的 rembg 模型名稱')
+    parser.add_argument('--runs', type=int, default=3, help='每張圖片重複推論次數')
+    parser.add_argument('--threads', type=int, default=0, help='intra-op 執行緒數 (0 表示 ONNX Runtime 預設)')
+    parser.add_argument('--working', type=int, default=1024, help='工作解析度')
+    parser.add_argument('--json', action='store_true', help='以 JSON 輸出結果')
+    parser.add_argument('--variant', choices=['fp32', 'int8'], help=argparse.SUPPRESS)
+    parser.add_argument('--mask-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for variant in ('fp32', 'int8'):
+            mask_dir = Path(tmp) / variant
+            mask_dir.mkdir()
+            cmd = [sys.executable, __file__, '--variant', variant, '--mask-dir', str(mask_dir)] + sys.argv[1:]
+            completed = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            results[variant] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+        ious = [mask_iou(p, Path(tmp) / 'int8' / p.name) for p in sorted((Path(tmp) / 'fp32').glob('*.png'))]
+
+    report = {
+        "fp32": results["fp32"],
+        "int8": results["int8"],
+        "iou_mean": statistics.mean(ious),
+        "iou_min": min(ious),
+        "speedup": results["fp32"]["mean_ms"] / results["int8"]["mean_ms"],
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'variant':<8} {'load ms':>9} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'peak MB':>9}")
+    for variant in ('fp32', 'int8'):
+        r = results[variant]
+        print(f"{variant:<8} {r['load_ms']:>9.1f} {r['mean_ms']:>9.1f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['peak_rss_mb']:>9.1f}")
+    print(f"\nspeedup: {report['speedup']:.2f}x, mask IoU vs FP32: mean {report['iou_mean']:.4f}, min {report['iou_min']:.4f}")
+
+
+if __name__ == '__main__':
+    main()
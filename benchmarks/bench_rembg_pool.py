@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+去背行程池吞吐量 benchmark
+
+以不同的 worker 數同時送出一批圖片，量測每秒可處理的張數，
+並與單一 session 在多執行緒下的吞吐量比較 (即 REMBG_PROCESS_POOL_SIZE=0 的行為)。
+
+使用範例:
+  python benchmarks/bench_rembg_pool.py --images ./samples
+  python benchmarks/bench_rembg_pool.py --sizes 1,2,4 --count 16
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench_preprocess import synthetic_jpeg, IMAGE_SUFFIXES  # noqa: E402
+
+
+def load_inputs(args):
+    if args.images:
+        paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        inputs = [p.read_bytes() for p in paths]
+        return (inputs * (args.count // max(1, len(inputs)) + 1))[:args.count]
+    width, height = (int(v) for v in args.synthetic.lower().split("x"))
+    return [synthetic_jpeg(width, height, i % 4) for i in range(args.count)]
+
+
+def bench_threads(inputs, args):
+    from rembg import new_session
+    from backend.utils import segmentation
+
+    session = new_session(args.model)
+    segmentation.remove_background(inputs[0], session, working_size=args.working)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(lambda data: segmentation.remove_background(data, session, working_size=args.working), inputs))
+    return time.perf_counter() - start
+
+
+def bench_pool(inputs, size, args):
+    from backend.utils.rembg_pool import RembgProcessPool
+    from backend.utils.sessions import SessionConfig
+
+    pool = RembgProcessPool(size, SessionConfig(model=args.model), working_size=args.working)
+    try:
+        pool.warm_up()
+        pool.remove(inputs[0])
+        start = time.perf_counter()
+        futures = [pool.submit(data) for data in inputs]
+        for future in futures:
+            future.result()
+        return time.perf_counter() - start
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="rembg 行程池吞吐量 benchmark")
+    parser.add_argument('--images', help='圖片資料夾 (未指定則使用合成圖片)')
+    parser.add_argument('--synthetic', default='4032x3024', help='合成圖片尺寸')
+    parser.add_argument('--count', type=int, default=16, help='每輪處理的圖片張數')
+    parser.add_argument('--sizes', default=None, help='要測試的 worker 數，以逗號分隔 (預設 1..CPU 數)')
+    parser.add_argument('--threads', type=int, default=4, help='單一 session 對照組的執行緒數 (同 gunicorn --threads)')
+    parser.add_argument('--model', default=os.environ.get('REMBG_MODEL', 'u2net'))
+    parser.add_argument('--working', type=int, default=1024, help='工作解析度')
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    sizes = [int(s) for s in args.sizes.split(",")] if args.sizes else sorted({1, 2, max(1, cpus // 2), cpus})
+    inputs = load_inputs(args)
+
+    print(f"{len(inputs)} images, {cpus} CPUs")
+    print(f"{'mode':<16} {'seconds':>9} {'img/s':>8}")
+    elapsed = bench_threads(inputs, args)
+    print(f"{'threads x' + str(args.threads):<16} {elapsed:>9.2f} {len(inputs) / elapsed:>8.2f}")
+    for size in sizes:
+        elapsed = bench_pool(inputs, size, args)
+        print(f"{'pool x' + str(size):<16} {elapsed:>9.2f} {len(inputs) / elapsed:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+rembg session 設定 benchmark
+
+對每一組 (模型, ONNX Runtime 選項) 量測 session 載入時間與單張去背延遲。
+未指定 --config 時使用內建的比較矩陣 (u2net / u2netp / silueta × 執行緒數)；
+也可直接傳入與 REMBG_SESSION_CONFIG 相同格式的 JSON，量測其中所有設定。
+
+使用範例:
+  python benchmarks/bench_sessions.py --images ./samples
+  python benchmarks/bench_sessions.py --config deploy/rembg_sessions.json --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench_preprocess import synthetic_jpeg, IMAGE_SUFFIXES  # noqa: E402
+from backend.utils.sessions import SessionConfig, SessionRegistry, build_session, load_routing_config  # noqa: E402
+
+
+def default_matrix():
+    cpus = os.cpu_count() or 1
+    threads = sorted({1, max(1, cpus // 2), cpus})
+    configs = []
+    for model in ("u2net", "u2netp", "silueta"):
+        for n in threads:
+            configs.append(SessionConfig(model=model, intra_op_threads=n, inter_op_threads=1))
+    configs.append(SessionConfig(model="u2net", intra_op_threads=cpus, graph_optimization="basic"))
+    return configs
+
+
+def load_inputs(args):
+    if args.images:
+        paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        return [p.read_bytes() for p in paths]
+    return [synthetic_jpeg(1600, 1200, i) for i in range(args.count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="rembg session 設定延遲 benchmark")
+    parser.add_argument('--images', help='圖片資料夾 (未指定則使用合成圖片)')
+    parser.add_argument('--count', type=int, default=3, help='合成圖片張數')
+    parser.add_argument('--runs', type=int, default=3, help='每張圖片重複次數')
+    parser.add_argument('--config', help='REMBG_SESSION_CONFIG 格式的 JSON 檔案或字串')
+    parser.add_argument('--working', type=int, default=1024, help='工作解析度')
+    parser.add_argument('--json', action='store_true', help='以 JSON 輸出結果')
+    args = parser.parse_args()
+
+    from backend.utils import segmentation
+
+    if args.config:
+        configs = SessionRegistry(SessionConfig(), load_routing_config(args.config)).configured()
+    else:
+        configs = default_matrix()
+    inputs = load_inputs(args)
+
+    results = []
+    for config in configs:
+        start = time.perf_counter()
+        session = build_session(config)
+        load_s = time.perf_counter() - start
+        segmentation.remove_background(inputs[0], session, working_size=args.working)
+
+        latencies = []
+        for _ in range(args.runs):
+            for data in inputs:
+                start = time.perf_counter()
+                segmentation.remove_background(data, session, working_size=args.working)
+                latencies.append(time.perf_counter() - start)
+        results.append({
+            "config": config.to_dict(),
+            "load_ms": load_s * 1000,
+            "mean_ms": statistics.mean(latencies) * 1000,
+            "p50_ms": statistics.median(latencies) * 1000,
+            "p95_ms": (statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]) * 1000,
+        })
+        del session
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'model':<10} {'intra':>5} {'inter':>5} {'opt':<9} {'mode':<10} {'load ms':>9} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for r in results:
+        c = r["config"]
+        print(f"{c['model']:<10} {c['intra_op_threads']:>5} {c['inter_op_threads']:>5} {c['graph_optimization']:<9} "
+              f"{c['execution_mode']:<10} {r['load_ms']:>9.1f} {r['mean_ms']:>9.1f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
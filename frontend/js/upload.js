@@ -1,5 +1,20 @@
 // frontend/js/upload.js
 import { backendURL } from './liff-init.js';
+import { readSnapshot, writeSnapshot, applyDelta, sortedItems } from './wardrobe-cache.js';
+
+// 每次批次上傳的圖片數量 (後端 /upload_batch 上限為 50)
+const UPLOAD_BATCH_SIZE = 10;
+// 衣櫃每次載入的數量；捲動到底時再以 next_cursor 載入下一頁
+const WARDROBE_PAGE_SIZE = 30;
+// 距離捲動底端 (或橫向捲動末端) 多少 px 內就開始載入下一頁
+const WARDROBE_PREFETCH_PX = 300;
+
+// 本機快取中的簽名網址剩餘效期低於此秒數時，同步時一併要求換新；
+// 需要換新的數量超過上限 (例如久未開啟) 時改為重新下載完整快照
+const URL_REFRESH_MARGIN_S = 5 * 60;
+const MAX_REFRESH_IDS = 100;
+
+let wardrobeState = { category: "all", cursor: null, done: true, loading: false, localItems: null, offset: 0 };
 
 // 支援多張圖片上傳，避免每張上傳後立即刷新
 async function uploadImages(event) {
@@ -27,29 +42,42 @@ async function uploadImages(event) {
 
   let successCount = 0, failCount = 0;
 
-  for (const file of files) {
+  // 以批次方式上傳，每批共用一次 HTTP 請求與後端的去背 session
+  const fileList = Array.from(files);
+  for (let start = 0; start < fileList.length; start += UPLOAD_BATCH_SIZE) {
+    const chunk = fileList.slice(start, start + UPLOAD_BATCH_SIZE);
     const formData = new FormData();
-    formData.append('image', file);
+    chunk.forEach(file => formData.append('images', file));
     formData.append('category', category);
     formData.append('user_id', userId);
 
-    console.log(`DEBUG: 準備上傳 ${file.name} (${file.size} bytes)`);
+    console.log(`DEBUG: 準備批次上傳 ${chunk.length} 張圖片 (${start + 1}-${start + chunk.length}/${fileList.length})`);
 
     try {
-      const res = await fetch(`${backendURL}/upload`, { method: 'POST', body: formData });
+      const res = await fetch(`${backendURL}/upload_batch`, { method: 'POST', body: formData });
       const data = await res.json();
 
-      if (data.status === 'ok') {
-        successCount++;
-        console.log(`INFO: ${file.name} 上傳成功`);
+      if (Array.isArray(data.results)) {
+        data.results.forEach(result => {
+          if (result.status === 'ok') {
+            successCount++;
+            console.log(`INFO: ${result.name} 上傳成功`);
+          } else {
+            failCount++;
+            console.error(`ERROR: ${result.name} 上傳失敗:`, result.message);
+          }
+        });
       } else {
-        failCount++;
-        console.error(`ERROR: ${file.name} 上傳失敗:`, data.message);
+        failCount += chunk.length;
+        console.error("ERROR: 批次上傳失敗:", data.message);
       }
     } catch (err) {
-      failCount++;
-      console.error(`❌ ${file.name} 上傳錯誤:`, err);
+      failCount += chunk.length;
+      console.error("❌ 批次上傳錯誤:", err);
     }
+
+    document.getElementById('status').innerText =
+      `🔄 正在上傳... (${successCount + failCount}/${fileList.length})`;
   }
 
   document.getElementById('status').innerText =
@@ -59,7 +87,7 @@ async function uploadImages(event) {
   input.value = '';  // 重置檔案選擇框
 }
 
-// 載入衣櫃圖片
+// 載入衣櫃圖片 (重新從第一頁開始)
 export async function loadWardrobe(category = "all") {
   const userId = window.userId;
   if (!userId) {
@@ -67,30 +95,111 @@ export async function loadWardrobe(category = "all") {
     return;
   }
 
+  wardrobeState = { category, cursor: null, done: false, loading: false, localItems: null, offset: 0 };
+  const state = wardrobeState;
+  clearImages();
+
+  // 有可用的本機快取時只向後端要求變更，並直接從快取分頁顯示
+  const snapshot = await syncWardrobe(userId, false);
+  if (state !== wardrobeState) return;
+  if (snapshot) {
+    state.localItems = sortedItems(snapshot, category);
+    await loadMoreWardrobe();
+    return;
+  }
+
+  // 沒有可用的快取：先向後端分頁載入第一頁，之後在背景建立完整快取供下次增量同步
+  await loadMoreWardrobe();
+  syncWardrobe(userId, true);
+}
+
+// 與後端同步本機快取 (/wardrobe?since=...)，回傳更新後的快照；無法增量同步時回傳 null
+// full 為 true 時，沒有快取或快取中大部分網址快到期的情況下改為下載完整快照
+async function syncWardrobe(userId, full) {
   try {
-    const url = `${backendURL}/wardrobe?user_id=${userId}&category=${category}`;
+    const snapshot = await readSnapshot(userId);
+    const nowSeconds = Date.now() / 1000;
+    const expiring = snapshot
+      ? Object.values(snapshot.items)
+          .filter(item => (item.path_expires_at || 0) - nowSeconds < URL_REFRESH_MARGIN_S)
+          .map(item => item.id)
+      : [];
+    const incremental = Boolean(snapshot && snapshot.syncToken) && expiring.length <= MAX_REFRESH_IDS;
+    if (!incremental && !full) return null;
+
+    let url = `${backendURL}/wardrobe?user_id=${userId}&size=thumb&since=`;
+    if (incremental) {
+      url += encodeURIComponent(snapshot.syncToken);
+      if (expiring.length) url += `&refresh=${expiring.map(encodeURIComponent).join(',')}`;
+    }
+    const res = await fetch(url);
+    const delta = await res.json();
+    if (!res.ok) throw new Error(delta.message);
+
+    const updated = applyDelta(incremental ? snapshot : null, delta, userId);
+    await writeSnapshot(updated);
+    console.log(`DEBUG: 衣櫃同步完成 (新增 ${delta.images.length}，刪除 ${delta.deleted.length}，完整快照: ${delta.reset})`);
+    return updated;
+  } catch (err) {
+    console.warn("WARN: 衣櫃同步失敗，改為直接從後端載入:", err);
+    return null;
+  }
+}
+
+// 載入下一頁衣櫃圖片並附加到畫面上
+async function loadMoreWardrobe() {
+  const userId = window.userId;
+  const state = wardrobeState;
+  if (!userId || state.loading || state.done) return;
+
+  // 從本機快取分頁顯示
+  if (state.localItems) {
+    const page = state.localItems.slice(state.offset, state.offset + WARDROBE_PAGE_SIZE);
+    state.offset += page.length;
+    state.done = state.offset >= state.localItems.length;
+    appendImages(page);
+    return;
+  }
+
+  state.loading = true;
+  try {
+    let url = `${backendURL}/wardrobe?user_id=${userId}&category=${state.category}&size=thumb&limit=${WARDROBE_PAGE_SIZE}`;
+    if (state.cursor) url += `&cursor=${encodeURIComponent(state.cursor)}`;
     console.log("DEBUG: 從後端獲取衣櫃:", url);
     const res = await fetch(url);
     const data = await res.json();
-    displayImages(data.images);
+    // 載入期間若已重新整理衣櫃 (例如上傳或刪除後)，丟棄舊的結果
+    if (state !== wardrobeState) return;
+    appendImages(data.images || []);
+    state.cursor = data.next_cursor || null;
+    state.done = !state.cursor;
   } catch (err) {
     console.error("❌ 載入衣櫃失敗", err);
+  } finally {
+    state.loading = false;
   }
 }
 
-// 顯示圖片
-function displayImages(images) {
-  const categorySections = {
+function getCategorySections() {
+  return {
     "top": document.getElementById("top-container"),
     "bottom": document.getElementById("bottom-container"),
     "skirt": document.getElementById("skirt-container"),
     "dress": document.getElementById("dress-container"),
     "shoes": document.getElementById("shoes-container")
   };
+}
 
+function clearImages() {
+  const categorySections = getCategorySections();
   for (const key in categorySections) {
     if (categorySections[key]) categorySections[key].innerHTML = "";
   }
+}
+
+// 顯示圖片 (附加在各類別既有圖片之後)
+function appendImages(images) {
+  const categorySections = getCategorySections();
 
   images.forEach(img => {
     if (!categorySections[img.category]) return;
@@ -114,6 +223,7 @@ function displayImages(images) {
     const checkbox = document.createElement("input");
     checkbox.type = "checkbox";
     checkbox.dataset.path = img.path;
+    if (img.id) checkbox.dataset.id = img.id;
     checkbox.style.marginTop = "5px";
 
     wrapper.appendChild(imgElement);
@@ -131,15 +241,21 @@ async function deleteSelected() {
   const checkboxes = document.querySelectorAll("#image-list input[type=checkbox]:checked");
   if (!checkboxes.length) return;
 
-  const paths = Array.from(checkboxes).map(cb => cb.dataset.path);
+  // 有項目 id 的直接以 id 刪除，其餘 (舊資料) 才傳送圖片網址
+  const selected = Array.from(checkboxes);
+  const ids = selected.filter(cb => cb.dataset.id).map(cb => cb.dataset.id);
+  const paths = selected.filter(cb => !cb.dataset.id).map(cb => cb.dataset.path);
   try {
     const res = await fetch(`${backendURL}/delete`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ user_id: userId, paths }),
+      body: JSON.stringify({ user_id: userId, ids, paths }),
     });
     const data = await res.json();
-    if (data.status === 'ok') {
+    if (data.status === 'ok' && data.failed) {
+      document.getElementById('status').innerText = `⚠️ 已刪除 ${data.deleted} 張，${data.failed} 張刪除失敗`;
+      loadWardrobe();
+    } else if (data.status === 'ok') {
       document.getElementById('status').innerText = "✅ 刪除成功！";
       loadWardrobe();
     } else {
@@ -161,4 +277,30 @@ export function initUploadFeatures() {
   }
   const deleteButton = document.getElementById('delete-button');
   if (deleteButton) deleteButton.addEventListener('click', deleteSelected);
+  initInfiniteScroll();
+}
+
+// 無限捲動：頁面捲到衣櫃底部，或任一類別橫向捲到末端時載入下一頁
+function initInfiniteScroll() {
+  const imageList = document.getElementById('image-list');
+  if (!imageList) return;
+
+  const sentinel = document.createElement("div");
+  sentinel.id = "wardrobe-sentinel";
+  imageList.after(sentinel);
+  if ('IntersectionObserver' in window) {
+    const observer = new IntersectionObserver(entries => {
+      if (entries.some(entry => entry.isIntersecting)) loadMoreWardrobe();
+    }, { rootMargin: `${WARDROBE_PREFETCH_PX}px` });
+    observer.observe(sentinel);
+  }
+
+  Object.values(getCategorySections()).forEach(container => {
+    if (!container) return;
+    container.addEventListener('scroll', () => {
+      if (container.scrollLeft + container.clientWidth >= container.scrollWidth - WARDROBE_PREFETCH_PX) {
+        loadMoreWardrobe();
+      }
+    }, { passive: true });
+  });
 }
@@ -1,6 +1,10 @@
 // frontend/js/wannabe-upload.js
 import { backendURL } from './liff-init.js';
 
+// 姿勢矯正在後端以背景工作執行 (RunningHub 任務最久約 5 分鐘)，前端定期查詢工作狀態
+const POSE_POLL_INTERVAL_MS = 3000;
+const POSE_POLL_TIMEOUT_MS = 6 * 60 * 1000;
+
 // 上傳並即時顯示「我想成為」圖片（去背結果）
 async function uploadWannabeImages() {
   console.log("DEBUG: uploadWannabeImages 被觸發 (支援多檔案 & 即時顯示)");
@@ -40,28 +44,10 @@ async function uploadWannabeImages() {
         console.log(`INFO: ${file.name} 上傳成功，立即顯示去背結果`);
 
         // 即時把回傳的 URL 加入畫面
-        appendWannabeImage(data.path);
-
-        // *** 新增：呼叫姿勢矯正 API ***
-        console.log(`DEBUG: 對 ${file.name} 呼叫姿勢矯正 API...`);
-        const poseCorrectionFormData = new FormData();
-        poseCorrectionFormData.append('image', file); // 傳送原始圖片給姿勢矯正
-        try {
-            const poseRes = await fetch(`${backendURL}/pose_correction`, {
-                method: 'POST',
-                body: poseCorrectionFormData
-            });
-            const poseData = await poseRes.json();
-            if (poseData.status === 'ok' && poseData.result) {
-                console.log(`INFO: 姿勢矯正成功，添加矯正後圖片: ${poseData.result}`);
-                appendWannabeImage(poseData.result, " (矯正後)"); // 添加矯正後的圖片，可選加上標籤
-            } else {
-                console.warn(`WARN: 姿勢矯正失敗或未返回圖片: ${poseData.message || '未知錯誤'}`);
-            }
-        } catch (poseErr) {
-            console.error(`❌ 姿勢矯正 API 呼叫錯誤:`, poseErr);
-        }
-        // ****************************
+        appendWannabeImage(data.path, "", data.id);
+
+        // 送出姿勢矯正工作；不等待結果，完成後再把矯正後的圖片加入畫面
+        requestPoseCorrection(file);
 
       } else {
         failCount++;
@@ -81,8 +67,46 @@ async function uploadWannabeImages() {
   input.value = ''; // 清空選擇
 }
 
+// 送出姿勢矯正工作並在背景查詢狀態，完成後添加矯正後的圖片
+async function requestPoseCorrection(file) {
+  console.log(`DEBUG: 對 ${file.name} 呼叫姿勢矯正 API...`);
+  const poseCorrectionFormData = new FormData();
+  poseCorrectionFormData.append('image', file); // 傳送原始圖片給姿勢矯正
+
+  try {
+    const poseRes = await fetch(`${backendURL}/pose_correction`, {
+      method: 'POST',
+      body: poseCorrectionFormData
+    });
+    const poseData = await poseRes.json();
+    if (poseRes.status !== 202 || !poseData.job_id) {
+      console.warn(`WARN: 姿勢矯正工作送出失敗: ${poseData.message || '未知錯誤'}`);
+      return;
+    }
+
+    const deadline = Date.now() + POSE_POLL_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      await new Promise(resolve => setTimeout(resolve, POSE_POLL_INTERVAL_MS));
+      const jobRes = await fetch(`${backendURL}${poseData.status_url}`);
+      const job = await jobRes.json();
+      if (job.status === 'succeeded' && job.result) {
+        console.log(`INFO: 姿勢矯正成功，添加矯正後圖片: ${job.result}`);
+        appendWannabeImage(job.result, " (矯正後)"); // 添加矯正後的圖片，可選加上標籤
+        return;
+      }
+      if (job.status === 'failed' || jobRes.status === 404) {
+        console.warn(`WARN: 姿勢矯正失敗或未返回圖片: ${job.error || job.message || '未知錯誤'}`);
+        return;
+      }
+    }
+    console.warn(`WARN: 姿勢矯正工作 ${poseData.job_id} 查詢逾時`);
+  } catch (poseErr) {
+    console.error(`❌ 姿勢矯正 API 呼叫錯誤:`, poseErr);
+  }
+}
+
 // 即時插入單張圖片到頁面
-function appendWannabeImage(url, suffix = "") { // 增加一個 suffix 參數
+function appendWannabeImage(url, suffix = "", id = null) { // 增加一個 suffix 參數
   const container = document.getElementById("wannabe-container");
   if (!container) return;
 
@@ -105,6 +129,7 @@ function appendWannabeImage(url, suffix = "") { // 增加一個 suffix 參數
   const checkbox = document.createElement("input");
   checkbox.type = "checkbox";
   checkbox.dataset.path = url;
+  if (id) checkbox.dataset.id = id;
   checkbox.style.marginTop = "5px";
 
   wrapper.appendChild(imgElement);
@@ -119,7 +144,7 @@ export async function loadWannabeWardrobe() {
   if (!userId) return;
 
   try {
-    const url = `${backendURL}/wannabe_wardrobe?user_id=${userId}`;
+    const url = `${backendURL}/wannabe_wardrobe?user_id=${userId}&size=thumb`;
     const res = await fetch(url);
     const data = await res.json();
     displayWannabeImages(data.images);
@@ -139,7 +164,7 @@ function displayWannabeImages(images) {
     return;
   }
 
-  images.forEach(img => appendWannabeImage(img.path));
+  images.forEach(img => appendWannabeImage(img.path, "", img.id));
 }
 
 // 刪除選取的「我想成為」圖片
@@ -150,16 +175,22 @@ async function deleteSelectedWannabe() {
   const checkboxes = document.querySelectorAll("#wannabe-image-list input[type=checkbox]:checked");
   if (!checkboxes.length) return;
 
-  const paths = Array.from(checkboxes).map(cb => cb.dataset.path);
+  // 有項目 id 的直接以 id 刪除，其餘 (舊資料) 才傳送圖片網址
+  const selected = Array.from(checkboxes);
+  const ids = selected.filter(cb => cb.dataset.id).map(cb => cb.dataset.id);
+  const paths = selected.filter(cb => !cb.dataset.id).map(cb => cb.dataset.path);
 
   try {
     const res = await fetch(`${backendURL}/delete_wannabe`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ user_id: userId, paths }),
+      body: JSON.stringify({ user_id: userId, ids, paths }),
     });
     const data = await res.json();
-    if (data.status === 'ok') {
+    if (data.status === 'ok' && data.failed) {
+      document.getElementById('wannabe-status').innerText = `⚠️ 已刪除 ${data.deleted} 張，${data.failed} 張刪除失敗`;
+      loadWannabeWardrobe();
+    } else if (data.status === 'ok') {
       document.getElementById('wannabe-status').innerText = "✅ 刪除成功！";
       loadWannabeWardrobe();
     } else {
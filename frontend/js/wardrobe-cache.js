@@ -0,0 +1,62 @@
+// frontend/js/wardrobe-cache.js
+// 衣櫃的本機快取 (IndexedDB)：保存上次同步的項目與 sync token，
+// 之後只向後端要求變更 (/wardrobe?since=...)，不必每次重新下載整個衣櫃
+
+const DB_NAME = 'wardrobe-cache';
+const DB_VERSION = 1;
+const STORE = 'snapshots';
+
+let dbPromise = null;
+
+function openDatabase() {
+  if (!dbPromise) {
+    dbPromise = new Promise((resolve, reject) => {
+      if (!('indexedDB' in window)) {
+        reject(new Error('此瀏覽器不支援 IndexedDB'));
+        return;
+      }
+      const request = indexedDB.open(DB_NAME, DB_VERSION);
+      request.onupgradeneeded = () => request.result.createObjectStore(STORE, { keyPath: 'userId' });
+      request.onsuccess = () => resolve(request.result);
+      request.onerror = () => reject(request.error);
+    });
+    // 開啟失敗時允許下次重試
+    dbPromise.catch(() => { dbPromise = null; });
+  }
+  return dbPromise;
+}
+
+async function withStore(mode, action) {
+  const db = await openDatabase();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(STORE, mode);
+    const request = action(tx.objectStore(STORE));
+    tx.oncomplete = () => resolve(request.result);
+    tx.onerror = () => reject(tx.error);
+    tx.onabort = () => reject(tx.error);
+  });
+}
+
+// 讀取使用者的快取快照：{ userId, syncToken, items: { [id]: item } }，沒有時回傳 null
+export async function readSnapshot(userId) {
+  return (await withStore('readonly', store => store.get(userId))) || null;
+}
+
+export async function writeSnapshot(snapshot) {
+  await withStore('readwrite', store => store.put(snapshot));
+}
+
+// 將後端回傳的變更套用到快照 (以 id 為鍵，重複套用同一筆變更結果不變)
+export function applyDelta(snapshot, delta, userId) {
+  const items = (snapshot && !delta.reset) ? { ...snapshot.items } : {};
+  (delta.images || []).forEach(item => { items[item.id] = item; });
+  (delta.deleted || []).forEach(id => { delete items[id]; });
+  return { userId, syncToken: delta.sync_token, items };
+}
+
+// 依上傳時間由新到舊排序 (與後端列表相同)
+export function sortedItems(snapshot, category = "all") {
+  return Object.values(snapshot.items)
+    .filter(item => category === "all" || item.category === category)
+    .sort((a, b) => (b.timestamp || "").localeCompare(a.timestamp || "") || b.id.localeCompare(a.id));
+}
@@ -0,0 +1,15 @@
+"""
+Gunicorn 設定 (gunicorn 會自動載入目前目錄下的 gunicorn.conf.py)
+
+啟動預熱的背景執行緒必須在 worker 行程中建立：以 --preload 啟動時 app 模組在 master 中載入，
+fork 前建立的執行緒不會帶到 worker。
+"""
+
+import sys
+
+
+def post_worker_init(worker):
+    # worker 已載入 app (或從 master 繼承) 後，在此 worker 中啟動預熱
+    app_module = sys.modules.get("app")
+    if app_module is not None:
+        app_module.startup_warmup.start()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+離線的 RunningHub 替身 (fake RunningHub)
+
+提供 RH05.RunningHubImageProcessor 用到的 API，讓姿勢矯正流程 (上傳 → 建立任務 → 等待 → 取得結果)
+不需要真實的 RunningHub 帳號與網路即可測試：
+- GET  /task/openapi/workflow/list  回傳固定的工作流 id
+- POST /task/openapi/upload         保存上傳的圖片 (只在記憶體中)
+- POST /task/openapi/create         建立任務；依 --queued / --running 秒數模擬 QUEUED → RUNNING → SUCCESS，
+                                    有 webhookUrl 時在任務結束後 POST 完成通知 (格式與 RunningHub 相同)
+- POST /task/openapi/status         回傳目前狀態
+- POST /task/openapi/outputs        任務成功後回傳結果網址 (結果圖片即為上傳的原圖)
+- GET  /files/<name>                下載結果圖片
+
+搭配本服務使用：
+  python scripts/fake_runninghub.py --port 9000 --queued 2 --running 8
+  RUNNINGHUB_BASE_URL=http://localhost:9000 RUNNINGHUB_WEBHOOK_BASE_URL=http://localhost:8080 python app.py
+
+使用範例:
+  python scripts/fake_runninghub.py --fail-rate 0.2
+  python scripts/fake_runninghub.py --drop-webhooks 0.5      # 模擬漏接的通知，測試備援輪詢
+  python scripts/fake_runninghub.py --webhook-delay 1.5
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+
+import requests
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+
+WORKFLOW_ID = "fake-workflow"
+_lock = threading.Lock()
+_files = {}
+_tasks = {}
+_counters = {"status_calls": 0, "webhooks_sent": 0, "webhooks_dropped": 0}
+options = argparse.Namespace(queued=2.0, running=8.0, jitter=0.2, fail_rate=0.0, webhook_delay=0.0, drop_webhooks=0.0)
+
+
+def task_status(task):
+    elapsed = time.time() - task["created_at"]
+    if elapsed < task["queued"]:
+        return "QUEUED"
+    if elapsed < task["queued"] + task["running"]:
+        return "RUNNING"
+    return "FAILED" if task["fail"] else "SUCCESS"
+
+
+def outputs_response(task):
+    if task["fail"]:
+        return {"code": 805, "msg": "APIKEY_TASK_STATUS_ERROR", "data": None}
+    url = f"{task['host_url']}files/{task['file_name'].replace('/', '_')}"
+    return {"code": 0, "msg": "success", "data": [{"fileUrl": url, "fileType": "png", "taskCostTime": "0"}]}
+
+
+def send_webhook(task_id):
+    with _lock:
+        task = _tasks[task_id]
+    if random.random() < options.drop_webhooks:
+        with _lock:
+            _counters["webhooks_dropped"] += 1
+        print(f"DEBUG: dropped webhook for task {task_id}")
+        return
+    payload = {"event": "TASK_END", "taskId": task_id, "eventData": json.dumps(outputs_response(task))}
+    try:
+        response = requests.post(task["webhook_url"], json=payload, timeout=10)
+        print(f"DEBUG: webhook for task {task_id} -> {response.status_code} {response.text.strip()[:200]}")
+        with _lock:
+            _counters["webhooks_sent"] += 1
+    except requests.RequestException as e:
+        print(f"WARN: webhook for task {task_id} failed: {e}", file=sys.stderr)
+
+
+@app.route('/task/openapi/workflow/list', methods=['GET'])
+def workflow_list():
+    return jsonify({"code": 0, "msg": "success", "data": [{"id": WORKFLOW_ID}]})
+
+
+@app.route('/task/openapi/upload', methods=['POST'])
+def upload():
+    file = request.files.get('file')
+    if file is None:
+        return jsonify({"code": 1, "msg": "missing file"})
+    file_name = f"api/{uuid.uuid4().hex}.png"
+    with _lock:
+        _files[file_name.replace('/', '_')] = file.read()
+    return jsonify({"code": 0, "msg": "success", "data": {"fileName": file_name, "fileType": "image"}})
+
+
+@app.route('/task/openapi/create', methods=['POST'])
+def create():
+    payload = request.get_json(silent=True) or {}
+    file_name = next((node.get('fieldValue') for node in payload.get('nodeInfoList', [])
+                      if node.get('fieldName') == 'image'), None)
+    with _lock:
+        known = file_name is not None and file_name.replace('/', '_') in _files
+    if not known:
+        return jsonify({"code": 1, "msg": "unknown image", "data": None})
+
+    def jittered(seconds):
+        return max(0.0, seconds * random.uniform(1 - options.jitter, 1 + options.jitter))
+
+    task_id = str(random.randrange(10 ** 18, 10 ** 19))
+    task = {
+        "created_at": time.time(),
+        "queued": jittered(options.queued),
+        "running": jittered(options.running),
+        "fail": random.random() < options.fail_rate,
+        "file_name": file_name,
+        "host_url": request.host_url,
+        "webhook_url": payload.get('webhookUrl'),
+    }
+    with _lock:
+        _tasks[task_id] = task
+    if task["webhook_url"]:
+        timer = threading.Timer(task["queued"] + task["running"] + options.webhook_delay, send_webhook, (task_id,))
+        timer.daemon = True
+        timer.start()
+    return jsonify({"code": 0, "msg": "success", "data": {"taskId": task_id, "taskStatus": "QUEUED"}})
+
+
+@app.route('/task/openapi/status', methods=['POST'])
+def status():
+    task_id = str((request.get_json(silent=True) or {}).get('taskId'))
+    with _lock:
+        _counters["status_calls"] += 1
+        task = _tasks.get(task_id)
+    if task is None:
+        return jsonify({"code": 1, "msg": "task not found", "data": None})
+    return jsonify({"code": 0, "msg": "success", "data": task_status(task)})
+
+
+@app.route('/task/openapi/outputs', methods=['POST'])
+def outputs():
+    task_id = str((request.get_json(silent=True) or {}).get('taskId'))
+    with _lock:
+        task = _tasks.get(task_id)
+    if task is None:
+        return jsonify({"code": 1, "msg": "task not found", "data": None})
+    if task_status(task) in ("QUEUED", "RUNNING"):
+        return jsonify({"code": 804, "msg": "APIKEY_TASK_IS_RUNNING", "data": None})
+    return jsonify(outputs_response(task))
+
+
+@app.route('/files/<name>', methods=['GET'])
+def files(name):
+    with _lock:
+        data = _files.get(name)
+    if data is None:
+        return Response(status=404)
+    return Response(data, mimetype="image/png")
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    with _lock:
+        return jsonify({"tasks": len(_tasks), **_counters})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="離線的 RunningHub 替身")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--queued', type=float, default=2.0, help='任務排隊秒數')
+    parser.add_argument('--running', type=float, default=8.0, help='任務執行秒數')
+    parser.add_argument('--jitter', type=float, default=0.2, help='排隊與執行秒數的隨機變動比例')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='任務失敗的機率')
+    parser.add_argument('--webhook-delay', type=float, default=0.0, help='任務結束後延遲多少秒才送出通知')
+    parser.add_argument('--drop-webhooks', type=float, default=0.0, help='不送出通知的機率 (測試備援輪詢)')
+    parser.add_argument('--seed', type=int, help='亂數種子')
+    args = parser.parse_args()
+
+    vars(options).update({key: getattr(args, key) for key in vars(options)})
+    if args.seed is not None:
+        random.seed(args.seed)
+    print(f"INFO: fake RunningHub on http://{args.host}:{args.port} ({vars(options)})")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+將既有的衣物文件改以 blob 名稱為 doc id
+
+舊版以 Firestore 自動產生的 doc id 建立文件，刪除時只能以 filename 查詢。
+新版以原圖的 blob 名稱為 doc id (見 app.py 的 item_doc_id)，這個腳本把舊文件搬到新的 key：
+1. 逐一列出每位使用者的 items，找出 doc id 與 filename 不同的文件
+2. 在同一個 WriteBatch 中以新 key 寫入相同資料並刪除舊文件；
+   衣櫃 (wardrobe) 另外為舊 id 寫入 tombstone，讓增量同步的用戶端移除舊項目
+3. 有搬動的使用者遞增版本號 (列表 ETag 與快取失效)，衣櫃另外記錄 resync_at，
+   讓同步 token 早於遷移的用戶端重新取得完整快照
+
+可重複執行；已遷移的文件會被略過。新 key 已經存在時不覆蓋，只刪除舊文件。
+
+使用範例:
+  python scripts/migrate_item_ids.py --dry-run
+  python scripts/migrate_item_ids.py --collection wardrobe --user U1234
+  python scripts/migrate_item_ids.py --workers 16
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+COLLECTIONS = ('wardrobe', 'wannabe_wardrobe')
+# 每個文件最多 3 次寫入 (新文件、刪除舊文件、tombstone)，Firestore batch 上限為 500 次寫入
+DOCS_PER_BATCH = 150
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get("TOMBSTONE_RETENTION_DAYS", 30))
+
+
+def migrate_user(db, firestore, collection, user_id, dry_run=False):
+    """
+    遷移單一使用者的文件
+
+    Returns:
+        (已搬動, 已略過 (已是新 key 或沒有 filename), 衝突 (新 key 已存在))
+    """
+    user_ref = db.collection(collection).document(user_id)
+    items_ref = user_ref.collection('items')
+    pending = []
+    skipped = 0
+    for doc in items_ref.stream():
+        filename = (doc.to_dict() or {}).get('filename')
+        if not filename or doc.id == filename or '/' in filename:
+            skipped += 1
+            continue
+        pending.append(doc)
+
+    existing = set()
+    for start in range(0, len(pending), 100):
+        refs = [items_ref.document(doc.get('filename')) for doc in pending[start:start + 100]]
+        existing.update(snapshot.id for snapshot in db.get_all(refs) if snapshot.exists)
+
+    moved = conflicts = 0
+    expire_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    for start in range(0, len(pending), DOCS_PER_BATCH):
+        batch = db.batch()
+        writes = 0
+        for doc in pending[start:start + DOCS_PER_BATCH]:
+            item_data = doc.to_dict()
+            filename = item_data['filename']
+            if filename in existing:
+                # 同一張圖已有新 key 的文件 (例如中途失敗後重新執行)，只移除舊文件
+                conflicts += 1
+            else:
+                batch.set(items_ref.document(filename), item_data)
+            batch.delete(doc.reference)
+            if collection == 'wardrobe':
+                batch.set(user_ref.collection('tombstones').document(doc.id), {
+                    'filename': filename,
+                    'category': item_data.get('category'),
+                    'deleted_at': firestore.SERVER_TIMESTAMP,
+                    'expire_at': expire_at,
+                })
+            writes += 1
+        if writes and not dry_run:
+            batch.commit()
+        moved += writes
+
+    if moved and not dry_run:
+        update = {'version': firestore.Increment(1)}
+        if collection == 'wardrobe':
+            update['resync_at'] = firestore.SERVER_TIMESTAMP
+        user_ref.set(update, merge=True)
+    return moved, skipped, conflicts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="將衣物文件改以 blob 名稱為 doc id")
+    parser.add_argument('--collection', choices=COLLECTIONS, action='append',
+                        help='只遷移指定的 collection (可重複；預設全部)')
+    parser.add_argument('--user', action='append', help='只遷移指定的使用者 (可重複；預設全部)')
+    parser.add_argument('--workers', type=int, default=8, help='同時處理的使用者數')
+    parser.add_argument('--dry-run', action='store_true', help='只統計，不寫入')
+    args = parser.parse_args()
+
+    from google.cloud import firestore
+
+    db = firestore.Client()
+    totals = {"users": 0, "moved": 0, "skipped": 0, "conflicts": 0, "errors": 0}
+    started = time.perf_counter()
+
+    for collection in args.collection or COLLECTIONS:
+        # list_documents 也會列出只有子集合、本身沒有欄位的使用者文件
+        user_ids = args.user or [ref.id for ref in db.collection(collection).list_documents()]
+        print(f"INFO: {collection}: {len(user_ids)} users")
+
+        def run(user_id):
+            try:
+                return user_id, migrate_user(db, firestore, collection, user_id, dry_run=args.dry_run), None
+            except Exception as e:
+                return user_id, None, e
+
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            for user_id, result, error in pool.map(run, user_ids):
+                totals["users"] += 1
+                if error is not None:
+                    totals["errors"] += 1
+                    print(f"ERROR: {collection}/{user_id}: {error}", file=sys.stderr)
+                    continue
+                moved, skipped, conflicts = result
+                totals["moved"] += moved
+                totals["skipped"] += skipped
+                totals["conflicts"] += conflicts
+                if moved:
+                    print(f"DEBUG: {collection}/{user_id}: moved {moved}, skipped {skipped}, conflicts {conflicts}")
+
+    prefix = "DRY RUN " if args.dry_run else ""
+    print(f"INFO: {prefix}done in {time.perf_counter() - started:.1f}s: {totals}")
+    if totals["errors"]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+在建置階段安裝去背模型
+
+Cloud Run 的 /tmp 是記憶體檔案系統且每次冷啟動都會清空，若讓 rembg 在第一個請求時
+才下載 u2net (約 170 MB)，每個新實例都要重新下載並佔用記憶體。
+這個腳本在 docker build 時：
+1. 透過 rembg 下載模型到 --dir (即執行時的 U2NET_HOME)；rembg 會以內建的 md5 驗證下載內容
+2. 實際建立一次 session，確認模型可以被 ONNX Runtime 載入
+3. 計算 sha256 寫入 MANIFEST.sha256；若提供 --checksums 則與固定的雜湊比對，不符即失敗
+
+執行時 backend/utils/sessions.py 會依 MANIFEST.sha256 檢查模型檔。
+
+使用範例:
+  python scripts/provision_models.py --dir /opt/models u2net u2netp
+  python scripts/provision_models.py --dir /opt/models --checksums models.sha256 u2net
+  python scripts/provision_models.py --dir /opt/models --verify-only
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def read_pinned_checksums(path: str) -> dict:
+    """讀取 sha256sum 格式的檔案：<sha256>  <檔名>"""
+    pinned = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip() and not line.startswith('#'):
+                digest, name = line.split(None, 1)
+                pinned[name.strip().lstrip('*')] = digest.lower()
+    return pinned
+
+
+def main():
+    parser = argparse.ArgumentParser(description="下載並驗證 rembg 模型")
+    parser.add_argument('models', nargs='*', default=['u2net'], help='rembg 模型名稱 (預設 u2net)')
+    parser.add_argument('--dir', default=os.environ.get('U2NET_HOME', '/opt/models'), help='模型安裝目錄')
+    parser.add_argument('--checksums', help='固定的 sha256 清單 (sha256sum 格式)，不符時建置失敗')
+    parser.add_argument('--verify-only', action='store_true', help='只依 MANIFEST.sha256 驗證既有模型')
+    args = parser.parse_args()
+
+    # rembg 會依 U2NET_HOME 決定模型位置，必須在 import rembg 之前設定
+    os.environ['U2NET_HOME'] = args.dir
+    os.makedirs(args.dir, exist_ok=True)
+
+    from backend.utils.sessions import (
+        MANIFEST_NAME, ModelVerificationError, SessionConfig, build_session, verify_model_dir, write_manifest,
+    )
+
+    if args.verify_only:
+        try:
+            entries = verify_model_dir(args.dir, full_hash=True)
+        except ModelVerificationError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            sys.exit(1)
+        if not entries:
+            print(f"❌ {args.dir} 中沒有 {MANIFEST_NAME}", file=sys.stderr)
+            sys.exit(1)
+        print(f"✅ {len(entries)} 個模型檔驗證通過")
+        return
+
+    for model in args.models:
+        start = time.perf_counter()
+        build_session(SessionConfig(model=model))
+        print(f"✅ {model} 已安裝並可載入 ({time.perf_counter() - start:.1f}s)")
+
+    names = [name for name in os.listdir(args.dir) if name.endswith('.onnx')]
+    entries = write_manifest(args.dir, names)
+    for name, entry in entries.items():
+        print(f"   {name}: {entry['size'] / 1e6:.1f} MB sha256={entry['sha256']}")
+
+    if args.checksums:
+        pinned = read_pinned_checksums(args.checksums)
+        failed = False
+        for name, digest in pinned.items():
+            actual = entries.get(name, {}).get("sha256")
+            if actual != digest:
+                print(f"❌ {name} sha256 不符：預期 {digest}，實際 {actual}", file=sys.stderr)
+                failed = True
+        if failed:
+            sys.exit(1)
+        print(f"✅ 與 {args.checksums} 比對通過")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+產生 INT8 量化版的分割模型
+
+- dynamic: 權重量化為 INT8，activation 於執行時動態量化，不需要校正資料
+- static:  以本機圖片做校正 (QDQ 格式)，activation 與權重皆為 INT8，CPU 上通常較快
+
+產生的檔案以 rembg 的 u2net_custom session 載入：
+  REMBG_MODEL=u2net_custom REMBG_MODEL_PATH=/models/u2net_int8.onnx
+
+使用範例:
+  python scripts/quantize_model.py --mode dynamic -o models/u2net_int8_dynamic.onnx
+  python scripts/quantize_model.py --mode static --calibration-images ./samples -o models/u2net_int8.onnx
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.webp'}
+# 與 rembg 的 u2net session 相同的前處理參數
+INPUT_SIZE = (320, 320)
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+
+def default_model_path(model_name: str) -> Path:
+    """rembg 下載模型的位置 (U2NET_HOME，預設 ~/.u2net)；不存在時先讓 rembg 下載"""
+    home = Path(os.environ.get("U2NET_HOME", Path(os.environ.get("XDG_DATA_HOME", "~")).expanduser() / ".u2net"))
+    path = home / f"{model_name}.onnx"
+    if not path.exists():
+        from rembg import new_session
+
+        print(f"INFO: {path} 不存在，透過 rembg 下載 {model_name}...")
+        new_session(model_name)
+    return path
+
+
+def preprocess(image_path: Path):
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    img = ImageOps.exif_transpose(Image.open(image_path)).convert("RGB").resize(INPUT_SIZE, Image.LANCZOS)
+    arr = np.asarray(img, dtype=np.float32)
+    arr = arr / max(float(arr.max()), 1e-6)
+    arr = (arr - np.array(MEAN, dtype=np.float32)) / np.array(STD, dtype=np.float32)
+    return np.expand_dims(arr.transpose((2, 0, 1)), 0).astype(np.float32)
+
+
+class ImageCalibrationReader:
+    """onnxruntime.quantization.CalibrationDataReader：逐張提供校正輸入"""
+
+    def __init__(self, input_name: str, image_dir: str, limit: int):
+        paths = sorted(p for p in Path(image_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)[:limit]
+        if not paths:
+            raise SystemExit(f"ERROR: {image_dir} 中沒有可用的校正圖片")
+        print(f"INFO: 使用 {len(paths)} 張圖片校正")
+        self._batches = iter([{input_name: preprocess(p)} for p in paths])
+
+    def get_next(self):
+        return next(self._batches, None)
+
+
+def sha256sum(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="將 rembg 分割模型量化為 INT8")
+    parser.add_argument('--model', default='u2net', help='rembg 模型名稱 (用於尋找 FP32 模型)')
+    parser.add_argument('--input', help='FP32 ONNX 路徑 (預設為 rembg 下載位置)')
+    parser.add_argument('-o', '--output', required=True, help='輸出的 INT8 ONNX 路徑')
+    parser.add_argument('--mode', choices=['dynamic', 'static'], default='static')
+    parser.add_argument('--calibration-images', help='static 模式的校正圖片資料夾')
+    parser.add_argument('--calibration-limit', type=int, default=64, help='最多使用幾張校正圖片')
+    parser.add_argument('--per-channel', action='store_true', help='權重使用 per-channel 量化 (精度較佳)')
+    args = parser.parse_args()
+
+    import onnxruntime as ort
+    from onnxruntime.quantization import (
+        CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    source = Path(args.input) if args.input else default_model_path(args.model)
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    # 先做 shape inference 與圖最佳化，量化器才能辨識所有 Conv
+    prepared = output.with_suffix(".prep.onnx")
+    quant_pre_process(str(source), str(prepared))
+
+    try:
+        if args.mode == 'dynamic':
+            quantize_dynamic(
+                str(prepared), str(output),
+                weight_type=QuantType.QInt8,
+                per_channel=args.per_channel,
+            )
+        else:
+            if not args.calibration_images:
+                raise SystemExit("ERROR: static 模式需要 --calibration-images")
+            input_name = ort.InferenceSession(str(prepared), providers=["CPUExecutionProvider"]).get_inputs()[0].name
+            quantize_static(
+                str(prepared), str(output),
+                ImageCalibrationReader(input_name, args.calibration_images, args.calibration_limit),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=args.per_channel,
+                calibrate_method=CalibrationMethod.MinMax,
+            )
+    finally:
+        if prepared.exists():
+            prepared.unlink()
+
+    print(f"✅ 量化完成 ({args.mode})")
+    print(f"   FP32: {source} ({source.stat().st_size / 1e6:.1f} MB)")
+    print(f"   INT8: {output} ({output.stat().st_size / 1e6:.1f} MB)")
+    print(f"   sha256: {sha256sum(output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+UserItemCache：超過單一使用者上限的使用者只探測一次，之後直接走分頁查詢
+"""
+
+from backend.utils.item_cache import UserItemCache
+
+MAX_PER_USER = 3
+
+
+class FakeStore:
+    def __init__(self, count):
+        self.items = [(f"item{i}", {"category": "top"}) for i in range(count)]
+        self.list_limits = []
+
+    def list_items(self, collection, user_id, limit=None):
+        self.list_limits.append(limit)
+        return self.items[:limit]
+
+
+def make_loader(store):
+    # 與 app.load_user_items 相同：多讀一筆判斷是否超過上限
+    def load():
+        items = store.list_items("wardrobe", "u1", limit=MAX_PER_USER + 1)
+        return None if len(items) > MAX_PER_USER else items
+    return load
+
+
+def test_oversized_user_is_probed_once_per_version():
+    cache = UserItemCache(max_items=100, max_items_per_user=MAX_PER_USER)
+    store = FakeStore(10)
+
+    assert cache.get("wardrobe", "u1", 1, make_loader(store)) is None
+    assert cache.get("wardrobe", "u1", 1, make_loader(store)) is None
+    assert store.list_limits == [MAX_PER_USER + 1]
+    assert cache.stats()["oversized_hits"] == 1
+
+    # 版本號改變 (有寫入) 後重新探測
+    assert cache.get("wardrobe", "u1", 2, make_loader(store)) is None
+    assert store.list_limits == [MAX_PER_USER + 1, MAX_PER_USER + 1]
+
+
+def test_oversized_marker_cleared_by_invalidate():
+    cache = UserItemCache(max_items=100, max_items_per_user=MAX_PER_USER)
+    store = FakeStore(10)
+    cache.get("wardrobe", "u1", 1, make_loader(store))
+    cache.invalidate("wardrobe", "u1")
+    store.items = store.items[:2]
+    assert cache.get("wardrobe", "u1", 1, make_loader(store)) == store.items
+    assert len(store.list_limits) == 2
+
+
+def test_small_user_is_cached():
+    cache = UserItemCache(max_items=100, max_items_per_user=MAX_PER_USER)
+    store = FakeStore(2)
+    first = cache.get("wardrobe", "u1", 1, make_loader(store))
+    assert cache.get("wardrobe", "u1", 1, make_loader(store)) is first
+    assert store.list_limits == [MAX_PER_USER + 1]
@@ -0,0 +1,118 @@
+"""
+TaskPoller：狀態轉換 (QUEUED → RUNNING → SUCCESS)、逾時、webhook complete() 與全域查詢速率上限
+"""
+
+import threading
+import time
+
+from backend.utils.rh_poller import (
+    FAILED, QUEUED, RUNNING, SUCCESS, TIMEOUT, PollPolicy, RateLimiter, TaskPoller,
+)
+
+# 測試用的短間隔，讓整個流程在數十毫秒內完成
+FAST_POLICY = dict(min_interval=0.01, base_interval=0.02, max_interval=0.05)
+
+
+class FakeStatus:
+    """依查詢次數依序回傳狀態，最後一個狀態之後維持不變"""
+
+    def __init__(self, *statuses):
+        self.statuses = statuses
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, task_id):
+        with self._lock:
+            self.calls.append((task_id, time.monotonic()))
+            count = sum(1 for called_id, _ in self.calls if called_id == task_id)
+        return self.statuses[min(count, len(self.statuses)) - 1]
+
+
+def make_poller(check_status, max_requests_per_second=0, workers=2):
+    return TaskPoller(check_status, policy=PollPolicy(**FAST_POLICY),
+                      max_requests_per_second=max_requests_per_second, workers=workers, name="test")
+
+
+def test_queued_running_success():
+    status = FakeStatus(QUEUED, RUNNING, SUCCESS)
+    poller = make_poller(status)
+
+    assert poller.watch("t1", timeout=5).result(timeout=5) == SUCCESS
+    assert len(status.calls) == 3
+    stats = poller.stats()
+    assert stats["succeeded"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["checks_by_status"] == {QUEUED: 1, RUNNING: 1, SUCCESS: 1}
+    assert stats["workflow_estimates"]["default"]["samples"] == 1
+
+
+def test_watch_returns_same_future_for_same_task():
+    poller = make_poller(FakeStatus(RUNNING, SUCCESS))
+    future = poller.watch("t1", timeout=5)
+    assert poller.watch("t1", timeout=5) is future
+    assert future.result(timeout=5) == SUCCESS
+
+
+def test_timeout():
+    status = FakeStatus(RUNNING)
+    poller = make_poller(status)
+
+    assert poller.watch("t1", timeout=0.1).result(timeout=5) == TIMEOUT
+    stats = poller.stats()
+    assert stats["timed_out"] == 1
+    assert stats["in_flight"] == 0
+    # 逾時後不再查詢
+    calls = len(status.calls)
+    time.sleep(0.1)
+    assert len(status.calls) == calls
+
+
+def test_complete_only_once():
+    status = FakeStatus(RUNNING)
+    poller = make_poller(status)
+    # 已登記 webhook 的任務：備援輪詢間隔遠大於測試時間
+    future = poller.watch("t1", timeout=600, fallback_interval=600)
+
+    assert poller.complete("t1", SUCCESS) is True
+    assert future.result(timeout=1) == SUCCESS
+    assert poller.complete("t1", FAILED) is False
+    assert future.result() == SUCCESS
+    assert status.calls == []
+    stats = poller.stats()
+    assert stats["webhook_completions"] == 1
+    assert stats["webhook_unmatched"] == 1
+
+
+def test_complete_unknown_status_fails_task():
+    poller = make_poller(FakeStatus(RUNNING))
+    future = poller.watch("t1", timeout=600, fallback_interval=600)
+    assert poller.complete("t1", "SOMETHING_ELSE") is True
+    assert future.result(timeout=1) == FAILED
+
+
+def test_rate_limiter_token_bucket():
+    now = [0.0]
+    limiter = RateLimiter(5, burst=2, clock=lambda: now[0])
+
+    assert [limiter.reserve() for _ in range(4)] == [0.0, 0.0, 0.2, 0.4]
+    now[0] += 1.0
+    # 一秒補回 5 個 token，但最多累積 burst 個
+    assert [limiter.reserve() for _ in range(3)] == [0.0, 0.0, 0.2]
+    assert RateLimiter(0).reserve() == 0.0
+
+
+def test_rate_limit_caps_status_calls_per_second():
+    rate = 20
+    status = FakeStatus(RUNNING)
+    poller = make_poller(status, max_requests_per_second=rate, workers=1)
+    # 10 個任務各自每 10ms 就到期，不限速時每秒會有上千次查詢
+    futures = [poller.watch(f"t{i}", timeout=0.6) for i in range(10)]
+    for future in futures:
+        assert future.result(timeout=5) == TIMEOUT
+
+    times = sorted(called_at for _, called_at in status.calls)
+    window = 0.5
+    in_window = [t for t in times if t - times[0] <= window]
+    # token bucket：任何 window 秒內最多 burst (= workers) + rate * window 次
+    assert len(in_window) <= 1 + rate * window + 1
+    assert poller.stats()["throttled_seconds"] > 0
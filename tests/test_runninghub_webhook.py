@@ -0,0 +1,87 @@
+"""
+RunningHub webhook 回呼：失敗通知 (code != 0) 應讓等待中的姿勢矯正工作以 failed 結束
+"""
+
+import io
+import os
+import tempfile
+import time
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("requests")
+
+WEBHOOK_SECRET = "test-secret"
+_workdir = tempfile.mkdtemp(prefix="test_webhook_")
+os.environ.update({
+    "STARTUP_WARMUP": "0",
+    "METADATA_BACKEND": "sqlite",
+    "SQLITE_DB_PATH": os.path.join(_workdir, "metadata.sqlite"),
+    "OBJECT_STORE_BACKEND": "local",
+    "LOCAL_STORAGE_DIR": os.path.join(_workdir, "objects"),
+    "RUNNINGHUB_WEBHOOK_BASE_URL": "http://localhost:8080",
+    "RUNNINGHUB_WEBHOOK_SECRET": WEBHOOK_SECRET,
+    # 備援輪詢間隔遠大於測試時間，工作只能由 webhook 完成
+    "RUNNINGHUB_WEBHOOK_FALLBACK_POLL_SECONDS": "600",
+})
+
+import app as app_module  # noqa: E402
+
+
+class FakeRunningHubClient:
+    workflow_id = "fake-workflow"
+
+    def __init__(self):
+        self.webhook_urls = []
+
+    def upload_image(self, image, filename=None):
+        return "api/fake.png"
+
+    def create_task(self, filename, prompt_text="", webhook_url=None):
+        self.webhook_urls.append(webhook_url)
+        return "task-failed-1"
+
+    def check_task_status(self, task_id):
+        return "RUNNING"
+
+
+def wait_for_status(client, job_id, statuses, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        data = client.get(f"/pose_correction/{job_id}").get_json()
+        if data["status"] in statuses:
+            return data
+        time.sleep(0.05)
+    pytest.fail(f"job {job_id} did not reach {statuses}: {data}")
+
+
+def test_failure_callback_fails_waiting_job(monkeypatch):
+    fake = FakeRunningHubClient()
+    monkeypatch.setattr(app_module, "get_rh_client", lambda: fake)
+    client = app_module.app.test_client()
+
+    response = client.post("/pose_correction", data={"image": (io.BytesIO(b"fake image"), "pose.png")},
+                           content_type="multipart/form-data")
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+    wait_for_status(client, job_id, ("waiting",))
+    assert fake.webhook_urls[0].endswith(f"token={WEBHOOK_SECRET}")
+
+    response = client.post(f"/runninghub/webhook?token={WEBHOOK_SECRET}", json={
+        "event": "TASK_END",
+        "taskId": "task-failed-1",
+        "eventData": '{"code": 805, "msg": "APIKEY_TASK_STATUS_ERROR", "data": null}',
+    })
+    assert response.status_code == 200
+    assert response.get_json() == {"status": "ok", "matched": True}
+
+    data = wait_for_status(client, job_id, ("succeeded", "failed"))
+    assert data["status"] == "failed"
+    assert "未成功完成" in data["error"]
+
+
+def test_webhook_rejects_invalid_token():
+    client = app_module.app.test_client()
+    response = client.post("/runninghub/webhook?token=wrong", json={"event": "TASK_END", "taskId": "x"})
+    assert response.status_code == 403
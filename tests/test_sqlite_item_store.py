@@ -0,0 +1,120 @@
+"""
+SQLiteItemStore：寫入 / 列表 / 刪除、同 timestamp 的游標分頁、分類篩選、增量同步的 tombstone 與版本號
+"""
+
+import datetime
+
+import pytest
+
+from backend.model.store import SQLiteItemStore
+
+COLLECTION = "wardrobe"
+USER = "u1"
+START = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class FakeClock:
+    def __init__(self, now=START):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += datetime.timedelta(seconds=seconds)
+
+
+def item(item_id, category="top"):
+    return item_id, {"filename": f"{item_id}.png", "category": category, "tags": "",
+                     "derivatives": {"thumb": f"{item_id}_t.webp"}}
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    return SQLiteItemStore(str(tmp_path / "metadata.sqlite"), clock=clock)
+
+
+def ids(items):
+    return [item_id for item_id, _ in items]
+
+
+def test_put_list_delete_round_trip(store, clock):
+    store.put_items(COLLECTION, USER, [item("a")])
+    clock.advance(1)
+    store.put_items(COLLECTION, USER, [item("b", "bottom")])
+
+    listed = store.list_items(COLLECTION, USER)
+    assert ids(listed) == ["b", "a"]
+    data = dict(listed)["a"]
+    assert data["filename"] == "a.png"
+    assert data["category"] == "top"
+    assert data["derivatives"] == {"thumb": "a_t.webp"}
+    assert data["timestamp"] == START
+    # 其他使用者、其他 collection 互不影響
+    assert store.list_items(COLLECTION, "u2") == []
+    assert store.list_items("wannabe_wardrobe", USER) == []
+
+    assert store.delete_items(COLLECTION, USER, listed[:1]) == [None]
+    assert ids(store.list_items(COLLECTION, USER)) == ["a"]
+    assert store.get_items(COLLECTION, USER, ["a", "b"]).keys() == {"a"}
+
+
+def test_cursor_pagination_across_equal_timestamps(store, clock):
+    # 同一次寫入的項目共用 timestamp，游標要靠 id 分出先後
+    store.put_items(COLLECTION, USER, [item(f"item{i}") for i in range(5)])
+    clock.advance(1)
+    store.put_items(COLLECTION, USER, [item("newest")])
+
+    pages, after = [], None
+    while True:
+        page = store.list_items(COLLECTION, USER, limit=2, after=after)
+        if not page:
+            break
+        pages.append(ids(page))
+        last_id, last_data = page[-1]
+        after = (last_data["timestamp"], last_id)
+
+    assert pages == [["newest", "item4"], ["item3", "item2"], ["item1", "item0"]]
+
+
+def test_category_filter(store, clock):
+    store.put_items(COLLECTION, USER, [item("t1"), item("b1", "bottom"), item("t2")])
+
+    assert ids(store.list_items(COLLECTION, USER, category="top")) == ["t2", "t1"]
+    assert ids(store.list_items(COLLECTION, USER, category="bottom")) == ["b1"]
+    assert store.list_items(COLLECTION, USER, category="shoes") == []
+
+    since = START - datetime.timedelta(seconds=1)
+    assert ids(store.changed_since(COLLECTION, USER, since, category="bottom")) == ["b1"]
+
+
+def test_delta_query_returns_tombstones(store, clock):
+    store.put_items(COLLECTION, USER, [item("keep"), item("gone"), item("gone_bottom", "bottom")])
+    clock.advance(10)
+    since = clock()
+    clock.advance(10)
+
+    store.delete_items(COLLECTION, USER, [item("gone"), item("gone_bottom", "bottom")], tombstone_days=30)
+
+    assert store.changed_since(COLLECTION, USER, since) == []
+    assert sorted(store.deleted_since(COLLECTION, USER, since)) == ["gone", "gone_bottom"]
+    assert store.deleted_since(COLLECTION, USER, since, category="bottom") == ["gone_bottom"]
+    # 刪除之後才同步過的客戶端不會再收到
+    assert store.deleted_since(COLLECTION, USER, clock()) == []
+    # 沒有指定 tombstone_days 的刪除不留紀錄
+    store.delete_items(COLLECTION, USER, [item("keep")])
+    assert "keep" not in store.deleted_since(COLLECTION, USER, since)
+
+
+def test_version_increments(store):
+    assert store.get_version(COLLECTION, USER) == 0
+    store.bump_version(COLLECTION, USER)
+    store.bump_version(COLLECTION, USER)
+    assert store.get_version(COLLECTION, USER) == 2
+    assert store.get_version(COLLECTION, "u2") == 0
+    assert store.get_version("wannabe_wardrobe", USER) == 0